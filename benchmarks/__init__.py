@@ -0,0 +1 @@
+"""Offline benchmarks of the Bicopack app (``python -m benchmarks.run``)."""
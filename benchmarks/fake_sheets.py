@@ -0,0 +1,244 @@
+import time
+import threading
+
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Google Sheets en memoria para los benchmarks
+#
+# Offline stand-in for the gspread objects used by ``SheetsBackend``: a
+# client whose ``open_by_key`` returns spreadsheets of in-memory worksheets.
+# Cells are kept as the strings the Sheets API returns, so the backend
+# parses exactly what it would parse in production. Every API call is
+# counted, and ``latency`` adds a fixed delay per call to mimic the network.
+#
+# Worksheet methods: ``get``, ``get_all_values``, ``get_all_records``,
+# ``col_values``, ``acell``, ``append_row``, ``append_rows``,
+# ``delete_rows`` and ``update_cell``. Spreadsheet methods: ``worksheet``,
+# ``values_batch_get`` and ``batch_update`` (``appendCells`` and
+# ``deleteDimension``, as sent by ``close_production``, and ``updateCells``
+# and ``appendDimension``, as sent by ``upsert_maquinas``). Like a real
+# sheet, a worksheet has ``col_count`` columns (26 by default) and cells
+# beyond them are rejected.
+# -----------------------------------------------------------------------------
+
+
+def cell_text(value) -> str:
+    """Render a written value the way Sheets returns it (RAW input)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _cell_value(cell: dict):
+    """Value of a ``CellData`` sent with ``batch_update`` ("" when empty)."""
+    return next(iter(cell.get("userEnteredValue", {"": ""}).values()))
+
+
+class Cell:
+    def __init__(self, value):
+        self.value = value
+
+
+class CallCounter:
+    """API calls made against one fake client, by method name."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def hit(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+
+
+class FakeWorksheet:
+    """One sheet: a header row plus data rows, all as strings."""
+
+    def __init__(self, title: str, values: list[list], sheet_id: int, counter: CallCounter):
+        self.title = title
+        self.id = sheet_id
+        self._values = [list(r) for r in values]
+        self.col_count = max([26] + [len(r) for r in self._values])
+        self._counter = counter
+        self._lock = threading.RLock()
+
+    # -- reads ----------------------------------------------------------------
+
+    def _range(self, range_name: str = None, pad_values: bool = False) -> list[list]:
+        with self._lock:
+            if range_name is None:
+                rows = self._values
+                first_col, last_col = 0, None
+            else:
+                grid = a1_range_to_grid_range(range_name)
+                rows = self._values[grid.get("startRowIndex", 0): grid.get("endRowIndex")]
+                first_col = grid.get("startColumnIndex", 0)
+                last_col = grid.get("endColumnIndex")
+            width = max((len(r) for r in self._values), default=0)
+            if last_col is None:
+                last_col = width
+            out = []
+            for row in rows:
+                row = row[first_col:last_col]
+                if pad_values:
+                    row = row + [""] * (last_col - first_col - len(row))
+                out.append(list(row))
+            # Como la API, sin filas vacías al final
+            while out and not any(str(c) for c in out[-1]):
+                out.pop()
+            return out
+
+    def get(self, range_name: str = None, pad_values: bool = False, **kwargs):
+        self._counter.hit("get")
+        return self._range(range_name, pad_values)
+
+    def get_all_values(self, **kwargs):
+        self._counter.hit("get_all_values")
+        return self._range()
+
+    def get_all_records(self, **kwargs):
+        self._counter.hit("get_all_records")
+        values = self._range(pad_values=True)
+        if not values:
+            return []
+        header = values[0]
+        return [dict(zip(header, row)) for row in values[1:]]
+
+    def col_values(self, col: int, **kwargs):
+        self._counter.hit("col_values")
+        with self._lock:
+            return [r[col - 1] if len(r) >= col else "" for r in self._values]
+
+    def acell(self, label: str, **kwargs):
+        self._counter.hit("acell")
+        rows = self._range(label)
+        return Cell(rows[0][0] if rows and rows[0] else "")
+
+    # -- writes ---------------------------------------------------------------
+
+    def _append(self, rows: list[list]) -> dict:
+        with self._lock:
+            first = len(self._values) + 1
+            self._values.extend([cell_text(v) for v in row] for row in rows)
+            last = len(self._values)
+        width = max((len(r) for r in rows), default=1)
+        return {
+            "updates": {
+                "updatedRange": f"{self.title}!A{first}:{rowcol_to_a1(last, width)}",
+                "updatedRows": len(rows),
+            }
+        }
+
+    def append_row(self, values: list, **kwargs):
+        self._counter.hit("append_row")
+        return self._append([values])
+
+    def append_rows(self, values: list[list], **kwargs):
+        self._counter.hit("append_rows")
+        return self._append(values)
+
+    def delete_rows(self, start_index: int, end_index: int = None):
+        self._counter.hit("delete_rows")
+        self._delete(start_index, end_index if end_index is not None else start_index)
+
+    def _delete(self, start_index: int, end_index: int):
+        with self._lock:
+            del self._values[start_index - 1: end_index]
+
+    def update_cell(self, row: int, col: int, value):
+        self._counter.hit("update_cell")
+        self._set_cell(row, col, value)
+
+    def _set_cell(self, row: int, col: int, value):
+        if col > self.col_count:
+            raise ValueError(f"La columna {col} queda fuera de la hoja {self.title} ({self.col_count} columnas)")
+        with self._lock:
+            while len(self._values) < row:
+                self._values.append([])
+            cells = self._values[row - 1]
+            cells.extend([""] * (col - len(cells)))
+            cells[col - 1] = cell_text(value)
+
+
+class FakeSpreadsheet:
+    def __init__(self, key: str, sheets: dict, counter: CallCounter):
+        self.id = key
+        self._counter = counter
+        self._worksheets = {
+            title: FakeWorksheet(title, values, i, counter)
+            for i, (title, values) in enumerate(sheets.items())
+        }
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self._counter.hit("worksheet")
+        return self._worksheets[title]
+
+    def worksheets(self) -> list[FakeWorksheet]:
+        return list(self._worksheets.values())
+
+    def values_batch_get(self, ranges: list[str], params=None):
+        self._counter.hit("values_batch_get")
+        value_ranges = []
+        for rng in ranges:
+            title, _, a1 = rng.partition("!")
+            ws = self._worksheets[title.strip("'")]
+            value_ranges.append({"range": rng, "values": ws._range(a1 or None)})
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+    def batch_update(self, body: dict):
+        self._counter.hit("batch_update")
+        by_id = {ws.id: ws for ws in self._worksheets.values()}
+        for request in body.get("requests", []):
+            if "appendCells" in request:
+                spec = request["appendCells"]
+                rows = [[_cell_value(cell) for cell in row["values"]] for row in spec["rows"]]
+                by_id[spec["sheetId"]]._append(rows)
+            elif "updateCells" in request:
+                spec = request["updateCells"]
+                grid = spec["range"]
+                for i, row in enumerate(spec["rows"]):
+                    for j, cell in enumerate(row["values"]):
+                        by_id[grid["sheetId"]]._set_cell(
+                            grid["startRowIndex"] + i + 1, grid["startColumnIndex"] + j + 1, _cell_value(cell)
+                        )
+            elif "appendDimension" in request:
+                spec = request["appendDimension"]
+                if spec["dimension"] == "COLUMNS":
+                    by_id[spec["sheetId"]].col_count += spec["length"]
+            elif "deleteDimension" in request:
+                spec = request["deleteDimension"]["range"]
+                by_id[spec["sheetId"]]._delete(spec["startIndex"] + 1, spec["endIndex"])
+            else:
+                raise NotImplementedError(f"Petición no soportada: {list(request)}")
+        return {"replies": []}
+
+
+class FakeClient:
+    """``gspread.Client`` stand-in holding spreadsheets keyed by id."""
+
+    def __init__(self, spreadsheets: dict, latency: float = 0.0):
+        self.counter = CallCounter(latency)
+        self._spreadsheets = {
+            key: FakeSpreadsheet(key, sheets, self.counter) for key, sheets in spreadsheets.items()
+        }
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.counter.hit("open_by_key")
+        return self._spreadsheets[key]
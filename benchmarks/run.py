@@ -0,0 +1,295 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import datetime
+
+import pandas as pd
+
+from bicopack import storage
+from bicopack.cache import TableCache
+from bicopack.core import (
+    SHEET_PRODUCCION,
+    SHEET_EVENTOS,
+    SHEET_MAQUINAS,
+    MAIN_SHEETS,
+)
+from bicopack.dates import combine_fecha_hora, filter_last_hours_events, span_minutes
+from bicopack.kpis import paradas_rollup, produccion_rollup
+from bicopack.machine_state import MachineStateIndex
+from bicopack.schema import apply_schema
+from bicopack.storage import SheetsBackend, records_frame
+
+from benchmarks.fake_sheets import FakeClient
+from benchmarks.synthetic import parse_size, plant
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Benchmarks de escalado
+#
+# Times the app against a synthetic plant held by the in-memory Sheets of
+# ``benchmarks.fake_sheets``, without network:
+#   • helpers: parsing, typing, the vectorised date helpers, the machine
+#     state index, the KPI rollups and the storage backend (full and
+#     incremental loads);
+#   • pages: a full run of every page under ``pages/`` through Streamlit's
+#     ``AppTest``, cold (caches cleared, tables loaded from the fake
+#     spreadsheet) and warm (cached tables), with the API calls of each.
+#
+#     python -m benchmarks.run --sizes 1k,100k --save benchmarks/baselines/mine.json
+#     python -m benchmarks.run --sizes 1k,100k --compare benchmarks/baselines/mine.json
+#
+# Results are stored as JSON; ``--compare`` prints the ratio of every time
+# against a baseline and exits with status 1 when one is slower than
+# ``--threshold`` times the baseline. Each helper time is the best of
+# ``--repeat`` runs.
+# -----------------------------------------------------------------------------
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "bicopack_app_v4_2.py")
+
+SHEET_ID = "benchmark"
+SHEET_ID_MAQUINAS = "benchmark-maquinas"
+
+
+def fake_client(sheets: dict, latency: float = 0.0) -> FakeClient:
+    """Fake client holding ``sheets`` split into the two spreadsheets of the app."""
+    return FakeClient(
+        {
+            SHEET_ID: {t: sheets[t] for t in MAIN_SHEETS},
+            SHEET_ID_MAQUINAS: {SHEET_MAQUINAS: sheets[SHEET_MAQUINAS]},
+        },
+        latency=latency,
+    )
+
+
+def best_time(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# -----------------------------------------------------------------------------
+# Helpers
+# -----------------------------------------------------------------------------
+
+def helper_cases(sheets: dict, latency: float) -> dict:
+    """Name -> callable for every helper benchmark on ``sheets``."""
+    raw = {t: records_frame(v[0], v[1:]) for t, v in sheets.items()}
+    typed = {t: apply_schema(t, df) for t, df in raw.items()}
+    produccion, eventos = typed[SHEET_PRODUCCION], typed[SHEET_EVENTOS]
+    new_row = list(sheets[SHEET_PRODUCCION][-1])
+
+    def backend():
+        return SheetsBackend(
+            client=fake_client(sheets, latency), sheet_id=SHEET_ID, sheet_id_maquinas=SHEET_ID_MAQUINAS
+        )
+
+    def load_all():
+        backend().get_many(list(sheets))
+
+    warm = backend()
+    warm.get_many(list(sheets))
+
+    def tail_sync():
+        warm.append_row(SHEET_PRODUCCION, new_row)
+        warm.get_many([SHEET_PRODUCCION, SHEET_EVENTOS])
+
+    cache = TableCache(warm)
+    cache.get(SHEET_PRODUCCION)
+
+    return {
+        "records_frame[PRODUCCION]": lambda: records_frame(
+            sheets[SHEET_PRODUCCION][0], sheets[SHEET_PRODUCCION][1:]
+        ),
+        "apply_schema[PRODUCCION]": lambda: apply_schema(SHEET_PRODUCCION, raw[SHEET_PRODUCCION]),
+        "apply_schema[EVENTOS]": lambda: apply_schema(SHEET_EVENTOS, raw[SHEET_EVENTOS]),
+        "filter_last_hours_events": lambda: filter_last_hours_events(eventos, hours=24),
+        "combine_fecha_hora[PRODUCCION fin]": lambda: combine_fecha_hora(
+            produccion["fecha_fin"], produccion["hora_fin"]
+        ),
+        "span_minutes[EVENTOS]": lambda: span_minutes(
+            eventos["fecha"], eventos["hora_inicio"], eventos["hora_fin"]
+        ),
+        "MachineStateIndex.build": lambda: MachineStateIndex().build(typed),
+        "produccion_rollup": lambda: produccion_rollup(produccion),
+        "paradas_rollup": lambda: paradas_rollup(eventos),
+        "SheetsBackend.get_many[cold]": load_all,
+        "SheetsBackend.get_many[tail]": tail_sync,
+        "TableCache.apply_append[PRODUCCION]": lambda: cache.apply_append(SHEET_PRODUCCION, new_row),
+    }
+
+
+def run_helpers(sheets: dict, repeat: int, latency: float) -> dict:
+    results = {}
+    for name, func in helper_cases(sheets, latency).items():
+        results[name] = best_time(func, repeat)
+        print(f"  {name:<40} {results[name] * 1000:10.1f} ms", flush=True)
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Pages
+# -----------------------------------------------------------------------------
+
+def page_paths() -> list[str]:
+    return sorted(
+        os.path.relpath(p, ROOT) for p in glob.glob(os.path.join(ROOT, "pages", "*.py"))
+    )
+
+
+def run_pages(sheets: dict, repeat: int, latency: float) -> dict:
+    """
+    Run every page through ``AppTest`` with the storage backend reading
+    the fake spreadsheets. Each page gets fresh caches (and a fresh KPI
+    store) for its cold run, then ``repeat`` warm reruns.
+    """
+    client = fake_client(sheets, latency)
+    workdir = tempfile.mkdtemp(prefix="bicopack-bench-")
+    os.environ.update({
+        "BICOPACK_STORAGE": "sheets",
+        "GOOGLE_SHEET_ID": SHEET_ID,
+        "GOOGLE_SHEET_ID_MAQUINAS": SHEET_ID_MAQUINAS,
+        "BICOPACK_OUTBOX": "0",
+        "BICOPACK_SHARED_CACHE": "",
+        "BICOPACK_ARCHIVE_DIR": os.path.join(workdir, "archivo"),
+    })
+    # The pages build their backend from the environment: hand them the fake
+    storage.sheets_client_from_env = lambda: client
+
+    # Sin los avisos de Streamlit en cada página (modo "bare", deprecaciones)
+    logging.disable(logging.WARNING)
+    try:
+        return _run_pages(client, workdir, repeat)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _run_pages(client, workdir: str, repeat: int) -> dict:
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    for i, page in enumerate(page_paths()):
+        name = os.path.splitext(os.path.basename(page))[0]
+        os.environ["BICOPACK_KPI_PATH"] = os.path.join(workdir, f"kpis-{i}.db")
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        at = AppTest.from_file(APP, default_timeout=3600)
+        at.switch_page(page)
+        client.counter.reset()
+        start = time.perf_counter()
+        at.run()
+        cold = time.perf_counter() - start
+        cold_calls = client.counter.total()
+        errors = [str(e.value) for e in at.exception]
+        client.counter.reset()
+        warm = best_time(at.run, repeat)
+        results[name] = {
+            "cold": cold,
+            "warm": warm,
+            "api_calls_cold": cold_calls,
+            "api_calls_warm": client.counter.total() // max(repeat, 1),
+        }
+        if errors:
+            results[name]["errors"] = errors
+        print(
+            f"  {name:<40} cold {cold * 1000:10.1f} ms ({cold_calls} llamadas)"
+            f"   warm {warm * 1000:10.1f} ms" + ("   ERROR" if errors else ""),
+            flush=True,
+        )
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Baselines
+# -----------------------------------------------------------------------------
+
+def _times(report: dict) -> dict:
+    """Flatten the times of a report: ``(size, kind, name) -> seconds``."""
+    times = {}
+    for size, result in report["results"].items():
+        for name, seconds in result.get("helpers", {}).items():
+            times[(size, "helpers", name)] = seconds
+        for name, page in result.get("pages", {}).items():
+            times[(size, "pages", f"{name}.cold")] = page["cold"]
+            times[(size, "pages", f"{name}.warm")] = page["warm"]
+    return times
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Print the ratio of each time to the baseline; return the regressions."""
+    current, base = _times(report), _times(baseline)
+    regressions = []
+    print(f"\n{'tamaño':<6} {'prueba':<52} {'base ms':>10} {'ahora ms':>10} {'ratio':>7}")
+    for key in sorted(set(current) & set(base)):
+        ratio = current[key] / base[key] if base[key] > 0 else float("inf")
+        flag = "  <-- más lento" if ratio > threshold else ""
+        if flag:
+            regressions.append((key, ratio))
+        size, kind, name = key
+        print(
+            f"{size:<6} {kind + '.' + name:<52} {base[key] * 1000:10.1f} "
+            f"{current[key] * 1000:10.1f} {ratio:7.2f}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de Bicopack con una planta sintética")
+    parser.add_argument("--sizes", default="1k,100k", help="filas de histórico: 1k, 100k, 1M o un número")
+    parser.add_argument("--only", choices=["helpers", "pages"], help="ejecutar solo una parte")
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones de cada medida")
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos añadidos a cada llamada a la API")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="guardar los resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de referencia con el que comparar")
+    parser.add_argument("--threshold", type=float, default=1.5, help="ratio a partir del cual se avisa")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "latency": args.latency,
+        },
+        "results": {},
+    }
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        print(f"== {size} filas ({parse_size(size)}) ==", flush=True)
+        sheets = plant(size, seed=args.seed)
+        result = {}
+        if args.only in (None, "helpers"):
+            result["helpers"] = run_helpers(sheets, args.repeat, args.latency)
+        if args.only in (None, "pages"):
+            result["pages"] = run_pages(sheets, args.repeat, args.latency)
+        report["results"][size] = result
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} medidas más de {args.threshold}x más lentas que la referencia")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
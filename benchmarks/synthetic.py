@@ -0,0 +1,172 @@
+import math
+import uuid
+import datetime
+
+import numpy as np
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_PRODUCCION,
+    SHEET_EVENTOS,
+    SHEET_PLANAS_TURNO,
+    SHEET_MAQUINAS,
+    MAX_MAQUINA,
+    TABLE_COLUMNS,
+    TIPOS_EVENTO,
+    TIPOS_PRODUCCION,
+    current_date_madrid,
+)
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Planta sintética
+#
+# Generates the sheets of a plant with ``rows`` rows of history in
+# PRODUCCION and EVENTOS, as the string cells returned by the Sheets API.
+# The history ends today and is as long as a plant of ``MAX_MAQUINA``
+# machines needs to fill it (about 250 runs a day), sorted by date like a
+# real append-only sheet, so the 24-hour panels find a realistic amount of
+# recent rows. EN_CURSO holds the open runs of today, MAQUINAS one row per
+# machine and PLANAS_TURNO one row per 50 of history. Values are drawn
+# from small pools (dates, times, lots, operators), so even a million rows
+# share most of their string objects.
+# -----------------------------------------------------------------------------
+
+RUNS_PER_DAY = 250
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+
+OPERARIOS = [f"Operario {i}" for i in range(1, 41)]
+HORAS = [f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)]
+
+
+def parse_size(size) -> int:
+    """Row count for a size name ("1k", "100k", "1M") or a number."""
+    if isinstance(size, int):
+        return size
+    if size in SIZES:
+        return SIZES[size]
+    return int(float(size))
+
+
+def _pool(rng, values, n):
+    values = np.array(values, dtype=object)
+    return values[rng.integers(0, len(values), n)]
+
+
+def _turnos(minutes: np.ndarray) -> np.ndarray:
+    turnos = np.full(len(minutes), "3", dtype=object)
+    turnos[(minutes >= 6 * 60) & (minutes < 14 * 60)] = "1"
+    turnos[(minutes >= 14 * 60) & (minutes < 22 * 60)] = "2"
+    return turnos
+
+
+def _history(rng, n: int, today: datetime.date):
+    """Sorted day offsets (days before today) and start minutes of ``n`` rows."""
+    span = max(7, math.ceil(n / RUNS_PER_DAY))
+    fechas = [(today - datetime.timedelta(days=d)).isoformat() for d in range(span)]
+    position = np.sort(rng.random(n)) * span
+    days_ago = (span - 1 - np.floor(position)).astype(int).clip(0, span - 1)
+    start = ((position % 1) * 24 * 60).astype(int)
+    return np.array(fechas, dtype=object), days_ago, start
+
+
+def _table(columns: list[str], data: dict, n: int) -> list[list]:
+    out = np.empty((n, len(columns)), dtype=object)
+    for i, col in enumerate(columns):
+        out[:, i] = data.get(col, "")
+    return [list(columns)] + out.tolist()
+
+
+def produccion_rows(rng, n: int, today: datetime.date) -> list[list]:
+    fechas, days_ago, start = _history(rng, n, today)
+    duration = rng.integers(30, 240, n)
+    end = start + duration
+    end_days_ago = (days_ago - end // (24 * 60)).clip(0)
+    peso = np.array([f"{p / 10:.1f}" for p in range(500, 5000)], dtype=object)
+    return _table(TABLE_COLUMNS[SHEET_PRODUCCION], {
+        "fecha_inicio": fechas[days_ago],
+        "fecha_fin": fechas[end_days_ago],
+        "turno": _turnos(start),
+        "maquina": _pool(rng, [str(m) for m in range(1, MAX_MAQUINA + 1)], n),
+        "tipo_produccion": _pool(rng, TIPOS_PRODUCCION, n),
+        "lote_mp": _pool(rng, [f"MP-{i}" for i in range(500)], n),
+        "lote_of": _pool(rng, [f"024-{i}" for i in range(2000)], n),
+        "hora_inicio": np.array(HORAS, dtype=object)[start],
+        "operario_inicio": _pool(rng, OPERARIOS, n),
+        "hora_fin": np.array(HORAS, dtype=object)[end % (24 * 60)],
+        "operario_fin": _pool(rng, OPERARIOS, n),
+        "peso": peso[rng.integers(0, len(peso), n)],
+        "taras": _pool(rng, ["0", "1", "2", "3"], n),
+        "observaciones": _pool(rng, [""] * 9 + ["Revisar bobina"], n),
+    }, n)
+
+
+def eventos_rows(rng, n: int, today: datetime.date) -> list[list]:
+    fechas, days_ago, start = _history(rng, n, today)
+    minutos = rng.integers(5, 90, n)
+    end = (start + minutos) % (24 * 60)
+    return _table(TABLE_COLUMNS[SHEET_EVENTOS], {
+        "fecha": fechas[days_ago],
+        "turno": _turnos(start),
+        "maquina": _pool(rng, [str(m) for m in range(1, MAX_MAQUINA + 1)], n),
+        "lote_of": _pool(rng, [f"024-{i}" for i in range(2000)], n),
+        "tipo": _pool(rng, TIPOS_EVENTO, n),
+        "hora_inicio": np.array(HORAS, dtype=object)[start],
+        "hora_fin": np.array(HORAS, dtype=object)[end],
+        "minutos": np.array([str(m) for m in range(100)], dtype=object)[minutos],
+        "operario": _pool(rng, OPERARIOS, n),
+        "descripcion": _pool(rng, ["", "Rotura de hilo", "Atasco", "Cambio de bobina"], n),
+    }, n)
+
+
+def planas_rows(rng, n: int, today: datetime.date) -> list[list]:
+    fechas, days_ago, start = _history(rng, n, today)
+    return _table(TABLE_COLUMNS[SHEET_PLANAS_TURNO], {
+        "fecha": fechas[days_ago],
+        "turno": _turnos(start),
+        "lotes": _pool(rng, [f"MP-{i}" for i in range(500)], n),
+        "ordenes_trabajo": _pool(rng, [f"024-{i}" for i in range(2000)], n),
+        "operario_1": _pool(rng, OPERARIOS, n),
+        "cantidad_reprocesadas": _pool(rng, [str(i) for i in range(1, 60)], n),
+    }, n)
+
+
+def en_curso_rows(rng, today: datetime.date) -> list[list]:
+    maquinas = [m for m in range(1, MAX_MAQUINA + 1) if rng.random() < 0.7]
+    n = len(maquinas)
+    start = rng.integers(0, 24 * 60, n)
+    return _table(TABLE_COLUMNS[SHEET_EN_CURSO], {
+        "bobina_id": np.array([str(uuid.UUID(int=int(rng.integers(0, 2**63)))) for _ in range(n)], dtype=object),
+        "fecha": today.isoformat(),
+        "turno": _turnos(start),
+        "maquina": np.array([str(m) for m in maquinas], dtype=object),
+        "tipo_produccion": _pool(rng, TIPOS_PRODUCCION, n),
+        "lote_mp": _pool(rng, [f"MP-{i}" for i in range(500)], n),
+        "lote_of": _pool(rng, [f"024-{i}" for i in range(2000)], n),
+        "hora_inicio": np.array(HORAS, dtype=object)[start],
+        "operario_inicio": _pool(rng, OPERARIOS, n),
+    }, n)
+
+
+def maquinas_rows(rng) -> list[list]:
+    n = MAX_MAQUINA
+    return _table(TABLE_COLUMNS[SHEET_MAQUINAS], {
+        "maquina": np.array([str(m) for m in range(1, n + 1)], dtype=object),
+        "tipo_produccion": _pool(rng, TIPOS_PRODUCCION, n),
+        "lote_of": _pool(rng, [f"024-{i}" for i in range(2000)], n),
+        "lote_mp": _pool(rng, [f"MP-{i}" for i in range(500)], n),
+    }, n)
+
+
+def plant(rows, seed: int = 0, today: datetime.date = None) -> dict[str, list[list]]:
+    """Every sheet of a synthetic plant with ``rows`` rows of history."""
+    rows = parse_size(rows)
+    rng = np.random.default_rng(seed)
+    today = today or current_date_madrid()
+    return {
+        SHEET_EN_CURSO: en_curso_rows(rng, today),
+        SHEET_PRODUCCION: produccion_rows(rng, rows, today),
+        SHEET_EVENTOS: eventos_rows(rng, rows, today),
+        SHEET_PLANAS_TURNO: planas_rows(rng, max(1, rows // 50), today),
+        SHEET_MAQUINAS: maquinas_rows(rng),
+    }
@@ -0,0 +1 @@
+"""Shared building blocks for the Bicopack production register app."""
@@ -0,0 +1,464 @@
+import os
+import json
+import logging
+import argparse
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bicopack import metrics
+from bicopack.cache import TableCache, ttl_from_env
+from bicopack.changes import change_hub_from_env
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_EVENTOS,
+    SHEET_MAQUINAS,
+    SHEET_PLANAS_TURNO,
+    SHEET_PRODUCCION,
+    BobinaNotFoundError,
+    MachineOccupiedError,
+    clean_row,
+    current_date_madrid,
+    current_time_madrid_str,
+    safe_int,
+)
+from bicopack.kpis import kpi_store_from_env
+from bicopack.machine_state import MachineStateIndex
+from bicopack.records import MachineBusyError, RecordError, close_row, event_row, plana_row, start_row
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – API de ingesta
+#
+# HTTP/JSON service for barcode stations and machine controllers, run next
+# to the Streamlit app:
+#
+#     python -m bicopack.api                     # storage from the environment
+#     python -m bicopack.api --local prueba.db   # local SQLite stand-in
+#
+# Records are validated by ``bicopack.records`` (the same rules as the
+# forms) and written with the storage backend of the app, without a
+# Streamlit rerun per record:
+#   POST /inicios   start: fecha, turno, maquina, tipo_produccion, lote_mp,
+#                   lote_of, hora_inicio, operario, observaciones and an
+#                   optional bobina_id (a start whose bobina_id is already
+#                   open is reported as a duplicate, so retries are safe);
+#   POST /cierres   close: bobina_id or maquina, hora_fin, operario, peso,
+#                   taras, observaciones;
+#   POST /eventos   event: fecha, tipo, maquina, hora_inicio, hora_fin,
+#                   operario, descripcion, carga_filetas;
+#   POST /planas    flat bobbins: fecha, turno, lotes, ordenes_trabajo,
+#                   operarios (list), cantidad_reprocesadas;
+#   GET  /salud     health check.
+# ``fecha`` defaults to the current date in Madrid, and so do the start
+# time of /inicios and the end time of /cierres to the current time, so a
+# device may send only what it scans; events must send both times (but a
+# load of filetas, which has none). A body holding one object is answered
+# with 201, 409 (machine busy or run already closed), 422 (invalid) or 503
+# (storage error, also when the tables the checks need cannot be read); a
+# list is answered with 200 and one result per record. Each start is written with
+# ``StorageBackend.start_production``, which checks the machine against
+# the stored EN_CURSO right before the write; the valid events and flat
+# bobbin records of a list are written with a single ``append_rows``.
+# With ``BICOPACK_CHANGES_PATH`` the service tells the app which tables it
+# wrote, so the live panels refresh, and drops from its own cache the
+# tables written by the app (``bicopack.changes``).
+#
+# Environment variables used (plus those of the storage backend):
+#   BICOPACK_API_HOST          Listening address (default: 127.0.0.1).
+#   BICOPACK_API_PORT          Listening port (default: 8502).
+#   BICOPACK_API_TOKEN         If set, requests must send
+#                              ``Authorization: Bearer <token>``.
+#   BICOPACK_API_MAX_RECORDS   Records per request (default: 500).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+DEFAULT_MAX_RECORDS = 500
+
+# Path -> ``IngestService`` method
+ROUTES = {"/inicios": "start", "/cierres": "close", "/eventos": "events", "/planas": "planas"}
+
+
+def _fecha(record: dict):
+    return record.get("fecha") or current_date_madrid()
+
+
+def _hora(record: dict, field: str):
+    return record.get(field) or current_time_madrid_str()
+
+
+def _unavailable(error: Exception) -> dict:
+    return {"ok": False, "status": HTTPStatus.SERVICE_UNAVAILABLE, "error": str(error)}
+
+
+class IngestService:
+    """
+    Validates and writes the records received by the API. Writes are
+    serialised in the process. The cached tables only pre-check the
+    records: starts and closes are confirmed by the storage backend
+    against the stored rows, so the forms can write at the same time.
+    """
+
+    def __init__(self, backend, kpis=None, changes=None):
+        self.backend = backend
+        self.kpis = kpis
+        self.cache = TableCache(backend, ttl=ttl_from_env())
+        self.states = MachineStateIndex()
+        self._lock = threading.Lock()
+        self.changes = changes
+        if changes is not None:
+            changes.on_remote(lambda tables: [self.cache.invalidate(table) for table in tables])
+
+    def _states(self) -> MachineStateIndex:
+        # MAQUINAS for the registry: only registered machines are accepted
+        return self.states.sync(self.cache, (SHEET_EN_CURSO, SHEET_MAQUINAS))
+
+    def _notify(self, *tables):
+        if self.changes is None:
+            return
+        try:
+            self.changes.publish(tables)
+        except Exception:
+            logger.exception("No se pudo avisar del cambio de %s", ", ".join(tables))
+
+    def _fold_kpis(self, table: str, rows: list):
+        if self.kpis is None:
+            return
+        try:
+            self.kpis.add_rows(table, rows)
+        except Exception:
+            logger.exception("No se pudieron actualizar los indicadores de %s", table)
+
+    def _append(self, table: str, rows: list, results: list, pending: list):
+        """Write the rows of the valid records and fill in their results."""
+        if not rows:
+            return
+        try:
+            # Without the rows dropped as duplicates by the outbox
+            rows = self.backend.append_rows(table, rows)
+        except Exception as e:
+            logger.exception("No se pudieron guardar %s filas en %s", len(rows), table)
+            for i in pending:
+                results[i] = _unavailable(e)
+            return
+        if not rows:
+            return
+        for row in rows:
+            version = self.cache.apply_append(table, row)
+            self.states.apply_append(table, row, version)
+        self._fold_kpis(table, rows)
+        self._notify(table)
+
+    def _read_failed(self, records: list[dict], error: Exception) -> list[dict]:
+        """Results of ``records`` when the tables to check them could not be read."""
+        logger.exception("No se pudieron leer las tablas para validar %s registros", len(records))
+        return [_unavailable(error) for _ in records]
+
+    def start(self, records: list[dict]) -> list[dict]:
+        results = []
+        with self._lock:
+            try:
+                states = self._states()
+                open_ids = set(self.cache.get(SHEET_EN_CURSO)["bobina_id"].astype(str).str.strip())
+            except Exception as e:
+                return self._read_failed(records, e)
+            for record in records:
+                bobina_id = str(record.get("bobina_id") or "").strip()
+                if bobina_id and bobina_id in open_ids:
+                    results.append({"ok": True, "bobina_id": bobina_id, "duplicado": True})
+                    continue
+                maquina = safe_int(record.get("maquina"), -999)
+                try:
+                    row = clean_row(start_row(
+                        _fecha(record),
+                        record.get("turno"),
+                        record.get("maquina"),
+                        record.get("tipo_produccion"),
+                        record.get("lote_mp", ""),
+                        record.get("lote_of", ""),
+                        _hora(record, "hora_inicio"),
+                        record.get("operario", ""),
+                        record.get("observaciones", ""),
+                        open_run=states.get(maquina).open_run,
+                        bobina_id=bobina_id or None,
+                        registry=states.registry,
+                    ))
+                except MachineBusyError as e:
+                    results.append({
+                        "ok": False,
+                        "status": HTTPStatus.CONFLICT,
+                        "error": str(e),
+                        "bobina_id": str(e.open_run.get("bobina_id", "")),
+                    })
+                    continue
+                except RecordError as e:
+                    results.append({"ok": False, "status": HTTPStatus.UNPROCESSABLE_ENTITY, "error": str(e)})
+                    continue
+                results.append(self._start(row))
+                if results[-1]["ok"]:
+                    open_ids.add(row[0])
+        return results
+
+    def _start(self, row: list) -> dict:
+        """Write one start, confirmed against the stored EN_CURSO."""
+        try:
+            self.backend.start_production(row)
+        except MachineOccupiedError as e:
+            self.cache.invalidate(SHEET_EN_CURSO)
+            if e.bobina_id == row[0]:
+                # Reintento de un inicio que ya se guardó
+                return {"ok": True, "bobina_id": row[0], "duplicado": True}
+            return {"ok": False, "status": HTTPStatus.CONFLICT, "error": str(e), "bobina_id": e.bobina_id}
+        except Exception as e:
+            logger.exception("No se pudo guardar el inicio %s", row[0])
+            return _unavailable(e)
+        version = self.cache.apply_append(SHEET_EN_CURSO, row)
+        self.states.apply_append(SHEET_EN_CURSO, row, version)
+        self._notify(SHEET_EN_CURSO)
+        return {"ok": True, "bobina_id": row[0]}
+
+    def _open_run(self, record: dict, reload: bool = True):
+        bobina_id = str(record.get("bobina_id") or "").strip()
+        en_curso = self.cache.get(SHEET_EN_CURSO)
+        if bobina_id:
+            matches = en_curso[en_curso["bobina_id"].astype(str).str.strip() == bobina_id]
+        elif record.get("maquina") not in (None, ""):
+            matches = en_curso[en_curso["maquina_norm"] == safe_int(record.get("maquina"), -999)]
+        else:
+            raise RecordError("Indica la bobina_id o la máquina de la producción")
+        if matches.empty:
+            if reload:
+                # Puede haberse abierto desde otro puesto después de la última lectura
+                self.cache.invalidate(SHEET_EN_CURSO)
+                return self._open_run(record, reload=False)
+            return None
+        return matches.iloc[0]
+
+    def close(self, records: list[dict]) -> list[dict]:
+        results = []
+        with self._lock:
+            for record in records:
+                try:
+                    run = self._open_run(record)
+                    if run is None:
+                        results.append({
+                            "ok": False,
+                            "status": HTTPStatus.CONFLICT,
+                            "error": "No hay ninguna producción abierta que cerrar",
+                        })
+                        continue
+                    row = clean_row(close_row(
+                        run,
+                        _hora(record, "hora_fin"),
+                        record.get("operario", ""),
+                        record.get("peso", 0.0),
+                        record.get("taras", 0),
+                        record.get("observaciones", ""),
+                    ))
+                except RecordError as e:
+                    results.append({"ok": False, "status": HTTPStatus.UNPROCESSABLE_ENTITY, "error": str(e)})
+                    continue
+                except Exception as e:
+                    logger.exception("No se pudo leer EN_CURSO para cerrar una producción")
+                    results.append(_unavailable(e))
+                    continue
+                bobina_id = run["bobina_id"]
+                try:
+                    self.backend.close_production(bobina_id, row)
+                except BobinaNotFoundError as e:
+                    version = self.cache.apply_delete_bobina(bobina_id)
+                    self.states.apply_delete_bobina(bobina_id, version)
+                    results.append({"ok": False, "status": HTTPStatus.CONFLICT, "error": str(e)})
+                    continue
+                except Exception as e:
+                    logger.exception("No se pudo cerrar la producción %s", bobina_id)
+                    results.append(_unavailable(e))
+                    continue
+                self.cache.apply_append(SHEET_PRODUCCION, row)
+                version = self.cache.apply_delete_bobina(bobina_id)
+                self.states.apply_delete_bobina(bobina_id, version)
+                self._fold_kpis(SHEET_PRODUCCION, [row])
+                self._notify(SHEET_EN_CURSO, SHEET_PRODUCCION)
+                results.append({"ok": True, "bobina_id": str(bobina_id)})
+        return results
+
+    def _append_valid(self, table: str, records: list[dict], build) -> list[dict]:
+        results, rows, pending = [None] * len(records), [], []
+        with self._lock:
+            for i, record in enumerate(records):
+                try:
+                    rows.append(clean_row(build(record)))
+                except RecordError as e:
+                    results[i] = {"ok": False, "status": HTTPStatus.UNPROCESSABLE_ENTITY, "error": str(e)}
+                    continue
+                pending.append(i)
+                results[i] = {"ok": True}
+            self._append(table, rows, results, pending)
+        return results
+
+    def events(self, records: list[dict]) -> list[dict]:
+        try:
+            states = self._states()
+        except Exception as e:
+            return self._read_failed(records, e)
+
+        def build(record):
+            return event_row(
+                _fecha(record),
+                record.get("tipo"),
+                record.get("maquina"),
+                open_run=states.get(safe_int(record.get("maquina"), -999)).open_run,
+                descripcion=record.get("descripcion", ""),
+                operario=record.get("operario", ""),
+                hora_inicio=record.get("hora_inicio", ""),
+                hora_fin=record.get("hora_fin", ""),
+                carga_filetas=bool(record.get("carga_filetas", False)),
+                registry=states.registry,
+            )
+
+        return self._append_valid(SHEET_EVENTOS, records, build)
+
+    def planas(self, records: list[dict]) -> list[dict]:
+        def build(record):
+            return plana_row(
+                _fecha(record),
+                record.get("turno"),
+                record.get("lotes", ""),
+                record.get("ordenes_trabajo"),
+                record.get("operarios") or [],
+                record.get("cantidad_reprocesadas", 0),
+            )
+
+        return self._append_valid(SHEET_PLANAS_TURNO, records, build)
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    service = None
+    token = ""
+    max_records = DEFAULT_MAX_RECORDS
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self) -> bool:
+        if not self.token:
+            return True
+        if self.headers.get("Authorization", "") == f"Bearer {self.token}":
+            return True
+        self._send_json(HTTPStatus.UNAUTHORIZED, {"ok": False, "error": "Token no válido"})
+        return False
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/salud":
+            self._send_json(HTTPStatus.NOT_FOUND, {"ok": False, "error": "Ruta desconocida"})
+            return
+        self._send_json(HTTPStatus.OK, {"ok": True})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        method = ROUTES.get(path)
+        if method is None:
+            self._send_json(HTTPStatus.NOT_FOUND, {"ok": False, "error": "Ruta desconocida"})
+            return
+        if not self._authorized():
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"null")
+        except (ValueError, UnicodeDecodeError):
+            self._send_json(HTTPStatus.BAD_REQUEST, {"ok": False, "error": "El cuerpo debe ser JSON"})
+            return
+        single = isinstance(body, dict)
+        records = [body] if single else body
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            self._send_json(
+                HTTPStatus.BAD_REQUEST, {"ok": False, "error": "Envía un registro o una lista de registros"}
+            )
+            return
+        if len(records) > self.max_records:
+            self._send_json(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                {"ok": False, "error": f"Máximo {self.max_records} registros por petición"},
+            )
+            return
+        try:
+            with metrics.span(f"api:{path}"):
+                results = getattr(self.service, method)(records)
+        except Exception as e:
+            # Nunca cortar la conexión sin respuesta
+            logger.exception("Error atendiendo %s", path)
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"ok": False, "error": str(e)})
+            return
+        if single:
+            result = results[0]
+            status = result.pop("status", HTTPStatus.CREATED)
+            self._send_json(status, result)
+            return
+        for result in results:
+            result.pop("status", None)
+        self._send_json(
+            HTTPStatus.OK,
+            {"ok": all(r["ok"] for r in results), "guardados": sum(r["ok"] for r in results), "resultados": results},
+        )
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(service: IngestService, host: str, port: int, token: str = "", max_records: int = DEFAULT_MAX_RECORDS):
+    """HTTP server of ``service`` (call ``serve_forever`` to run it)."""
+    handler = type(
+        "IngestHandler",
+        (_IngestHandler,),
+        {"service": service, "token": token, "max_records": max_records},
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API de ingesta de registros de Bicopack")
+    parser.add_argument("--host", default=os.environ.get("BICOPACK_API_HOST", "").strip() or DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BICOPACK_API_PORT") or DEFAULT_PORT))
+    parser.add_argument(
+        "--local",
+        metavar="RUTA",
+        help="usar un fichero SQLite local en lugar del almacenamiento configurado (para pruebas)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    from bicopack.storage import SQLiteBackend, backend_from_env
+
+    backend = SQLiteBackend(args.local) if args.local else backend_from_env()
+    service = IngestService(
+        backend,
+        kpis=None if args.local else kpi_store_from_env(),
+        changes=None if args.local else change_hub_from_env().start(),
+    )
+    server = make_server(
+        service,
+        args.host,
+        args.port,
+        token=os.environ.get("BICOPACK_API_TOKEN", "").strip(),
+        max_records=int(os.environ.get("BICOPACK_API_MAX_RECORDS") or DEFAULT_MAX_RECORDS),
+    )
+    metrics.start_exporters_from_env()
+    logger.info("API de ingesta escuchando en http://%s:%s", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import os
+import glob
+import logging
+import argparse
+import threading
+
+import pandas as pd
+
+from bicopack.changes import record_changes
+from bicopack.core import SHEET_EVENTOS, SHEET_PRODUCCION, as_text
+from bicopack.dates import now_madrid
+from bicopack.schema import apply_schema, concat_typed, empty_table
+from bicopack.shared_cache import FileLock
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Archivo histórico
+#
+# PRODUCCION and EVENTOS only grow, but the panels look at the last day. The
+# archive job (``python -m bicopack.archive``) moves the rows older than a
+# window of days out of those sheets into one Parquet file per table and
+# month, so the hot sheets stay small and every read of them stays cheap:
+#
+#     <BICOPACK_ARCHIVE_DIR>/PRODUCCION/2026-01.parquet
+#     <BICOPACK_ARCHIVE_DIR>/EVENTOS/2026-01.parquet
+#
+# Cells are stored as the text found in the sheet, so archiving loses
+# nothing; they are typed with ``bicopack.schema`` when read, like the hot
+# tables. Only the oldest block at the top of the sheet is moved: rows are
+# written to the archive first and then deleted from the sheet after
+# checking they have not changed, and a file never gets the same row twice,
+# so a job interrupted halfway can simply be run again.
+#
+# ``read_range`` merges both tiers: the hot frame plus the monthly files that
+# overlap the requested dates. Queries within the window never open a file.
+#
+# Environment variables used:
+#   BICOPACK_ARCHIVE_DIR    Directory of the archive (default: archivo).
+#   BICOPACK_ARCHIVE_DAYS   Days kept in the sheets (default: 90).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR = "archivo"
+DEFAULT_HOT_DAYS = 90
+
+# Date columns that place a row in a month, in order of preference
+ARCHIVE_DATE_COLUMNS = {
+    SHEET_PRODUCCION: ("fecha_fin", "fecha_inicio"),
+    SHEET_EVENTOS: ("fecha",),
+}
+ARCHIVE_TABLES = tuple(ARCHIVE_DATE_COLUMNS)
+
+# Partition of the rows without a valid date
+UNDATED = "sin-fecha"
+
+
+def _date_columns(table: str):
+    try:
+        return ARCHIVE_DATE_COLUMNS[table]
+    except KeyError:
+        raise ValueError(f"La tabla {table} no se archiva") from None
+
+
+def row_dates(table: str, typed: pd.DataFrame) -> pd.Series:
+    """Date of each row of a typed frame (``NaT`` when it has none)."""
+    columns = _date_columns(table)
+    dates = typed[columns[0]]
+    for col in columns[1:]:
+        dates = dates.fillna(typed[col])
+    return dates
+
+
+def select_dates(table: str, typed: pd.DataFrame, since=None, until=None) -> pd.DataFrame:
+    """Rows of a typed frame dated between ``since`` and ``until`` (both included)."""
+    if since is None and until is None:
+        return typed
+    dates = row_dates(table, typed)
+    mask = dates.notna()
+    if since is not None:
+        mask &= dates >= pd.Timestamp(since).normalize()
+    if until is not None:
+        mask &= dates <= pd.Timestamp(until).normalize()
+    return typed[mask.to_numpy()].reset_index(drop=True)
+
+
+def _text_frame(rows: pd.DataFrame) -> pd.DataFrame:
+    """Raw rows with every cell as stripped text."""
+    return pd.DataFrame({str(c): as_text(rows[c]) for c in rows.columns}, index=rows.index)
+
+
+def _missing_rows(rows: pd.DataFrame, existing: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows of ``rows`` not stored yet in ``existing``. Repeated rows are
+    matched one by one, so two identical events are both kept.
+    """
+    if existing is None or existing.empty:
+        return rows
+    cols = list(rows.columns)
+    existing = existing.reindex(columns=cols, fill_value="")
+
+    def numbered(frame):
+        return frame.assign(_n=frame.groupby(cols, sort=False).cumcount())
+
+    merged = numbered(rows).merge(
+        numbered(existing)[cols + ["_n"]], how="left", on=cols + ["_n"], indicator=True
+    )
+    return rows[(merged["_merge"] == "left_only").to_numpy()]
+
+
+class Archive:
+    """
+    Monthly Parquet files of the archived tables under ``root``. Typed
+    partitions are kept in memory per file modification time, so repeated
+    queries over the same months read each file once.
+    """
+
+    def __init__(self, root: str = DEFAULT_ARCHIVE_DIR):
+        self.root = root
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _path(self, table: str, partition: str) -> str:
+        return os.path.join(self.root, table, f"{partition}.parquet")
+
+    def partitions(self, table: str) -> list[str]:
+        """Partition names of ``table`` ("YYYY-MM" and ``UNDATED``), sorted."""
+        _date_columns(table)
+        paths = glob.glob(os.path.join(self.root, table, "*.parquet"))
+        return sorted(os.path.basename(p)[: -len(".parquet")] for p in paths)
+
+    def _load(self, table: str, partition: str, keep: bool = True) -> pd.DataFrame:
+        path = self._path(table, partition)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._frames.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        frame = apply_schema(table, pd.read_parquet(path))
+        if keep:
+            with self._lock:
+                self._frames[path] = (mtime, frame)
+        return frame
+
+    def _partitions_in_range(self, table: str, since=None, until=None) -> list[str]:
+        first = pd.Timestamp(since).strftime("%Y-%m") if since is not None else None
+        last = pd.Timestamp(until).strftime("%Y-%m") if until is not None else None
+        selected = []
+        for partition in self.partitions(table):
+            if partition == UNDATED:
+                if since is not None or until is not None:
+                    continue
+            elif (first is not None and partition < first) or (last is not None and partition > last):
+                continue
+            selected.append(partition)
+        return selected
+
+    def read(self, table: str, since=None, until=None) -> pd.DataFrame:
+        """
+        Typed archived rows of ``table`` dated between ``since`` and
+        ``until`` (dates, both optional and included). Only the files of
+        the months in range are opened; rows without a date are returned
+        only when no bound is given.
+        """
+        frames = [self._load(table, p) for p in self._partitions_in_range(table, since, until)]
+        if not frames:
+            return empty_table(table)
+        return select_dates(table, concat_typed(table, frames), since, until)
+
+    def iter_read(self, table: str, since=None, until=None):
+        """
+        Like ``read``, one month at a time. Months not already in memory
+        are read without being kept, so a scan over years of files holds
+        a single month at once.
+        """
+        for partition in self._partitions_in_range(table, since, until):
+            yield select_dates(table, self._load(table, partition, keep=False), since, until)
+
+    def write(self, table: str, rows: pd.DataFrame) -> int:
+        """
+        Add raw rows of ``table`` to their monthly files, skipping the ones
+        already stored. Each file is replaced atomically. Returns the number
+        of rows added.
+        """
+        if rows is None or rows.empty:
+            return 0
+        rows = _text_frame(rows)
+        dates = row_dates(table, apply_schema(table, rows))
+        partitions = dates.dt.strftime("%Y-%m").fillna(UNDATED).to_numpy()
+        os.makedirs(os.path.join(self.root, table), exist_ok=True)
+        added = 0
+        for partition, part in rows.groupby(partitions, sort=True):
+            path = self._path(table, partition)
+            existing = pd.read_parquet(path) if os.path.exists(path) else None
+            new = _missing_rows(part, existing)
+            if new.empty:
+                continue
+            merged = pd.concat([existing, new], ignore_index=True) if existing is not None else new
+            merged = _text_frame(merged.reset_index(drop=True))
+            tmp = f"{path}.tmp"
+            merged.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+            added += len(new)
+        return added
+
+    def lock(self) -> FileLock:
+        """Lock that keeps two archive jobs from running at the same time."""
+        os.makedirs(self.root, exist_ok=True)
+        return FileLock(os.path.join(self.root, ".lock"))
+
+
+def read_range(table: str, hot: pd.DataFrame, archive: Archive, since=None, until=None) -> pd.DataFrame:
+    """
+    Typed rows of ``table`` between ``since`` and ``until`` from both tiers:
+    the archived months that overlap the range followed by the matching
+    rows of ``hot`` (the typed frame of the sheet).
+    """
+    hot = select_dates(table, hot, since, until)
+    if archive is None:
+        return hot
+    return concat_typed(table, [archive.read(table, since, until), hot])
+
+
+def archive_table(backend, archive: Archive, table: str, before, dry_run: bool = False) -> int:
+    """
+    Move the block of rows at the top of ``table`` dated before ``before``
+    (rows without a date included) into ``archive`` and delete them from
+    the backend. Returns the number of rows moved.
+    """
+    raw = backend.get_all(table)
+    if raw is None or raw.empty:
+        return 0
+    dates = row_dates(table, apply_schema(table, raw))
+    old = (dates < pd.Timestamp(before).normalize()) | dates.isna()
+    # Solo el bloque inicial: así se borra con una sola operación
+    count = len(old) if old.all() else int(old.to_numpy().argmin())
+    if count == 0 or dry_run:
+        return count
+    block = raw.iloc[:count]
+    added = archive.write(table, block)
+    logger.info("%s: %s filas archivadas (%s ya estaban en el archivo)", table, count, count - added)
+    return backend.delete_first_rows(table, block.values.tolist())
+
+
+def archive_old_rows(backend, archive: Archive, days: int = DEFAULT_HOT_DAYS, dry_run: bool = False) -> dict:
+    """Archive the rows older than ``days`` of every archived table."""
+    before = now_madrid().tz_localize(None).normalize() - pd.Timedelta(days=days)
+    with archive.lock():
+        return {table: archive_table(backend, archive, table, before, dry_run) for table in ARCHIVE_TABLES}
+
+
+def archive_dir_from_env() -> str:
+    return os.environ.get("BICOPACK_ARCHIVE_DIR", "").strip() or DEFAULT_ARCHIVE_DIR
+
+
+def hot_days_from_env() -> int:
+    return int(os.environ.get("BICOPACK_ARCHIVE_DAYS", DEFAULT_HOT_DAYS))
+
+
+def archive_from_env() -> Archive:
+    """The archive in ``BICOPACK_ARCHIVE_DIR``."""
+    return Archive(archive_dir_from_env())
+
+
+def main(argv=None):
+    """Archive the old rows of PRODUCCION and EVENTOS."""
+    from bicopack.storage import backend_from_env
+
+    parser = argparse.ArgumentParser(
+        description="Mueve las filas antiguas de PRODUCCION y EVENTOS a ficheros Parquet mensuales"
+    )
+    parser.add_argument("--days", type=int, default=hot_days_from_env(), help="días que se quedan en las hojas")
+    parser.add_argument("--dry-run", action="store_true", help="solo cuenta las filas que se moverían")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    moved = archive_old_rows(backend_from_env(shared=False), archive_from_env(), args.days, args.dry_run)
+    if not args.dry_run:
+        record_changes([table for table, count in moved.items() if count])
+    for table, count in moved.items():
+        logger.info("%s: %s filas %s", table, count, "por archivar" if args.dry_run else "movidas al archivo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import os
+import time
+import threading
+
+import pandas as pd
+
+from bicopack import metrics
+from bicopack.core import SHEET_EN_CURSO, SHEET_MAQUINAS, TABLE_COLUMNS, clean_row
+from bicopack.schema import apply_schema, concat_typed
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Caché de tablas
+#
+# Process-wide cache of the tables read from the storage backend. Each table
+# has its own entry with a version number. Successful writes are applied to
+# the cached frame (append a row, remove a closed ``bobina_id``, update a
+# machine) instead of throwing the cache away, so the rerun after a save
+# needs no extra reads and only the written table changes version.
+# Frames are typed with ``bicopack.schema`` when they are loaded, so the
+# conversion runs once per load instead of once per session and rerun.
+# Every lookup is counted as a hit or a miss in ``bicopack.metrics``.
+#
+# Starts and reopens are checked against the stored EN_CURSO right before
+# they are written (``StorageBackend.start_production``) and closes against
+# the stored row of their bobina, so the forms stay correct whatever the
+# age of the cache and the TTL only bounds how long another process's
+# writes take to show up.
+#
+# Environment variables used:
+#   BICOPACK_CACHE_TTL   Seconds a cached table is served before it is
+#                        read again (default: 300).
+# -----------------------------------------------------------------------------
+
+DEFAULT_TTL_SECONDS = 300
+# An old snapshot served while the source is down is retried this often
+STALE_RETRY_SECONDS = 10
+
+
+def ttl_from_env() -> float:
+    """Cache TTL from ``BICOPACK_CACHE_TTL``."""
+    return float(os.environ.get("BICOPACK_CACHE_TTL", DEFAULT_TTL_SECONDS))
+
+
+class CachedTable:
+    """A cached frame plus its version, load time and staleness."""
+
+    def __init__(self, frame: pd.DataFrame, version: int, stale_since: float = None):
+        self.frame = frame
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.stale_since = stale_since
+
+    def fresh(self, ttl: float) -> bool:
+        if self.stale_since is not None:
+            ttl = min(ttl, STALE_RETRY_SECONDS)
+        return time.monotonic() - self.loaded_at < ttl
+
+
+class TableCache:
+    """
+    Cache of backend tables keyed by sheet name. Reads reload a table only
+    when its entry is older than ``ttl`` seconds. Every reload or patch
+    increments the table's version, which callers can use to rebuild
+    derived structures only when the data they depend on changed.
+    """
+
+    def __init__(self, backend, ttl: float = DEFAULT_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def _store(self, table: str, frame: pd.DataFrame, stale_since: float = None):
+        version = self._versions.get(table, 0) + 1
+        self._versions[table] = version
+        self._entries[table] = CachedTable(frame, version, stale_since)
+
+    def _fresh_entry(self, table: str):
+        entry = self._entries.get(table)
+        if entry is not None and entry.fresh(self.ttl):
+            return entry
+        return None
+
+    def get(self, table: str) -> pd.DataFrame:
+        """Return a copy of ``table``, loading it if missing or expired."""
+        return self.get_many([table])[table]
+
+    def _load_stale(self, tables: list[str]):
+        with self._lock:
+            stale = [t for t in tables if self._fresh_entry(t) is None]
+        for table in tables:
+            metrics.record_cache(table, hit=table not in stale)
+        if stale:
+            frames = self.backend.get_many(stale)
+            with self._lock:
+                for table in stale:
+                    self._store(
+                        table,
+                        apply_schema(table, frames[table]),
+                        stale_since=self.backend.stale_since(table),
+                    )
+
+    def get_many(self, tables) -> dict[str, pd.DataFrame]:
+        """
+        Return copies of several tables. The ones missing or expired are
+        loaded together with a single ``backend.get_many`` call.
+        """
+        tables = list(dict.fromkeys(tables))
+        self._load_stale(tables)
+        with self._lock:
+            return {t: self._entries[t].frame.copy() for t in tables}
+
+    def snapshot(self, tables):
+        """
+        Return ``(frames, versions)`` for several tables, read together so
+        each frame matches its version. The frames are the cached objects
+        themselves (patches replace them, never modify them) and must be
+        treated as read-only.
+        """
+        tables = list(dict.fromkeys(tables))
+        self._load_stale(tables)
+        with self._lock:
+            frames = {t: self._entries[t].frame for t in tables}
+            versions = {t: self._entries[t].version for t in tables}
+            return frames, versions
+
+    def version(self, table: str) -> int:
+        """Current version of ``table`` (0 if it was never loaded)."""
+        with self._lock:
+            return self._versions.get(table, 0)
+
+    def fresh_versions(self, tables) -> dict:
+        """
+        Version of each of ``tables`` whose cached entry is still fresh,
+        None for the ones a read would reload. Never loads anything.
+        """
+        with self._lock:
+            return {
+                t: entry.version if entry is not None else None
+                for t, entry in ((t, self._fresh_entry(t)) for t in tables)
+            }
+
+    def stale_since(self, table: str):
+        """
+        ``time.time()`` of the data cached for ``table`` when it is an old
+        snapshot served because the backend was unavailable, else None.
+        """
+        with self._lock:
+            entry = self._entries.get(table)
+            return entry.stale_since if entry is not None else None
+
+    def versions(self) -> dict[str, int]:
+        """Current version of every table loaded so far."""
+        with self._lock:
+            return dict(self._versions)
+
+    def invalidate(self, table: str = None):
+        """
+        Drop ``table`` (or every table) so the next read reloads it. The
+        version changes too, so structures built from the dropped frame
+        are rebuilt on their next sync.
+        """
+        with self._lock:
+            tables = list(self._entries) if table is None else [table]
+            for name in tables:
+                if self._entries.pop(name, None) is not None:
+                    self._versions[name] += 1
+
+    # -- write-through patches ------------------------------------------------
+
+    def _patch(self, table: str, func):
+        """Replace the cached frame of ``table``; return its new version."""
+        with self._lock:
+            entry = self._entries.get(table)
+            if entry is None:
+                return None
+            self._store(table, func(entry.frame), entry.stale_since)
+            # A patch does not make the rest of the frame any fresher
+            self._entries[table].loaded_at = entry.loaded_at
+            return self._versions[table]
+
+    def apply_append(self, table: str, row: list):
+        """
+        Append ``row`` (in the table's column order) to the cached frame.
+        Returns the new version of the table, or None if it is not cached.
+        """
+        columns = TABLE_COLUMNS[table]
+        row = (clean_row(row) + [""] * len(columns))[: len(columns)]
+
+        def append(frame):
+            extra = apply_schema(table, pd.DataFrame([row], columns=columns))
+            return concat_typed(table, [frame, extra])
+
+        return self._patch(table, append)
+
+    def apply_delete_bobina(self, bobina_id):
+        """Remove the cached EN_CURSO row of ``bobina_id``; return the new version."""
+        target = str(bobina_id).strip()
+
+        def delete(frame):
+            if frame is None or frame.empty or "bobina_id" not in frame.columns:
+                return frame
+            keep = frame["bobina_id"] != target
+            return frame[keep].reset_index(drop=True)
+
+        return self._patch(SHEET_EN_CURSO, delete)
+
+    def apply_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        """Update or insert the cached MAQUINAS row of ``maquina``; return the new version."""
+        return self.apply_maquinas([[maquina, tipo_produccion, lote_of, lote_mp]])
+
+    def apply_maquinas(self, rows: list[list]):
+        """
+        Update or insert the cached MAQUINAS ``rows`` (in the table's
+        column order; a shorter row leaves the last columns as they are) in
+        one patch; return the new version.
+        """
+        columns = TABLE_COLUMNS[SHEET_MAQUINAS]
+
+        def upsert(frame):
+            extra = []
+            if frame is not None and not frame.empty:
+                frame = frame.copy()
+                for col in columns[1:]:
+                    frame[col] = frame[col].astype(object)
+            for row in rows:
+                values = dict(zip(columns, row))
+                maquina = int(values.pop("maquina"))
+                if frame is not None and not frame.empty:
+                    match = frame["maquina_norm"] == maquina
+                    if match.any():
+                        idx = match[match].index[0]
+                        for col, value in values.items():
+                            frame.at[idx, col] = value
+                        continue
+                extra.append({"maquina": maquina, **values})
+            frame = apply_schema(SHEET_MAQUINAS, frame)
+            if extra:
+                frame = concat_typed(SHEET_MAQUINAS, [frame, apply_schema(SHEET_MAQUINAS, pd.DataFrame(extra))])
+            return frame
+
+        return self._patch(SHEET_MAQUINAS, upsert)
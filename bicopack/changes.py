@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Avisos de cambios
+#
+# Publish/subscribe of table changes, so the dashboards refresh when a
+# table they show is written instead of waiting for the cache TTL or a
+# click. Every write helper of ``bicopack.ui`` publishes the tables it
+# touched; subscribers (one per open dashboard session) are called with
+# the changed tables that they watch.
+#
+# Writes made by other processes (other Streamlit workers, the ingestion
+# API, the import and archive jobs) arrive through a ``ChangeLog``: a small
+# SQLite file with one sequence number per table. Each process bumps the
+# numbers of the tables it writes, and a watcher thread in every process
+# reads them once a second (a local query, never the Sheets API) and
+# publishes the changes made by the others, after the ``on_remote``
+# listeners have dropped those tables from the local cache.
+#
+# Environment variables used:
+#   BICOPACK_CHANGES_PATH      SQLite file shared by every process of the
+#                              host (disabled when empty: changes are only
+#                              seen within the process).
+#   BICOPACK_CHANGES_SECONDS   Interval of the watcher (default: 1).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 1.0
+
+
+class ChangeLog:
+    """Per-table change counters shared by the processes of a host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cambios (tabla TEXT PRIMARY KEY, seq INTEGER NOT NULL, momento REAL)"
+            )
+
+    def record(self, tables) -> dict:
+        """Bump the counter of each of ``tables``; return their new values."""
+        tables = sorted(set(tables))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO cambios (tabla, seq, momento) VALUES (?, 1, ?) "
+                "ON CONFLICT(tabla) DO UPDATE SET seq = seq + 1, momento = excluded.momento",
+                [(table, now) for table in tables],
+            )
+            marks = ", ".join("?" for _ in tables)
+            rows = self._conn.execute(f"SELECT tabla, seq FROM cambios WHERE tabla IN ({marks})", tables)
+            return dict(rows.fetchall())
+
+    def read(self) -> dict:
+        """Current counter of every table changed so far."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT tabla, seq FROM cambios").fetchall())
+
+
+class ChangeHub:
+    """
+    In-process subscribers plus, with a ``ChangeLog``, a watcher thread for
+    the changes of the other processes. Subscriptions are keyed (by session
+    id in the app), so subscribing again replaces the previous one.
+    """
+
+    def __init__(self, log: ChangeLog = None, interval: float = DEFAULT_POLL_SECONDS):
+        self.log = log
+        self.interval = interval
+        self._subscribers = {}
+        self._listeners = []
+        # Last counter of each table known to this process
+        self._seen = None
+        self._seen_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, key, tables, callback):
+        """
+        Call ``callback(changed)`` when any of ``tables`` changes. If the
+        callback returns False the subscriber is gone and is removed.
+        """
+        with self._lock:
+            self._subscribers[key] = (frozenset(tables), callback)
+
+    def unsubscribe(self, key):
+        with self._lock:
+            self._subscribers.pop(key, None)
+
+    def on_remote(self, listener):
+        """Call ``listener(tables)`` first whenever another process changes ``tables``."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def publish(self, tables, local: bool = True):
+        """
+        Tell the subscribers that ``tables`` changed. ``local`` changes are
+        also recorded in the change log for the other processes.
+        """
+        tables = frozenset(tables)
+        if not tables:
+            return
+        if local and self.log is not None:
+            try:
+                counters = self.log.record(tables)
+            except Exception:
+                logger.exception("No se pudo anotar el cambio de %s", ", ".join(sorted(tables)))
+            else:
+                # Un salto de más de uno: otro proceso escribió justo antes
+                self._remote(self._advance(counters, own=True))
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        gone = []
+        for key, (watched, callback) in subscribers:
+            changed = watched & tables
+            if not changed:
+                continue
+            try:
+                if callback(changed) is False:
+                    gone.append(key)
+            except Exception:
+                logger.exception("Error avisando del cambio de %s", ", ".join(sorted(changed)))
+        if gone:
+            with self._lock:
+                for key in gone:
+                    self._subscribers.pop(key, None)
+
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    # -- changes of other processes -------------------------------------------
+
+    def _advance(self, counters: dict, own: bool = False) -> set:
+        """
+        Store ``counters`` as seen and return the tables changed by other
+        processes since the previous ones (all but our own bump if ``own``).
+        """
+        with self._seen_lock:
+            if self._seen is None:
+                self._seen = dict(counters)
+                return set()
+            step = 1 if own else 0
+            changed = {t for t, seq in counters.items() if seq - self._seen.get(t, 0) > step}
+            for table, seq in counters.items():
+                self._seen[table] = max(seq, self._seen.get(table, 0))
+            return changed
+
+    def _remote(self, tables: set):
+        if not tables:
+            return
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(tables)
+            except Exception:
+                logger.exception("Error aplicando el cambio remoto de %s", ", ".join(sorted(tables)))
+
+    def poll(self) -> set:
+        """Publish the changes logged by other processes since the last poll."""
+        if self.log is None:
+            return set()
+        changed = self._advance(self.log.read())
+        if changed:
+            self._remote(changed)
+            self.publish(changed, local=False)
+        return changed
+
+    def start(self):
+        """Start the watcher thread (only with a change log)."""
+        if self.log is None or self._thread is not None:
+            return self
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name="bicopack-changes", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Error leyendo el registro de cambios")
+
+
+def change_log_from_env():
+    """Return a ``ChangeLog`` if ``BICOPACK_CHANGES_PATH`` is set, else None."""
+    path = os.environ.get("BICOPACK_CHANGES_PATH", "").strip()
+    if not path:
+        return None
+    return ChangeLog(path)
+
+
+def change_hub_from_env() -> ChangeHub:
+    """A ``ChangeHub`` with the change log of the environment (not started yet)."""
+    interval = float(os.environ.get("BICOPACK_CHANGES_SECONDS", DEFAULT_POLL_SECONDS))
+    return ChangeHub(change_log_from_env(), interval)
+
+
+def record_changes(tables):
+    """
+    Record ``tables`` in the change log of the environment, if any. For the
+    command-line jobs, which have no hub of their own.
+    """
+    log = change_log_from_env()
+    if log is not None:
+        log.record(tables)
@@ -0,0 +1,323 @@
+import os
+from datetime import datetime, timedelta
+import pytz
+
+import pandas as pd
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Constantes y utilidades compartidas
+#
+# Sheet names, column layouts and the small parsing helpers used by the
+# Streamlit app and by the storage backends. Nothing in this module imports
+# Streamlit, so it can be reused from command line tools and services.
+# -----------------------------------------------------------------------------
+
+# Timezone for all date/time operations
+tz = pytz.timezone("Europe/Madrid")
+
+
+# -----------------------------------------------------------------------------
+# Sheet names and constant definitions
+# -----------------------------------------------------------------------------
+SHEET_EN_CURSO = "EN_CURSO"
+SHEET_PRODUCCION = "PRODUCCION"
+SHEET_EVENTOS = "EVENTOS"
+SHEET_PLANAS_TURNO = "PLANAS_TURNO"
+
+SHEET_MAQUINAS = "MAQUINAS"
+
+# Máquinas de la nave original, registradas aunque no tengan fila en
+# MAQUINAS; el resto se dan de alta en MAQUINAS (ver bicopack/registry.py)
+MAX_MAQUINA = 21
+
+EN_CURSO_COLS = [
+    "bobina_id",
+    "fecha",
+    "turno",
+    "maquina",
+    "tipo_produccion",
+    "lote_mp",
+    "lote_of",
+    "hora_inicio",
+    "operario_inicio",
+    "observaciones",
+]
+
+PRODUCCION_COLS = [
+    "fecha_inicio",
+    "fecha_fin",
+    "turno",
+    "maquina",
+    "tipo_produccion",
+    "lote_mp",
+    "lote_of",
+    "hora_inicio",
+    "operario_inicio",
+    "hora_fin",
+    "operario_fin",
+    "peso",
+    "taras",
+    "observaciones",
+]
+
+EVENTOS_COLS = [
+    "fecha",
+    "turno",
+    "maquina",
+    "lote_of",
+    "tipo",
+    "hora_inicio",
+    "hora_fin",
+    "minutos",
+    "operario",
+    "descripcion",
+]
+
+# Columnas para la producción de bobina plana reprocesada. Ahora aceptamos
+# varios lotes y órdenes de trabajo y un único campo de cantidad total,
+# por lo que se han eliminado las columnas de máquinas individuales.
+PLANAS_TURNO_COLS = [
+    "fecha",
+    "turno",
+    "lotes",
+    "ordenes_trabajo",
+    "operario_1",
+    "operario_2",
+    "operario_3",
+    "operario_4",
+    "operario_5",
+    "cantidad_reprocesadas",
+]
+
+# ``linea`` y ``planta`` agrupan las máquinas; pueden faltar en la hoja
+MAQUINAS_COLS = [
+    "maquina",
+    "tipo_produccion",
+    "lote_of",
+    "lote_mp",
+    "linea",
+    "planta",
+]
+
+# Opciones de tipo de producción. Se ha sustituido "Bobina plana" por
+# "Bobina plana reprocesada" para reflejar las nuevas necesidades.
+TIPOS_PRODUCCION = ["Bobina cruzada", "Bobina plana reprocesada", "Saco"]
+TIPOS_EVENTO = ["Incidencia", "Tarea - cambio de agujas", "Limpieza"]
+
+# Column layout of every table, keyed by sheet name. The first four live in
+# the main spreadsheet; MAQUINAS lives in the auxiliary machines spreadsheet.
+TABLE_COLUMNS = {
+    SHEET_EN_CURSO: EN_CURSO_COLS,
+    SHEET_PRODUCCION: PRODUCCION_COLS,
+    SHEET_EVENTOS: EVENTOS_COLS,
+    SHEET_PLANAS_TURNO: PLANAS_TURNO_COLS,
+    SHEET_MAQUINAS: MAQUINAS_COLS,
+}
+MAIN_SHEETS = (SHEET_EN_CURSO, SHEET_PRODUCCION, SHEET_EVENTOS, SHEET_PLANAS_TURNO)
+
+
+class BobinaNotFoundError(LookupError):
+    """Raised when closing a production that is no longer in EN_CURSO."""
+
+    def __init__(self, bobina_id):
+        super().__init__(
+            f"La producción {bobina_id} ya no está abierta (puede que se haya cerrado desde otro puesto)"
+        )
+        self.bobina_id = bobina_id
+
+
+class TableChangedError(RuntimeError):
+    """Raised when rows about to be removed changed since they were read."""
+
+    def __init__(self, table, message: str = None):
+        super().__init__(
+            message or f"La hoja {table} ha cambiado mientras se procesaba; vuelve a intentarlo"
+        )
+        self.table = table
+
+
+class MachineOccupiedError(TableChangedError):
+    """
+    Raised when a start or reopen finds its machine already open in the
+    stored EN_CURSO, although the copy it was checked against was free.
+    """
+
+    def __init__(self, maquina, bobina_id=""):
+        super().__init__(
+            SHEET_EN_CURSO,
+            f"La máquina {maquina} ya tiene una producción abierta "
+            f"(puede que se haya iniciado desde otro puesto)",
+        )
+        self.maquina = maquina
+        self.bobina_id = bobina_id
+
+
+# -----------------------------------------------------------------------------
+# Helper functions
+# -----------------------------------------------------------------------------
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean flag ("1", "true", "yes", "si") from the environment."""
+    value = os.environ.get(name, "")
+    if not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "si", "sí")
+
+
+def parse_hhmm(value: str):
+    """Parse a string in HH:MM format into a ``datetime.time`` object."""
+    return datetime.strptime(str(value).strip(), "%H:%M").time()
+
+
+def safe_int(x, default=None):
+    """Safely convert a value to an integer, returning ``default`` if not possible."""
+    try:
+        if pd.isna(x):
+            return default
+        return int(x)
+    except Exception:
+        try:
+            return int(str(x).strip())
+        except Exception:
+            return default
+
+
+def safe_float(x, default=None):
+    """Safely convert a value to a float, returning ``default`` if not possible."""
+    try:
+        if pd.isna(x):
+            return default
+        return float(x)
+    except Exception:
+        try:
+            return float(str(x).strip().replace(",", "."))
+        except Exception:
+            return default
+
+
+def as_text(values: pd.Series) -> pd.Series:
+    """Return ``values`` as stripped strings, with missing values as ""."""
+    return values.astype(object).where(values.notna(), "").astype(str).str.strip()
+
+
+def map_unique(values: pd.Series, parse) -> pd.Series:
+    """
+    Apply the vectorised ``parse`` only to the distinct values of a column
+    and broadcast the result back. Sheet columns such as dates, times or
+    machine numbers repeat the same few hundred values, so this is much
+    cheaper than parsing every row.
+    """
+    codes, uniques = pd.factorize(values)
+    # Missing values get code -1, which ``take`` maps to the last entry
+    lookup = parse(pd.Series(list(uniques) + [None], dtype=object))
+    result = lookup.take(codes)
+    result.index = values.index
+    return result
+
+
+def clean_row(row):
+    """
+    Ensure that values in a row are JSON serialisable before appending to a sheet.
+    ``gspread`` does not handle NumPy types or NaNs well, so convert them to
+    plain Python types or empty strings.
+    """
+    clean = []
+    for x in row:
+        try:
+            if pd.isna(x):
+                clean.append("")
+            elif hasattr(x, "item"):
+                clean.append(x.item())
+            else:
+                clean.append(x)
+        except Exception:
+            clean.append(x)
+    return clean
+
+
+def ensure_columns(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """
+    Ensure that a DataFrame has at least the specified columns. If the
+    DataFrame is empty or None, a new empty DataFrame with those columns is
+    returned. Any missing columns are added with empty strings.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=columns)
+    df = df.copy()
+    for col in columns:
+        if col not in df.columns:
+            df[col] = ""
+    return df
+
+
+def bobina_id_missing(df: pd.DataFrame, bobina_id) -> bool:
+    """True if the EN_CURSO frame ``df`` has no row for ``bobina_id``."""
+    if df is None or df.empty or "bobina_id" not in df.columns:
+        return True
+    return not (df["bobina_id"].astype(str).str.strip() == str(bobina_id).strip()).any()
+
+
+def get_first_existing_value(row, possible_cols, default=""):
+    """
+    Given a row and a list of possible column names, return the first
+    non-empty value found. If none are present, return ``default``.
+    """
+    for col in possible_cols:
+        if col in row and pd.notna(row[col]) and str(row[col]).strip() != "":
+            return row[col]
+    return default
+
+
+def normalize_name(value: str) -> str:
+    """Normalise a name to lower-case and trimmed."""
+    return str(value).strip().lower()
+
+
+def current_date_madrid():
+    """Return the current date in the Europe/Madrid timezone."""
+    return datetime.now(tz).date()
+
+
+def current_time_madrid_str():
+    """Return the current time as HH:MM string in the Europe/Madrid timezone."""
+    return datetime.now(tz).strftime("%H:%M")
+
+
+def compute_minutes(fecha_obj, hora_inicio_str, hora_fin_str):
+    """
+    Compute the difference in minutes between two HH:MM strings on a given date.
+    If times are missing or cannot be parsed, return an empty string. Handles
+    overnight spans by rolling the end time to the next day.
+    """
+    if not str(hora_inicio_str).strip() or not str(hora_fin_str).strip():
+        return ""
+    try:
+        h_ini = parse_hhmm(hora_inicio_str)
+        h_fin = parse_hhmm(hora_fin_str)
+        start = datetime.combine(fecha_obj, h_ini)
+        end = datetime.combine(fecha_obj, h_fin)
+        if end < start:
+            end += timedelta(days=1)
+        return int((end - start).total_seconds() / 60)
+    except Exception:
+        return ""
+
+
+def event_datetime_from_row(row, prefer_end=False):
+    """
+    Construct a timezone-aware datetime from a row of the EVENTOS sheet. If
+    ``prefer_end`` is True, the end time is used; otherwise the start time.
+    Returns None if the date or time cannot be parsed.
+    """
+    try:
+        fecha_txt = str(row.get("fecha", "")).strip()
+        if not fecha_txt:
+            return None
+        fecha_obj = datetime.strptime(fecha_txt, "%Y-%m-%d").date()
+        hora_key = "hora_fin" if prefer_end else "hora_inicio"
+        hora_txt = str(row.get(hora_key, "")).strip() or "00:00"
+        hora_obj = parse_hhmm(hora_txt)
+        dt_naive = datetime.combine(fecha_obj, hora_obj)
+        return tz.localize(dt_naive)
+    except Exception:
+        return None
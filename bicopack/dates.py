@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from bicopack.core import as_text, map_unique, tz
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Fechas y horas vectorizadas
+#
+# Column-wise versions of the date helpers in ``bicopack.core``. The sheets
+# store dates as ``YYYY-MM-DD`` and times as ``HH:MM`` text; these functions
+# turn whole columns into timezone-aware ``datetime64`` series in one pass
+# (``pd.to_datetime`` + ``tz_localize``) instead of calling ``strptime`` row
+# by row, so the 24-hour panels stay fast with hundreds of thousands of rows.
+# -----------------------------------------------------------------------------
+
+# Same formats accepted by ``datetime.strptime(value, "%H:%M")``
+_HHMM_PATTERN = r"^\s*(\d{1,2}):(\d{1,2})\s*$"
+MINUTES_PER_DAY = 24 * 60
+
+
+def now_madrid() -> pd.Timestamp:
+    """Current time as a timezone-aware Timestamp in Europe/Madrid."""
+    return pd.Timestamp.now(tz=tz.zone)
+
+
+def parse_fecha_series(fecha: pd.Series) -> pd.Series:
+    """
+    Parse a column of ``YYYY-MM-DD`` dates into naive ``datetime64`` values
+    at midnight. Columns already typed as datetimes are just normalised.
+    Unparseable values become ``NaT``.
+    """
+    if pd.api.types.is_datetime64_any_dtype(fecha):
+        if getattr(fecha.dt, "tz", None) is not None:
+            fecha = fecha.dt.tz_localize(None)
+        return fecha.dt.normalize()
+    return map_unique(
+        fecha,
+        lambda u: pd.to_datetime(as_text(u), format="%Y-%m-%d", errors="coerce"),
+    )
+
+
+def hhmm_to_minutes(hora: pd.Series, default: str = None) -> pd.Series:
+    """
+    Convert a column of ``HH:MM`` strings to minutes after midnight (float,
+    ``NaN`` when invalid). Blank values use ``default`` when given, like the
+    "00:00" fallback of ``event_datetime_from_row``.
+    """
+    def parse(unique: pd.Series) -> pd.Series:
+        text = as_text(unique)
+        if default is not None:
+            text = text.mask(text == "", default)
+        parts = text.str.extract(_HHMM_PATTERN)
+        hours = pd.to_numeric(parts[0], errors="coerce")
+        minutes = pd.to_numeric(parts[1], errors="coerce")
+        valid = (hours < 24) & (minutes < 60)
+        return (hours * 60 + minutes).where(valid).astype(float)
+
+    return map_unique(hora, parse)
+
+
+def localize(naive: pd.Series) -> pd.Series:
+    """
+    Attach the Europe/Madrid timezone to naive datetimes as
+    ``tz.localize`` does by default: ambiguous times at the end of summer
+    time resolve to standard time, and non-existent times at its start
+    keep the standard offset (02:30 becomes 03:30 summer time).
+    """
+    return naive.dt.tz_localize(
+        tz.zone,
+        ambiguous=np.zeros(len(naive), dtype=bool),
+        nonexistent=pd.Timedelta(hours=1),
+    )
+
+
+def combine_fecha_hora(fecha: pd.Series, hora: pd.Series, default_hora: str = "00:00") -> pd.Series:
+    """
+    Build timezone-aware datetimes from a date column and an ``HH:MM``
+    column. Rows with an invalid date or time become ``NaT``; blank times
+    use ``default_hora`` (pass None to treat them as invalid).
+    """
+    base = parse_fecha_series(fecha)
+    minutes = hhmm_to_minutes(hora, default=default_hora)
+    return localize(base + pd.to_timedelta(minutes, unit="m"))
+
+
+def span_minutes(fecha: pd.Series, hora_inicio: pd.Series, hora_fin: pd.Series) -> pd.Series:
+    """
+    Vectorised ``compute_minutes``: duration in minutes (nullable Int64).
+    Like it, the times are subtracted as wall-clock times, so a night shift
+    across a summer time change is not an hour shorter or longer.
+    """
+    ini = hhmm_to_minutes(hora_inicio)
+    fin = hhmm_to_minutes(hora_fin)
+    minutes = fin.where(~(fin < ini), fin + MINUTES_PER_DAY) - ini
+    return minutes.where(parse_fecha_series(fecha).notna()).astype("Int64")
+
+
+def within_last_hours(dt: pd.Series, hours: float = 24, now: pd.Timestamp = None) -> pd.Series:
+    """Boolean mask of the datetimes that fall within the last ``hours``."""
+    now = now if now is not None else now_madrid()
+    return dt.notna() & (dt >= now - pd.Timedelta(hours=hours))
+
+
+def elapsed_minutes(start: pd.Series, now: pd.Timestamp = None) -> pd.Series:
+    """
+    Whole minutes elapsed since each datetime of ``start``, never negative
+    (nullable Int64, ``<NA>`` for missing datetimes).
+    """
+    now = now if now is not None else now_madrid()
+    minutes = ((now - start).dt.total_seconds() // 60).clip(lower=0)
+    return minutes.astype("Int64")
+
+
+def format_elapsed(minutes: pd.Series) -> pd.Series:
+    """Render elapsed minutes as "N min", or "-" when unknown."""
+    text = minutes.astype("string") + " min"
+    return text.fillna("-").astype(object)
+
+
+def format_fecha(value) -> str:
+    """Render a parsed date as ``YYYY-MM-DD`` (or "" when missing)."""
+    if value is None or pd.isna(value):
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+def filter_last_hours_events(df: pd.DataFrame, hours: int = 24) -> pd.DataFrame:
+    """
+    Filter events DataFrame to only include rows whose start time falls within
+    the last ``hours`` hours. Returns an empty DataFrame if none match.
+    """
+    if df.empty:
+        return df.copy()
+    dt = combine_fecha_hora(df["fecha"], df["hora_inicio"])
+    return df[within_last_hours(dt, hours)].copy()
@@ -0,0 +1,203 @@
+import os
+import logging
+import argparse
+
+import pandas as pd
+
+from bicopack.archive import ARCHIVE_DATE_COLUMNS, ARCHIVE_TABLES, archive_from_env
+from bicopack.core import SHEET_PLANAS_TURNO, TABLE_COLUMNS, as_text
+from bicopack.schema import apply_schema
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Exportación
+#
+# Filtered extracts of PRODUCCION, EVENTOS and PLANAS_TURNO for quality and
+# management, from the "Exportar" page or the command line:
+#
+#     python -m bicopack.export PRODUCCION enero.csv --desde 2026-01-01 --hasta 2026-01-31
+#     python -m bicopack.export EVENTOS eventos.parquet --maquinas 3,4 --of 024-12
+#
+# Rows are filtered by date range (the date that places them in the
+# archive; ``fecha`` for PLANAS_TURNO), machines and ``lote_of`` (text
+# contained, ignoring case; ``ordenes_trabajo`` for PLANAS_TURNO) and
+# written chunk by chunk: first the archived months that overlap the range,
+# one file at a time, then the rows of the sheet, taken from the table
+# cache in the app or from the storage backend (and its shared cache) on
+# the command line. The full history is never held in memory at once.
+# CSV files use ``;`` and a UTF-8 BOM so Excel opens them as is; Parquet
+# files keep the column types and get one row group per chunk.
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TABLES = ARCHIVE_TABLES + (SHEET_PLANAS_TURNO,)
+EXPORT_DATE_COLUMNS = {**ARCHIVE_DATE_COLUMNS, SHEET_PLANAS_TURNO: ("fecha",)}
+# Column matched by the ``lote_of`` filter
+OF_COLUMNS = {table: "lote_of" for table in ARCHIVE_TABLES}
+OF_COLUMNS[SHEET_PLANAS_TURNO] = "ordenes_trabajo"
+
+FORMATS = ("csv", "parquet")
+DEFAULT_CHUNK_ROWS = 50_000
+CSV_SEPARATOR = ";"
+
+
+def filter_rows(
+    table: str, typed: pd.DataFrame, since=None, until=None, maquinas=None, lote_of: str = ""
+) -> pd.DataFrame:
+    """Rows of a typed frame that match the export filters."""
+    if typed.empty:
+        return typed
+    mask = pd.Series(True, index=typed.index)
+    if since is not None or until is not None:
+        columns = EXPORT_DATE_COLUMNS[table]
+        dates = typed[columns[0]]
+        for col in columns[1:]:
+            dates = dates.fillna(typed[col])
+        mask &= dates.notna()
+        if since is not None:
+            mask &= dates >= pd.Timestamp(since).normalize()
+        if until is not None:
+            mask &= dates <= pd.Timestamp(until).normalize()
+    if maquinas and "maquina_norm" in typed.columns:
+        mask &= typed["maquina_norm"].isin([int(m) for m in maquinas])
+    lote_of = str(lote_of or "").strip()
+    if lote_of:
+        mask &= as_text(typed[OF_COLUMNS[table]]).str.contains(lote_of, case=False, regex=False)
+    return typed[mask.to_numpy()]
+
+
+def _output_frame(table: str, typed: pd.DataFrame) -> pd.DataFrame:
+    """Sheet columns only, with dates as ``datetime64`` and categories as text."""
+    out = typed[TABLE_COLUMNS[table]].copy()
+    for col in out.columns:
+        if isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = as_text(out[col]).astype(object)
+    return out.reset_index(drop=True)
+
+
+def export_chunks(
+    table: str,
+    hot: pd.DataFrame,
+    archive=None,
+    since=None,
+    until=None,
+    maquinas=None,
+    lote_of: str = "",
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+):
+    """
+    Matching rows of ``table`` as frames of at most ``chunk_rows`` rows:
+    the archived months in range (when ``archive`` is given and the table
+    is archived) followed by ``hot``, the typed frame of the sheet.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Solo se puede exportar {', '.join(EXPORT_TABLES)}")
+
+    def sources():
+        if archive is not None and table in ARCHIVE_TABLES:
+            yield from archive.iter_read(table, since, until)
+        yield apply_schema(table, hot)
+
+    for frame in sources():
+        frame = filter_rows(table, frame, since, until, maquinas, lote_of)
+        for start in range(0, len(frame), chunk_rows):
+            yield _output_frame(table, frame.iloc[start: start + chunk_rows])
+
+
+def write_csv(chunks, out, table: str) -> int:
+    """Write ``chunks`` to the binary file ``out`` as CSV; return the rows written."""
+    rows = 0
+    out.write("\ufeff".encode("utf-8"))
+    for i, chunk in enumerate(chunks):
+        text = chunk.to_csv(sep=CSV_SEPARATOR, index=False, header=i == 0, date_format="%Y-%m-%d")
+        out.write(text.encode("utf-8"))
+        rows += len(chunk)
+    if rows == 0:
+        # Sin filas: solo la cabecera
+        out.write((CSV_SEPARATOR.join(TABLE_COLUMNS[table]) + "\n").encode("utf-8"))
+    return rows
+
+
+def write_parquet(chunks, out, table: str) -> int:
+    """Write ``chunks`` to ``out`` (path or binary file) as Parquet; return the rows written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    schema = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+                writer = pq.ParquetWriter(out, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+        if writer is None:
+            # Sin filas: un fichero vacío con las columnas de la hoja
+            empty = _output_frame(table, apply_schema(table, None))
+            pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), out)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_table(table: str, hot: pd.DataFrame, archive, out, fmt: str = "csv", **filters) -> int:
+    """Write the matching rows of ``table`` to ``out`` in ``fmt``; return the rows written."""
+    chunks = export_chunks(table, hot, archive, **filters)
+    if fmt == "parquet":
+        return write_parquet(chunks, out, table)
+    if fmt == "csv":
+        return write_csv(chunks, out, table)
+    raise ValueError(f"Formato desconocido: {fmt}")
+
+
+def export_file_name(table: str, fmt: str, since=None, until=None) -> str:
+    """Default name of an export, e.g. ``PRODUCCION_2026-01-01_2026-01-31.csv``."""
+    parts = [table]
+    if since is not None:
+        parts.append(pd.Timestamp(since).strftime("%Y-%m-%d"))
+    if until is not None:
+        parts.append(pd.Timestamp(until).strftime("%Y-%m-%d"))
+    return "_".join(parts) + f".{fmt}"
+
+
+def main(argv=None):
+    """Export filtered rows of a table to a CSV or Parquet file."""
+    from bicopack.storage import backend_from_env
+
+    parser = argparse.ArgumentParser(description="Exporta filas filtradas de una hoja a CSV o Parquet")
+    parser.add_argument("tabla", choices=EXPORT_TABLES)
+    parser.add_argument("fichero", help="fichero de salida (.csv o .parquet)")
+    parser.add_argument("--desde", help="fecha inicial AAAA-MM-DD (incluida)")
+    parser.add_argument("--hasta", help="fecha final AAAA-MM-DD (incluida)")
+    parser.add_argument("--maquinas", default="", help="números de máquina separados por comas")
+    parser.add_argument("--of", default="", help="texto que debe contener la OF")
+    parser.add_argument("--formato", choices=FORMATS, help="por defecto, según la extensión del fichero")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    fmt = args.formato or ("parquet" if args.fichero.lower().endswith(".parquet") else "csv")
+    maquinas = [int(m) for m in args.maquinas.split(",") if m.strip()]
+    hot = backend_from_env().get_all(args.tabla)
+    tmp = f"{args.fichero}.tmp"
+    with open(tmp, "wb") as out:
+        rows = export_table(
+            args.tabla,
+            hot,
+            archive_from_env(),
+            out,
+            fmt,
+            since=args.desde,
+            until=args.hasta,
+            maquinas=maquinas,
+            lote_of=args.of,
+        )
+    os.replace(tmp, args.fichero)
+    logger.info("%s filas exportadas a %s", rows, args.fichero)
+
+
+if __name__ == "__main__":
+    main()
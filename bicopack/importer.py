@@ -0,0 +1,537 @@
+import os
+import re
+import csv
+import json
+import hashlib
+import logging
+import argparse
+import unicodedata
+from datetime import date, datetime, time
+
+import numpy as np
+import pandas as pd
+
+from bicopack.changes import record_changes
+from bicopack.core import (
+    SHEET_EVENTOS,
+    SHEET_MAQUINAS,
+    SHEET_PRODUCCION,
+    TABLE_COLUMNS,
+    TIPOS_EVENTO,
+    TIPOS_PRODUCCION,
+    as_text,
+)
+from bicopack.dates import hhmm_to_minutes, parse_fecha_series, span_minutes
+from bicopack.registry import MachineRegistry
+from bicopack.schema import to_float, to_int
+from bicopack.storage import same_rows
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Importación de histórico
+#
+# Loads years of production and incident history from CSV or Excel files
+# into PRODUCCION and EVENTOS without going through the forms:
+#
+#     python -m bicopack.importer PRODUCCION produccion_2019_2025.csv
+#     python -m bicopack.importer EVENTOS incidencias.xlsx --chunk 1000
+#
+# The file is streamed in chunks of ``chunk_rows`` rows. Each chunk is
+# normalised column by column (vectorised) to what the forms write: the
+# headers are matched to the sheet columns, dates (``AAAA-MM-DD`` or
+# ``DD/MM/AAAA``) and ``HH:MM`` times are rewritten in the app's format,
+# machine numbers (against the registry of MAQUINAS, ``bicopack.registry``),
+# shifts and types are checked, the end date of a
+# production rolls over to the next day like ``close_row`` and the minutes
+# of an event are computed like ``compute_minutes``. Valid rows are written
+# with one ``append_rows`` per chunk, which the Google Sheets client paces
+# to the quota (``bicopack.sheets_client``); rejected rows go to
+# ``<fichero>.rechazadas.csv`` with the reason. Each row carries an
+# idempotency key made of the file and its row number, so the write-behind
+# outbox never drops two identical history rows as a double click.
+#
+# Progress is saved after every chunk in ``<fichero>.importacion.json``.
+# Running the same import again resumes after the last chunk written. If
+# the job stopped while a chunk was being written, the end of the sheet is
+# compared with that chunk to decide whether it must be sent again, so no
+# chunk is written twice. Rejected rows are recorded with their chunk, so a
+# chunk read again is never reported twice. After a large import, ``python -m
+# bicopack.archive`` moves the old rows out of the sheets.
+#
+# Environment variables used:
+#   BICOPACK_IMPORT_DIR   Directory where the "Importar histórico" page keeps
+#                         the uploaded files and their progress
+#                         (default: importaciones).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+IMPORT_TABLES = (SHEET_PRODUCCION, SHEET_EVENTOS)
+DEFAULT_CHUNK_ROWS = 500
+DEFAULT_IMPORT_DIR = "importaciones"
+
+# Header names of older spreadsheets -> sheet column
+COLUMN_ALIASES = {
+    "lote_materia_prima": "lote_mp",
+    "of": "lote_of",
+    "orden_fabricacion": "lote_of",
+    "n_maquina": "maquina",
+    "no_maquina": "maquina",
+    "numero_maquina": "maquina",
+    "fecha_de_inicio": "fecha_inicio",
+    "fecha_de_fin": "fecha_fin",
+}
+
+# Columns that must be present in the file
+REQUIRED_COLUMNS = {
+    SHEET_PRODUCCION: ("fecha_inicio", "maquina", "hora_inicio", "hora_fin"),
+    SHEET_EVENTOS: ("fecha", "maquina", "tipo"),
+}
+
+# Column holding the source row number and the reason in the rejected file
+ROW_COLUMN = "fila"
+REASON_COLUMN = "motivo"
+
+
+def column_key(name) -> str:
+    """Sheet column for a file header ("Lote materia prima" -> "lote_mp")."""
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode()
+    key = re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")
+    return COLUMN_ALIASES.get(key, key)
+
+
+# -----------------------------------------------------------------------------
+# Sources
+# -----------------------------------------------------------------------------
+
+def _sniff_delimiter(path: str) -> str:
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        first = f.readline()
+    # Los CSV de Excel en español usan punto y coma
+    return max((";", ",", "\t"), key=first.count)
+
+
+def _csv_chunks(path: str, chunk_rows: int, skip: int):
+    reader = pd.read_csv(
+        path,
+        sep=_sniff_delimiter(path),
+        dtype=str,
+        keep_default_na=False,
+        encoding="utf-8-sig",
+        skiprows=range(1, skip + 1),
+        chunksize=chunk_rows,
+    )
+    with reader:
+        yield from reader
+
+
+def _excel_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == time() else value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.strftime("%H:%M")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _excel_chunks(path: str, chunk_rows: int, skip: int):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Para importar ficheros Excel hace falta instalar openpyxl") from None
+    # Modo de solo lectura: las filas se leen de una en una, sin cargar el libro
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_excel_cell(v) for v in next(rows, [])]
+        chunk = []
+        for i, row in enumerate(rows):
+            if i < skip:
+                continue
+            chunk.append([_excel_cell(v) for v in row][: len(header)])
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def is_excel(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm")
+
+
+def read_chunks(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS, skip: int = 0):
+    """Data rows of a CSV or Excel file as string frames, ``skip`` rows in."""
+    if is_excel(path):
+        return _excel_chunks(path, chunk_rows, skip)
+    return _csv_chunks(path, chunk_rows, skip)
+
+
+def count_rows(path: str):
+    """Data rows in the file (cheap estimate), or None if unknown."""
+    if is_excel(path):
+        return None
+    lines, last = 0, b""
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last and last != b"\n":
+        lines += 1
+    return max(0, lines - 1)
+
+
+# -----------------------------------------------------------------------------
+# Normalisation
+# -----------------------------------------------------------------------------
+
+def _dates(values: pd.Series) -> pd.Series:
+    """``AAAA-MM-DD`` or ``DD/MM/AAAA`` text (with an optional time) -> dates."""
+    text = as_text(values)
+    iso = parse_fecha_series(text.str.slice(0, 10))
+    spanish = pd.to_datetime(text.str.split(" ").str[0], format="%d/%m/%Y", errors="coerce")
+    return iso.fillna(spanish)
+
+
+def _format_dates(values: pd.Series) -> pd.Series:
+    return values.dt.strftime("%Y-%m-%d").fillna("").astype(object)
+
+
+def _format_minutes(minutes: pd.Series) -> pd.Series:
+    valid = minutes.notna()
+    out = pd.Series("", index=minutes.index, dtype=object)
+    whole = minutes[valid].astype(int)
+    out[valid] = (whole // 60).map("{:02d}".format) + ":" + (whole % 60).map("{:02d}".format)
+    return out
+
+
+def _times(values: pd.Series):
+    """``(minutes, text)``: HH:MM, H:MM or HH:MM:SS -> minutes and ``HH:MM``."""
+    text = as_text(values).str.replace(r"^(\d{1,2}:\d{2}):\d{2}$", r"\1", regex=True)
+    minutes = hhmm_to_minutes(text)
+    return minutes, _format_minutes(minutes)
+
+
+class Normalized:
+    """
+    Rows of one chunk ready to append with their file row numbers, plus the
+    rejected ones with a reason.
+    """
+
+    def __init__(self, rows: list[list], rejected: pd.DataFrame, row_numbers: list[int] = None):
+        self.rows = rows
+        self.rejected = rejected
+        self.row_numbers = row_numbers if row_numbers is not None else []
+
+
+def _reject(reasons: pd.Series, mask: pd.Series, reason: str):
+    """Record ``reason`` for the rows of ``mask`` that have none yet."""
+    reasons.loc[mask & (reasons == "")] = reason
+
+
+def normalize_chunk(
+    table: str, chunk: pd.DataFrame, first_row: int = 2, registry: MachineRegistry = None
+) -> Normalized:
+    """
+    Normalise a chunk of a source file (string cells, original headers) into
+    rows of ``table``. ``first_row`` is the file row number of the first
+    data row, used in the rejected report. With a ``registry`` only its
+    machines are accepted.
+    """
+    source = chunk.reset_index(drop=True)
+    data = source.rename(columns=column_key)
+    data = data.loc[:, ~data.columns.duplicated()]
+    columns = TABLE_COLUMNS[table]
+    for col in columns:
+        if col not in data.columns:
+            data[col] = ""
+    data = data[columns].apply(as_text)
+    reasons = pd.Series("", index=data.index, dtype=object)
+    out = pd.DataFrame(index=data.index)
+
+    maquina = to_int(data["maquina"])
+    _reject(reasons, maquina.isna() | (maquina < 1), "La máquina debe ser un número entero positivo")
+    if registry is not None:
+        _reject(reasons, ~maquina.isin(registry.machines()).fillna(False), "Máquina no dada de alta en MAQUINAS")
+    turno = to_int(data["turno"]).astype("string").fillna("")
+    _reject(reasons, (data["turno"] != "") & ~turno.isin(["1", "2", "3"]), "El turno debe ser 1, 2 o 3")
+    ini, ini_text = _times(data["hora_inicio"])
+    fin, fin_text = _times(data["hora_fin"])
+
+    if table == SHEET_PRODUCCION:
+        fecha_inicio = _dates(data["fecha_inicio"])
+        _reject(reasons, fecha_inicio.isna(), "Fecha inicio no válida")
+        _reject(reasons, turno == "", "Debes indicar el turno")
+        _reject(reasons, ~data["tipo_produccion"].isin(TIPOS_PRODUCCION), "Tipo de producción desconocido")
+        _reject(reasons, ini.isna(), "La hora inicio debe tener formato HH:MM")
+        _reject(reasons, fin.isna(), "La hora fin debe tener formato HH:MM")
+        # Como en el formulario: si la hora de fin es anterior, acaba al día siguiente
+        fecha_fin = _dates(data["fecha_fin"])
+        derived = fecha_inicio + pd.to_timedelta((fin < ini).astype(int), unit="D")
+        fecha_fin = fecha_fin.where(data["fecha_fin"] != "", derived)
+        _reject(reasons, fecha_fin.isna(), "Fecha fin no válida")
+        peso = to_float(data["peso"])
+        _reject(reasons, (data["peso"] != "") & peso.isna(), "Peso no válido")
+        taras = to_int(data["taras"])
+        _reject(reasons, (data["taras"] != "") & taras.isna(), "Taras no válidas")
+        out = data.assign(
+            fecha_inicio=_format_dates(fecha_inicio),
+            fecha_fin=_format_dates(fecha_fin),
+            turno=turno.astype(object),
+            hora_inicio=ini_text,
+            hora_fin=fin_text,
+            peso=peso.fillna(0.0).astype(object),
+            taras=taras.fillna(0).astype(object),
+        )
+    else:
+        fecha = _dates(data["fecha"])
+        _reject(reasons, fecha.isna(), "Fecha no válida")
+        _reject(reasons, ~data["tipo"].isin(TIPOS_EVENTO), "Tipo de evento desconocido")
+        # Solo una limpieza (carga de filetas) puede ir sin horas
+        sin_horas = (data["hora_inicio"] == "") & (data["hora_fin"] == "") & (data["tipo"] == "Limpieza")
+        _reject(reasons, ~sin_horas & (ini.isna() | fin.isna()), "Las horas deben tener formato HH:MM")
+        fecha_text = _format_dates(fecha)
+        minutos = span_minutes(fecha_text, ini_text, fin_text)
+        out = data.assign(
+            fecha=fecha_text,
+            turno=turno.astype(object),
+            hora_inicio=ini_text,
+            hora_fin=fin_text,
+            minutos=minutos.astype(object).where(minutos.notna(), ""),
+        )
+
+    out["maquina"] = maquina.astype(object)
+    valid = reasons == ""
+    rejected = source[~valid].copy()
+    rejected.insert(0, REASON_COLUMN, reasons[~valid])
+    rejected.insert(0, ROW_COLUMN, np.flatnonzero(~valid) + first_row)
+    rows = out.loc[valid, columns].astype(object).values.tolist()
+    return Normalized(rows, rejected, (np.flatnonzero(valid) + first_row).tolist())
+
+
+# -----------------------------------------------------------------------------
+# Jobs
+# -----------------------------------------------------------------------------
+
+def state_path_for(source: str) -> str:
+    return f"{source}.importacion.json"
+
+
+def rejected_path_for(source: str) -> str:
+    return f"{source}.rechazadas.csv"
+
+
+class ImportProgress:
+    """Saved position of an import: source rows read, rows written and rejected."""
+
+    def __init__(self, table: str, source_size: int, source_mtime: float):
+        self.table = table
+        self.source_size = source_size
+        self.source_mtime = source_mtime
+        self.done = 0
+        self.written = 0
+        self.rejected = 0
+        self.total = None
+        self.finished = False
+        # Size of the rejected report up to the last chunk recorded
+        self.rejected_bytes = 0
+        # Chunk sent to the sheet but not yet confirmed: (done, rejected and
+        # rejected_bytes after it, rows)
+        self.pending = None
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ImportProgress":
+        progress = cls(data["table"], data["source_size"], data["source_mtime"])
+        progress.__dict__.update(data)
+        return progress
+
+
+class ImportJob:
+    """
+    Import of one CSV or Excel ``source`` into ``table`` through ``backend``,
+    resumable from its progress file.
+    """
+
+    def __init__(
+        self,
+        backend,
+        table: str,
+        source: str,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        kpis=None,
+        restart: bool = False,
+    ):
+        if table not in IMPORT_TABLES:
+            raise ValueError(f"Solo se puede importar en {', '.join(IMPORT_TABLES)}")
+        self.backend = backend
+        self.table = table
+        self.source = source
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.kpis = kpis
+        self.state_path = state_path_for(source)
+        self.rejected_path = rejected_path_for(source)
+        self.progress = self._load_progress(restart)
+        source_id = f"{os.path.abspath(source)}:{self.progress.source_size}:{self.progress.source_mtime}"
+        self._key_prefix = f"importacion:{table}:{hashlib.sha1(source_id.encode()).hexdigest()[:16]}"
+
+    def _load_progress(self, restart: bool) -> ImportProgress:
+        stat = os.stat(self.source)
+        fresh = ImportProgress(self.table, stat.st_size, stat.st_mtime)
+        if restart or not os.path.exists(self.state_path):
+            if os.path.exists(self.rejected_path):
+                os.remove(self.rejected_path)
+            return fresh
+        with open(self.state_path, encoding="utf-8") as f:
+            data = json.load(f)
+        progress = ImportProgress.from_dict(data)
+        if "rejected_bytes" not in data and os.path.exists(self.rejected_path):
+            # Progreso guardado antes de llevar la cuenta: el informe es válido
+            progress.rejected_bytes = os.path.getsize(self.rejected_path)
+        saved = (progress.table, progress.source_size, progress.source_mtime)
+        if saved != (fresh.table, fresh.source_size, fresh.source_mtime):
+            raise RuntimeError(
+                "El fichero o la hoja no coinciden con la importación guardada; "
+                "vuelve a empezar con --reiniciar"
+            )
+        return progress
+
+    def _save(self):
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.progress.to_dict(), f, ensure_ascii=False, default=str)
+        os.replace(tmp, self.state_path)
+
+    def _confirm_pending(self):
+        """Settle a chunk whose write was interrupted before being recorded."""
+        done, *report, rows = self.progress.pending
+        tail = self.backend.get_all(self.table).tail(len(rows)).values.tolist()
+        if same_rows(rows, tail):
+            logger.info("El bloque interrumpido ya estaba guardado (%s filas)", len(rows))
+            self._written(done, rows, *report)
+        else:
+            logger.info("El bloque interrumpido no llegó a guardarse; se volverá a enviar")
+            self.progress.pending = None
+            self._save()
+
+    def _written(self, done: int, rows: list, rejected: int = None, rejected_bytes: int = None):
+        """Record a chunk as written, with the rejections counted up to it."""
+        self.progress.done = done
+        self.progress.written += len(rows)
+        if rejected is not None:
+            self.progress.rejected = rejected
+            self.progress.rejected_bytes = rejected_bytes
+        self.progress.pending = None
+        self._save()
+        if self.kpis is not None:
+            try:
+                self.kpis.add_rows(self.table, rows)
+            except Exception:
+                logger.exception("No se pudieron actualizar los indicadores de %s", self.table)
+
+    def _write_rejected(self, rejected: pd.DataFrame) -> int:
+        """
+        Append ``rejected`` to the report after the rows of the recorded
+        chunks (those of a chunk read again are dropped first) and return
+        the new size of the report.
+        """
+        size = self.progress.rejected_bytes
+        if os.path.exists(self.rejected_path) and os.path.getsize(self.rejected_path) > size:
+            with open(self.rejected_path, "r+b") as f:
+                f.truncate(size)
+        if rejected.empty:
+            return size
+        rejected.to_csv(self.rejected_path, mode="a", header=size == 0, index=False, quoting=csv.QUOTE_MINIMAL)
+        return os.path.getsize(self.rejected_path)
+
+    def run(self, progress=None) -> ImportProgress:
+        """
+        Import the rest of the file. ``progress`` is called with the
+        ``ImportProgress`` after every chunk.
+        """
+        state = self.progress
+        if state.finished:
+            return state
+        if state.pending:
+            self._confirm_pending()
+        state.total = count_rows(self.source)
+        registry = MachineRegistry.from_frame(self.backend.get_all(SHEET_MAQUINAS))
+        for chunk in read_chunks(self.source, self.chunk_rows, skip=state.done):
+            missing = [c for c in REQUIRED_COLUMNS[self.table] if c not in {column_key(h) for h in chunk.columns}]
+            if missing:
+                raise ValueError(f"Faltan columnas en el fichero: {', '.join(missing)}")
+            normalized = normalize_chunk(self.table, chunk, first_row=state.done + 2, registry=registry)
+            done = state.done + len(chunk)
+            # The rejections count once the chunk is recorded, with it
+            rejected = state.rejected + len(normalized.rejected)
+            rejected_bytes = self._write_rejected(normalized.rejected)
+            if normalized.rows:
+                state.pending = (done, rejected, rejected_bytes, normalized.rows)
+                self._save()
+                keys = [f"{self._key_prefix}:{n}" for n in normalized.row_numbers]
+                # Only the rows stored count (a repeated key is dropped)
+                stored = self.backend.append_rows(self.table, normalized.rows, keys)
+                self._written(done, stored, rejected, rejected_bytes)
+            else:
+                state.done = done
+                state.rejected = rejected
+                state.rejected_bytes = rejected_bytes
+                self._save()
+            if progress is not None:
+                progress(state)
+        state.finished = True
+        self._save()
+        return state
+
+
+def import_dir_from_env() -> str:
+    return os.environ.get("BICOPACK_IMPORT_DIR", "").strip() or DEFAULT_IMPORT_DIR
+
+
+def main(argv=None):
+    """Import a CSV or Excel file into PRODUCCION or EVENTOS."""
+    from bicopack.kpis import kpi_store_from_env
+    from bicopack.storage import backend_from_env
+
+    parser = argparse.ArgumentParser(description="Importa histórico de producción o incidencias desde CSV o Excel")
+    parser.add_argument("tabla", choices=IMPORT_TABLES)
+    parser.add_argument("fichero")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK_ROWS, help="filas por bloque escrito")
+    parser.add_argument("--reiniciar", action="store_true", help="ignorar el progreso guardado y empezar de cero")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    job = ImportJob(
+        backend_from_env(shared=False),
+        args.tabla,
+        args.fichero,
+        chunk_rows=args.chunk,
+        kpis=kpi_store_from_env(),
+        restart=args.reiniciar,
+    )
+
+    def report(state: ImportProgress):
+        total = f"/{state.total}" if state.total else ""
+        logger.info("%s%s filas leídas · %s guardadas · %s rechazadas", state.done, total, state.written, state.rejected)
+
+    try:
+        state = job.run(report)
+    finally:
+        # Los paneles abiertos recargan la tabla (también tras un corte)
+        record_changes([args.tabla])
+    logger.info("Importación terminada: %s filas guardadas, %s rechazadas", state.written, state.rejected)
+    if state.rejected:
+        logger.info("Filas rechazadas en %s", job.rejected_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+import pandas as pd
+
+from bicopack.archive import read_range
+from bicopack.core import SHEET_EVENTOS, SHEET_PRODUCCION, TABLE_COLUMNS, clean_row
+from bicopack.dates import combine_fecha_hora, format_fecha
+from bicopack.schema import MAQUINA_DESCONOCIDA, apply_schema
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Indicadores por máquina, turno y día
+#
+# Materialised rollups of PRODUCCION and EVENTOS in a SQLite file, one row
+# per date, shift and machine:
+#   • ``produccion``  closed runs, kg, taras and minutes producing;
+#   • ``paradas``     events and stopped minutes per event type (cause).
+# Both hold only additive measures, so a new row is folded in with an
+# UPSERT that adds its values (``KpiStore.add_rows``, called by the write
+# helpers of ``bicopack.ui``) and days or machines are just sums of shifts.
+# The full history (sheets plus archive) is only read to build the store
+# the first time or to rebuild it after the sheets were edited by hand
+# (``python -m bicopack.kpis``).
+#
+# ``kpi_frame`` turns the rollups into the indicators shown by the
+# dashboard: availability (planned shift time minus stopped time, over
+# planned time; the sheets have no ideal rate or reject counts, so this is
+# the only OEE factor that can be computed), kg per hour producing and the
+# stopped minutes of each cause.
+#
+# Environment variables used:
+#   BICOPACK_KPI_PATH   SQLite file of the rollups (default: bicopack_kpis.db).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KPI_PATH = "bicopack_kpis.db"
+
+KPI_TABLES = (SHEET_PRODUCCION, SHEET_EVENTOS)
+
+# Tiempo planificado de una máquina en un turno
+MINUTOS_TURNO = 8 * 60
+
+KEY_COLUMNS = ["fecha", "turno", "maquina"]
+PRODUCCION_MEASURES = ["producciones", "peso", "taras", "minutos_produccion"]
+PARADAS_MEASURES = ["eventos", "minutos"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS produccion (
+    fecha TEXT NOT NULL,
+    turno TEXT NOT NULL,
+    maquina INTEGER NOT NULL,
+    producciones INTEGER NOT NULL,
+    peso REAL NOT NULL,
+    taras INTEGER NOT NULL,
+    minutos_produccion INTEGER NOT NULL,
+    PRIMARY KEY (fecha, turno, maquina)
+);
+CREATE TABLE IF NOT EXISTS paradas (
+    fecha TEXT NOT NULL,
+    turno TEXT NOT NULL,
+    maquina INTEGER NOT NULL,
+    tipo TEXT NOT NULL,
+    eventos INTEGER NOT NULL,
+    minutos INTEGER NOT NULL,
+    PRIMARY KEY (fecha, turno, maquina, tipo)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _keys(fecha: pd.Series, typed: pd.DataFrame) -> pd.DataFrame:
+    """Date, shift and machine of each row; rows without them are dropped."""
+    keys = pd.DataFrame({
+        "fecha": fecha.dt.strftime("%Y-%m-%d"),
+        "turno": typed["turno"].astype(str),
+        "maquina": typed["maquina_norm"],
+    }, index=typed.index)
+    return keys[keys["fecha"].notna() & (keys["maquina"] != MAQUINA_DESCONOCIDA)]
+
+
+def produccion_rollup(typed: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shift rollup of typed PRODUCCION rows. A run counts on the date and
+    shift it started; its minutes go from start to end (an end without a
+    date of its own rolls over to the next day, like ``compute_minutes``).
+    """
+    if typed.empty:
+        return pd.DataFrame(columns=KEY_COLUMNS + PRODUCCION_MEASURES)
+    fecha_inicio = typed["fecha_inicio"].fillna(typed["fecha_fin"])
+    start = combine_fecha_hora(fecha_inicio, typed["hora_inicio"], default_hora=None)
+    end = combine_fecha_hora(typed["fecha_fin"].fillna(fecha_inicio), typed["hora_fin"], default_hora=None)
+    end = end.where(~(end < start), end + pd.Timedelta(days=1))
+    minutos = ((end - start).dt.total_seconds() // 60).fillna(0)
+    keys = _keys(fecha_inicio, typed)
+    data = keys.assign(
+        producciones=1,
+        peso=typed["peso"].fillna(0.0),
+        taras=typed["taras"].fillna(0).astype("int64"),
+        minutos_produccion=minutos.astype("int64"),
+    )
+    return data.groupby(KEY_COLUMNS, as_index=False, observed=True)[PRODUCCION_MEASURES].sum()
+
+
+def paradas_rollup(typed: pd.DataFrame) -> pd.DataFrame:
+    """Shift rollup of typed EVENTOS rows, per event type."""
+    if typed.empty:
+        return pd.DataFrame(columns=KEY_COLUMNS + ["tipo"] + PARADAS_MEASURES)
+    keys = _keys(typed["fecha"], typed)
+    data = keys.assign(
+        tipo=typed["tipo"].astype(str),
+        eventos=1,
+        minutos=typed["minutos"].fillna(0).astype("int64"),
+    )
+    return data.groupby(KEY_COLUMNS + ["tipo"], as_index=False, observed=True)[PARADAS_MEASURES].sum()
+
+
+ROLLUPS = {
+    SHEET_PRODUCCION: ("produccion", produccion_rollup, PRODUCCION_MEASURES),
+    SHEET_EVENTOS: ("paradas", paradas_rollup, PARADAS_MEASURES),
+}
+
+
+class KpiStore:
+    """
+    Rollup tables in a SQLite file shared by every process of the host.
+    Until ``rebuild`` has run once, ``add_rows`` does nothing: the first
+    build reads the whole history anyway.
+    """
+
+    def __init__(self, path: str = DEFAULT_KPI_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def built_at(self):
+        """``time.time()`` of the last rebuild, or None if never built."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'built_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def _fold(self, table: str, typed: pd.DataFrame):
+        name, rollup, measures = ROLLUPS[table]
+        data = rollup(typed)
+        if data.empty:
+            return
+        keys = [c for c in data.columns if c not in measures]
+        cols = keys + measures
+        updates = ", ".join(f"{m} = {m} + excluded.{m}" for m in measures)
+        self._conn.executemany(
+            f"INSERT INTO {name} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}",
+            [clean_row(r) for r in data[cols].itertuples(index=False)],
+        )
+
+    def _transaction(self, func):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                func()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add_rows(self, table: str, rows: list[list]):
+        """Fold rows just written to PRODUCCION or EVENTOS into the rollups."""
+        if table not in ROLLUPS or not rows or self.built_at() is None:
+            return
+        columns = TABLE_COLUMNS[table]
+        rows = [(clean_row(r) + [""] * len(columns))[: len(columns)] for r in rows]
+        typed = apply_schema(table, pd.DataFrame(rows, columns=columns))
+        self._transaction(lambda: self._fold(table, typed))
+
+    def rebuild(self, frames: dict):
+        """Replace the rollups with the ones of the typed full-history ``frames``."""
+
+        def build():
+            for table, (name, _, _) in ROLLUPS.items():
+                self._conn.execute(f"DELETE FROM {name}")
+                self._fold(table, frames[table])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('built_at', ?)", (str(time.time()),)
+            )
+
+        self._transaction(build)
+
+    def _select(self, name: str, since=None, until=None, maquinas=None) -> pd.DataFrame:
+        where, params = [], []
+        if since is not None:
+            where.append("fecha >= ?")
+            params.append(format_fecha(since))
+        if until is not None:
+            where.append("fecha <= ?")
+            params.append(format_fecha(until))
+        if maquinas:
+            where.append(f"maquina IN ({', '.join('?' for _ in maquinas)})")
+            params.extend(int(m) for m in maquinas)
+        sql = f"SELECT * FROM {name}" + (" WHERE " + " AND ".join(where) if where else "")
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def produccion(self, since=None, until=None, maquinas=None) -> pd.DataFrame:
+        """Production rollup rows between two dates (both included)."""
+        return self._select("produccion", since, until, maquinas)
+
+    def paradas(self, since=None, until=None, maquinas=None) -> pd.DataFrame:
+        """Stoppage rollup rows between two dates (both included)."""
+        return self._select("paradas", since, until, maquinas)
+
+
+def kpi_frame(produccion: pd.DataFrame, paradas: pd.DataFrame, by=KEY_COLUMNS) -> pd.DataFrame:
+    """
+    Indicators grouped by ``by`` (any of "fecha", "turno", "maquina"):
+    totals, availability, kg per hour and one column of stopped minutes per
+    event type. The planned time of a group is one shift per date, shift
+    and machine with activity.
+    """
+    by = list(by)
+    cols = list(dict.fromkeys(KEY_COLUMNS + by))
+    cells = pd.concat([produccion[cols], paradas[cols]]).drop_duplicates()
+    if cells.empty:
+        return pd.DataFrame(columns=by + PRODUCCION_MEASURES + ["minutos_parada", "disponibilidad", "kg_hora"])
+    result = cells.groupby(by).size().rename("turnos").to_frame()
+    result = result.join(produccion.groupby(by)[PRODUCCION_MEASURES].sum())
+    causas = paradas.pivot_table(index=by, columns="tipo", values="minutos", aggfunc="sum")
+    result = result.join(causas.add_prefix("min. ")).fillna(0)
+    result["minutos_parada"] = paradas.groupby(by)["minutos"].sum().reindex(result.index).fillna(0)
+    counts = [c for c in result.columns if c != "peso"]
+    result[counts] = result[counts].astype("int64")
+    planificado = result["turnos"] * MINUTOS_TURNO
+    result["disponibilidad"] = (1 - result["minutos_parada"] / planificado).clip(lower=0, upper=1)
+    horas = result["minutos_produccion"] / 60
+    result["kg_hora"] = (result["peso"] / horas).where(horas > 0)
+    return result.reset_index()
+
+
+def kpi_store_from_env() -> KpiStore:
+    """The rollup store in ``BICOPACK_KPI_PATH``."""
+    return KpiStore(os.environ.get("BICOPACK_KPI_PATH", "").strip() or DEFAULT_KPI_PATH)
+
+
+def history_frames(backend, archive) -> dict:
+    """Typed full history of PRODUCCION and EVENTOS: sheets plus archive."""
+    frames = backend.get_many(list(KPI_TABLES))
+    return {
+        table: read_range(table, apply_schema(table, frames[table]), archive)
+        for table in KPI_TABLES
+    }
+
+
+def main():
+    """Rebuild the rollups from the full history."""
+    from bicopack.archive import archive_from_env
+    from bicopack.storage import backend_from_env
+
+    logging.basicConfig(level=logging.INFO)
+    store = kpi_store_from_env()
+    frames = history_frames(backend_from_env(shared=False), archive_from_env())
+    store.rebuild(frames)
+    logger.info(
+        "Indicadores recalculados en %s (%s producciones, %s eventos)",
+        store.path, len(frames[SHEET_PRODUCCION]), len(frames[SHEET_EVENTOS]),
+    )
+
+
+if __name__ == "__main__":
+    main()
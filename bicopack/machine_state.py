@@ -0,0 +1,226 @@
+import threading
+
+import pandas as pd
+
+from bicopack.core import MAQUINAS_COLS, SHEET_EN_CURSO, SHEET_EVENTOS, SHEET_MAQUINAS, TABLE_COLUMNS, clean_row
+from bicopack.registry import MachineRegistry
+from bicopack.schema import MAQUINA_DESCONOCIDA, apply_schema
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Estado por máquina
+#
+# One entry per machine number (``maquina_norm``) with its configuration from
+# MAQUINAS, its open production runs from EN_CURSO and its last EVENTOS row.
+# Each part is built from the table cache once per data version and then
+# kept up to date in place when the app starts or closes a production, logs
+# an event or saves a machine configuration, so the forms and the machine
+# status panel look a machine up instead of scanning the frames on every
+# rerun. The machine registry (``bicopack.registry``: which machines exist
+# and their line and plant) is built from MAQUINAS along with the
+# configuration.
+# -----------------------------------------------------------------------------
+
+STATE_TABLES = (SHEET_MAQUINAS, SHEET_EN_CURSO, SHEET_EVENTOS)
+
+CONFIG_FIELDS = ("tipo_produccion", "lote_of", "lote_mp")
+
+
+class MachineState:
+    """Configuration, open runs and last event of one machine."""
+
+    def __init__(self, maquina: int, config: dict = None, open_runs: list = None, last_event: dict = None):
+        self.maquina = maquina
+        self.config = config
+        self.open_runs = open_runs or []
+        self.last_event = last_event
+
+    @property
+    def open_run(self):
+        """First open EN_CURSO row of the machine (as a dict), or None."""
+        return self.open_runs[0] if self.open_runs else None
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.open_runs)
+
+    def config_value(self, field: str) -> str:
+        """A configuration field as text ("" when the machine has none)."""
+        if not self.config:
+            return ""
+        return _text(self.config.get(field, ""))
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    try:
+        if pd.isna(value):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(value).strip()
+
+
+def _records(df: pd.DataFrame) -> list[dict]:
+    return df.to_dict("records") if df is not None and not df.empty else []
+
+
+def _typed_record(table: str, row: list) -> dict:
+    """Type a row written by the app the same way as the cached tables."""
+    columns = TABLE_COLUMNS[table]
+    row = (clean_row(row) + [""] * len(columns))[: len(columns)]
+    return _records(apply_schema(table, pd.DataFrame([row], columns=columns)))[0]
+
+
+class MachineStateIndex:
+    """
+    Per-machine state shared by every session. Each part of the state comes
+    from one table (configuration from MAQUINAS, open runs from EN_CURSO,
+    last event from EVENTOS) and is rebuilt on its own by ``sync`` when the
+    cached version of that table differs from the one it was built from.
+    The ``apply_*`` methods mirror the write-through patches of
+    ``TableCache``: they take the version returned by the cache and update
+    the index in place only if it was in sync with the previous version;
+    otherwise that part is left stale and the next ``sync`` rebuilds it.
+    """
+
+    def __init__(self):
+        self._configs = {}
+        self._registry = MachineRegistry.from_frame(None)
+        self._open_runs = {}
+        self._last_events = {}
+        self._bobinas = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    # -- build ----------------------------------------------------------------
+
+    def sync(self, cache, tables=STATE_TABLES) -> "MachineStateIndex":
+        """
+        Rebuild the parts of the index whose table (among ``tables``)
+        changed version in ``cache``. Pages that only need some of the
+        state pass just those tables, so the others are not loaded.
+        """
+        tables = [t for t in tables if t in STATE_TABLES]
+        with self._lock:
+            stale = [t for t in tables if cache.version(t) != self._versions.get(t)]
+        if stale:
+            frames, versions = cache.snapshot(stale)
+            self.build(frames, versions)
+        return self
+
+    def build(self, frames: dict, versions: dict = None):
+        """Rebuild the parts of the index for the typed frames in ``frames``."""
+        versions = versions or {}
+        for table, frame in frames.items():
+            if table in STATE_TABLES:
+                self._build_table(table, frame, versions.get(table))
+
+    def _build_table(self, table: str, frame: pd.DataFrame, version):
+        if table == SHEET_MAQUINAS:
+            # Como antes, manda la primera fila de cada máquina
+            first = frame.drop_duplicates("maquina_norm", keep="first") if not frame.empty else frame
+            configs = {rec["maquina_norm"]: rec for rec in _records(first)}
+            configs.pop(MAQUINA_DESCONOCIDA, None)
+            registry = MachineRegistry.from_frame(frame)
+            with self._lock:
+                self._configs = configs
+                self._registry = registry
+                self._versions[table] = version
+        elif table == SHEET_EN_CURSO:
+            open_runs = {}
+            bobinas = {}
+            for rec in _records(frame):
+                open_runs.setdefault(rec["maquina_norm"], []).append(rec)
+                if rec.get("bobina_id"):
+                    bobinas[rec["bobina_id"]] = rec["maquina_norm"]
+            open_runs.pop(MAQUINA_DESCONOCIDA, None)
+            with self._lock:
+                self._open_runs = open_runs
+                self._bobinas = bobinas
+                self._versions[table] = version
+        elif table == SHEET_EVENTOS:
+            last = frame.drop_duplicates("maquina_norm", keep="last") if not frame.empty else frame
+            last_events = {rec["maquina_norm"]: rec for rec in _records(last)}
+            last_events.pop(MAQUINA_DESCONOCIDA, None)
+            with self._lock:
+                self._last_events = last_events
+                self._versions[table] = version
+
+    # -- lookups --------------------------------------------------------------
+
+    def get(self, maquina: int) -> MachineState:
+        """State of ``maquina`` (an empty state if nothing is known about it)."""
+        with self._lock:
+            return MachineState(
+                maquina,
+                config=self._configs.get(maquina),
+                open_runs=list(self._open_runs.get(maquina, [])),
+                last_event=self._last_events.get(maquina),
+            )
+
+    @property
+    def registry(self) -> MachineRegistry:
+        """The registered machines with their line and plant."""
+        with self._lock:
+            return self._registry
+
+    # -- in-place updates -----------------------------------------------------
+
+    def _advance(self, table: str, version) -> bool:
+        if version is None or self._versions.get(table) != version - 1:
+            return False
+        self._versions[table] = version
+        return True
+
+    def apply_append(self, table: str, row: list, version):
+        """Record a new EN_CURSO (start) or EVENTOS row written by the app."""
+        if table not in (SHEET_EN_CURSO, SHEET_EVENTOS) or version is None:
+            # Not cached: there is nothing to keep in step
+            return
+        rec = _typed_record(table, row)
+        maquina = rec["maquina_norm"]
+        with self._lock:
+            if not self._advance(table, version) or maquina == MAQUINA_DESCONOCIDA:
+                return
+            if table == SHEET_EN_CURSO:
+                self._open_runs[maquina] = self._open_runs.get(maquina, []) + [rec]
+                if rec.get("bobina_id"):
+                    self._bobinas[rec["bobina_id"]] = maquina
+            else:
+                self._last_events[maquina] = rec
+
+    def apply_delete_bobina(self, bobina_id, version):
+        """Drop the open run ``bobina_id`` after a close or a deletion."""
+        target = str(bobina_id).strip()
+        with self._lock:
+            if not self._advance(SHEET_EN_CURSO, version):
+                return
+            maquina = self._bobinas.pop(target, None)
+            if maquina in self._open_runs:
+                remaining = [r for r in self._open_runs[maquina] if r.get("bobina_id") != target]
+                if remaining:
+                    self._open_runs[maquina] = remaining
+                else:
+                    del self._open_runs[maquina]
+
+    def apply_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str, version):
+        """Record a saved machine configuration."""
+        self.apply_maquinas([[maquina, tipo_produccion, lote_of, lote_mp]], version)
+
+    def apply_maquinas(self, rows: list[list], version):
+        """
+        Record several machine configurations saved together (one cache
+        version). Rows follow the MAQUINAS columns and may stop early.
+        """
+        with self._lock:
+            if not self._advance(SHEET_MAQUINAS, version):
+                return
+            for row in rows:
+                values = dict(zip(MAQUINAS_COLS, row))
+                maquina = int(values.pop("maquina"))
+                config = dict(self._configs.get(maquina) or {"maquina": maquina, "maquina_norm": maquina})
+                config.update({k: str(v).strip() for k, v in values.items()})
+                self._configs[maquina] = config
+            self._registry = self._registry.with_machines(rows)
@@ -0,0 +1,336 @@
+import os
+import re
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Métricas
+#
+# In-process counters and histograms for the hot paths of the app:
+#   • ``bicopack_span_seconds``            timing spans (page bodies, data
+#                                          loads, ``gs_*`` helpers);
+#   • ``bicopack_sheets_requests_total``   Sheets API calls per worksheet,
+#                                          method and HTTP status;
+#   • ``bicopack_sheets_request_seconds``  their latency;
+#   • ``bicopack_sheets_retries_total``, ``bicopack_sheets_rejected_total``
+#     and ``bicopack_sheets_quota_wait_seconds_total`` from the quota policy;
+#   • ``bicopack_cache_requests_total``    table cache hits and misses.
+# ``render`` writes them in the Prometheus text format, served on
+# ``BICOPACK_METRICS_PORT`` (``/metrics``) and/or rewritten every few
+# seconds to ``BICOPACK_METRICS_FILE`` (for the node exporter textfile
+# collector). Spans also go to the trace of the current rerun, which the
+# hidden diagnostics panel (``?diagnostico=1``) shows.
+#
+# Environment variables used:
+#   BICOPACK_METRICS_PORT           Port of the local /metrics endpoint
+#                                   (disabled when empty).
+#   BICOPACK_METRICS_HOST           Address it listens on (default: 127.0.0.1).
+#   BICOPACK_METRICS_FILE           File rewritten with the metrics
+#                                   (disabled when empty).
+#   BICOPACK_METRICS_FILE_SECONDS   Seconds between rewrites (default: 15).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_FILE_SECONDS = 15
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labels: tuple, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    """Counters and histograms keyed by metric name and label values."""
+
+    def __init__(self):
+        self._meta = {}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            self._meta[name] = (kind, help_text, tuple(buckets))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._meta[name][2]
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self, name: str) -> list[dict]:
+        """
+        Current values of ``name`` as dicts of its labels plus ``value``
+        (counters) or ``count`` and ``sum`` (histograms).
+        """
+        with self._lock:
+            kind = self._meta[name][0]
+            items = [(k[1], v) for k, v in self._values.items() if k[0] == name]
+        rows = []
+        for labels, value in sorted(items):
+            row = dict(labels)
+            if kind == HISTOGRAM:
+                row.update(count=value[2], sum=value[1])
+            else:
+                row["value"] = value
+            rows.append(row)
+        return rows
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            meta = dict(self._meta)
+            values = {k: (list(v[0]), v[1], v[2]) if isinstance(v, list) else v for k, v in self._values.items()}
+        lines = []
+        for name in sorted(meta):
+            kind, help_text, buckets = meta[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(values.items()):
+                if metric != name:
+                    continue
+                if kind == COUNTER:
+                    lines.append(f"{name}{_labels_text(labels)} {_number(value)}")
+                    continue
+                counts, total, count = value
+                for bound, n in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_labels_text(labels, (('le', _number(bound)),))} {n}")
+                lines.append(f"{name}_bucket{_labels_text(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels_text(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+REGISTRY = Registry()
+
+SPAN_SECONDS = "bicopack_span_seconds"
+SHEETS_REQUESTS = "bicopack_sheets_requests_total"
+SHEETS_SECONDS = "bicopack_sheets_request_seconds"
+SHEETS_RETRIES = "bicopack_sheets_retries_total"
+SHEETS_REJECTED = "bicopack_sheets_rejected_total"
+SHEETS_QUOTA_WAIT = "bicopack_sheets_quota_wait_seconds_total"
+CACHE_REQUESTS = "bicopack_cache_requests_total"
+
+REGISTRY.describe(SPAN_SECONDS, HISTOGRAM, "Duration of instrumented blocks (pages, loads, helpers).")
+REGISTRY.describe(SHEETS_REQUESTS, COUNTER, "Google Sheets API requests by worksheet, method and status.")
+REGISTRY.describe(SHEETS_SECONDS, HISTOGRAM, "Latency of Google Sheets API requests.")
+REGISTRY.describe(SHEETS_RETRIES, COUNTER, "Google Sheets requests retried after a transient error.")
+REGISTRY.describe(SHEETS_REJECTED, COUNTER, "Google Sheets requests rejected without being sent.")
+REGISTRY.describe(SHEETS_QUOTA_WAIT, COUNTER, "Seconds spent waiting for the Sheets quota.")
+REGISTRY.describe(CACHE_REQUESTS, COUNTER, "Table cache lookups by table and result (hit or miss).")
+
+
+# -----------------------------------------------------------------------------
+# Spans and rerun traces
+# -----------------------------------------------------------------------------
+
+_local = threading.local()
+
+
+class Trace:
+    """Spans recorded by one thread since ``start_trace``, in start order."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+
+
+def start_trace() -> Trace:
+    """Start collecting the spans of this thread (one Streamlit rerun)."""
+    _local.trace = Trace()
+    return _local.trace
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into ``bicopack_span_seconds`` and the current trace."""
+    trace = current_trace()
+    entry = None
+    if trace is not None:
+        entry = {"span": name, "start": time.perf_counter() - trace.started, "depth": trace.depth, "seconds": None}
+        trace.spans.append(entry)
+        trace.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe(SPAN_SECONDS, elapsed, span=name)
+        if entry is not None:
+            entry["seconds"] = elapsed
+            trace.depth -= 1
+
+
+def timed(name: str = None):
+    """Decorator version of ``span`` (named after the function by default)."""
+
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# -----------------------------------------------------------------------------
+# Google Sheets requests
+# -----------------------------------------------------------------------------
+
+_VALUES_RANGE = re.compile(r"/values/([^:?]+)")
+
+
+def _sheet_title(a1: str) -> str:
+    title = a1.split("!")[0]
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title
+
+
+def request_target(endpoint: str, params=None) -> str:
+    """Worksheet(s) a Sheets API request reads or writes, or its kind."""
+    match = _VALUES_RANGE.search(endpoint)
+    if match:
+        return _sheet_title(unquote(match.group(1)))
+    if endpoint.endswith("values:batchGet"):
+        ranges = (params or {}).get("ranges") or []
+        if isinstance(ranges, str):
+            ranges = [ranges]
+        return ",".join(sorted({_sheet_title(r) for r in ranges})) or "batchGet"
+    if endpoint.endswith(":batchUpdate"):
+        return "batchUpdate"
+    return "metadata"
+
+
+def record_sheets_request(sheet: str, method: str, status: str, seconds: float):
+    REGISTRY.inc(SHEETS_REQUESTS, sheet=sheet, method=method.upper(), status=status)
+    REGISTRY.observe(SHEETS_SECONDS, seconds, sheet=sheet, method=method.upper())
+
+
+def record_cache(table: str, hit: bool):
+    REGISTRY.inc(CACHE_REQUESTS, table=table, result="hit" if hit else "miss")
+
+
+# -----------------------------------------------------------------------------
+# Exporters
+# -----------------------------------------------------------------------------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve ``/metrics`` on ``host:port`` from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="bicopack-metrics", daemon=True).start()
+    return server
+
+
+class MetricsFileWriter(threading.Thread):
+    """Rewrite ``path`` with the metrics every ``interval`` seconds."""
+
+    def __init__(self, path: str, interval: float = DEFAULT_FILE_SECONDS, registry: Registry = REGISTRY):
+        super().__init__(name="bicopack-metrics-file", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop_event = threading.Event()
+
+    def write(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.registry.render())
+        os.replace(tmp, self.path)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.write()
+            except Exception:
+                logger.exception("No se pudieron escribir las métricas en %s", self.path)
+            self._stop_event.wait(self.interval)
+
+
+def start_exporters_from_env() -> list:
+    """Start the endpoint and/or file writer configured in the environment."""
+    exporters = []
+    port = os.environ.get("BICOPACK_METRICS_PORT", "").strip()
+    if port:
+        host = os.environ.get("BICOPACK_METRICS_HOST", "").strip() or "127.0.0.1"
+        try:
+            exporters.append(serve_metrics(int(port), host))
+        except OSError as exc:
+            # Otro proceso de la app ya sirve el puerto
+            logger.warning("No se pudo abrir el puerto de métricas %s: %s", port, exc)
+    path = os.environ.get("BICOPACK_METRICS_FILE", "").strip()
+    if path:
+        writer = MetricsFileWriter(
+            path, float(os.environ.get("BICOPACK_METRICS_FILE_SECONDS", DEFAULT_FILE_SECONDS))
+        )
+        writer.start()
+        exporters.append(writer)
+    return exporters
@@ -0,0 +1,510 @@
+import os
+import json
+import time
+import uuid
+import random
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+
+import pandas as pd
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_PRODUCCION,
+    TABLE_COLUMNS,
+    BobinaNotFoundError,
+    bobina_id_missing,
+    clean_row,
+    env_flag,
+)
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Cola de escrituras (outbox)
+#
+# Write-behind journal for the storage backends. Form submits are stored in a
+# local SQLite file and acknowledged immediately; a background flusher sends
+# them to the real backend, coalescing the queued rows of each sheet into a
+# single ``append_rows`` call. Every entry carries an idempotency key so a
+# retry or a double click never stores the same row twice. Closes and
+# removals of a production wait for its queued EN_CURSO append, and a close
+# is only dropped once its row is found in PRODUCCION. A close whose
+# production was closed elsewhere (neither open nor with its row stored) is
+# given up after ``MAX_CLOSE_ATTEMPTS`` and kept as a conflict to report.
+#
+# Environment variables used:
+#   BICOPACK_OUTBOX        "1" to enable the write-behind outbox.
+#   BICOPACK_OUTBOX_PATH   SQLite journal file (default: bicopack_outbox.db).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTBOX_PATH = "bicopack_outbox.db"
+
+OP_APPEND = "append"
+OP_DELETE_BOBINA = "delete_bobina"
+OP_CLOSE = "close"
+
+# Identical rows submitted within this window are treated as a double click
+DEDUP_WINDOW_SECONDS = 30
+# Time a flusher may hold a batch before another process can claim it
+LEASE_SECONDS = 120
+# Flushed entries are kept this long so their keys keep deduplicating
+KEEP_FLUSHED_SECONDS = 7 * 24 * 3600
+MAX_BACKOFF_SECONDS = 300
+# Last PRODUCCION rows searched for the row of a close already sent
+CONFIRM_TAIL_ROWS = 1000
+# Attempts before a close of a production closed elsewhere becomes a conflict
+MAX_CLOSE_ATTEMPTS = 8
+
+
+def _norm_cell(value) -> str:
+    """Normalise a cell for comparisons (10, 10.0 and "10" are equal)."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def row_fingerprint(sheet: str, row: list) -> str:
+    """Stable hash of a row's content, used to detect duplicates."""
+    payload = json.dumps([sheet] + [_norm_cell(v) for v in row], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with jitter for the ``attempts``-th retry."""
+    delay = min(MAX_BACKOFF_SECONDS, 2 ** max(attempts, 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class OutboxEntry:
+    """A queued write read back from the journal."""
+
+    def __init__(self, entry_id, op, sheet, payload, attempts):
+        self.id = entry_id
+        self.op = op
+        self.sheet = sheet
+        self.payload = json.loads(payload)
+        self.attempts = attempts
+
+
+class Outbox:
+    """
+    Durable journal of pending writes stored in SQLite. Safe to share
+    between threads and between processes: flushers claim batches with a
+    lease, so two workers never send the same entry at the same time.
+    """
+
+    def __init__(self, path: str = DEFAULT_OUTBOX_PATH):
+        self.path = path
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "idem_key TEXT NOT NULL UNIQUE, "
+            "fingerprint TEXT NOT NULL, "
+            "op TEXT NOT NULL, "
+            "sheet TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "last_error TEXT, "
+            "lease_until REAL, "
+            "lease_owner TEXT, "
+            "flushed_at REAL, "
+            "conflict_at REAL)"
+        )
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "conflict_at" not in columns:
+            # Journal created before conflicts were recorded
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN conflict_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (flushed_at, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_fingerprint ON outbox (fingerprint, created_at)")
+
+    # -- queueing -------------------------------------------------------------
+
+    def _enqueue(self, op: str, sheet: str, payload, key: str = None) -> bool:
+        fingerprint = row_fingerprint(f"{op}:{sheet}", payload if isinstance(payload, list) else [payload])
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if key is None:
+                    recent = self._conn.execute(
+                        "SELECT 1 FROM outbox WHERE fingerprint = ? AND created_at >= ? LIMIT 1",
+                        (fingerprint, now - DEDUP_WINDOW_SECONDS),
+                    ).fetchone()
+                    if recent:
+                        self._conn.execute("COMMIT")
+                        return False
+                    key = f"{fingerprint}:{uuid.uuid4().hex}"
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO outbox "
+                    "(idem_key, fingerprint, op, sheet, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, fingerprint, op, sheet, json.dumps(payload, ensure_ascii=False, default=str), now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cur.rowcount > 0
+
+    def enqueue_append(self, sheet: str, row: list, key: str = None) -> bool:
+        """
+        Queue a row to append to ``sheet``. Returns False if the same
+        idempotency key was already queued, or if no key is given and an
+        identical row was queued in the last ``DEDUP_WINDOW_SECONDS``.
+        """
+        return self._enqueue(OP_APPEND, sheet, clean_row(row), key)
+
+    def enqueue_delete_bobina(self, bobina_id) -> bool:
+        """Queue the removal of the EN_CURSO row of ``bobina_id``."""
+        bobina_id = str(bobina_id).strip()
+        return self._enqueue(OP_DELETE_BOBINA, SHEET_EN_CURSO, bobina_id, key=f"delete:{bobina_id}")
+
+    def enqueue_close(self, bobina_id, row: list) -> bool:
+        """
+        Queue the close of ``bobina_id``: ``row`` goes to PRODUCCION and the
+        EN_CURSO row is removed, in one atomic backend operation.
+        """
+        bobina_id = str(bobina_id).strip()
+        payload = {"bobina_id": bobina_id, "row": clean_row(row)}
+        return self._enqueue(OP_CLOSE, SHEET_PRODUCCION, payload, key=f"close:{bobina_id}")
+
+    # -- inspection -----------------------------------------------------------
+
+    def pending(self, sheet: str = None) -> list[OutboxEntry]:
+        """Return the entries not flushed yet, oldest first."""
+        sql = "SELECT id, op, sheet, payload, attempts FROM outbox WHERE flushed_at IS NULL AND conflict_at IS NULL"
+        params = ()
+        if sheet is not None:
+            sql += " AND sheet = ?"
+            params = (sheet,)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY id", params).fetchall()
+        return [OutboxEntry(*r) for r in rows]
+
+    def conflicts(self) -> list[OutboxEntry]:
+        """Return the entries given up as conflicts, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, op, sheet, payload, attempts FROM outbox WHERE conflict_at IS NOT NULL ORDER BY id"
+            ).fetchall()
+        return [OutboxEntry(*r) for r in rows]
+
+    def stats(self) -> dict:
+        """
+        Counts of pending, flushed and conflicting entries plus the last
+        error seen on a pending entry.
+        """
+        with self._lock:
+            pending, flushed, conflicts = self._conn.execute(
+                "SELECT COALESCE(SUM(flushed_at IS NULL AND conflict_at IS NULL), 0), "
+                "COALESCE(SUM(flushed_at IS NOT NULL), 0), COALESCE(SUM(conflict_at IS NOT NULL), 0) FROM outbox"
+            ).fetchone()
+            error = self._conn.execute(
+                "SELECT last_error FROM outbox WHERE flushed_at IS NULL AND conflict_at IS NULL "
+                "AND last_error IS NOT NULL ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        return {
+            "pending": pending,
+            "flushed": flushed,
+            "conflicts": conflicts,
+            "last_error": error[0] if error else None,
+        }
+
+    def overlay(self, sheet: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Apply the pending writes of ``sheet`` on top of a frame read from the
+        backend, so operators see their own writes before they are flushed.
+        Rows that already reached the backend are not added twice.
+        """
+        entries = self.pending()
+        if not entries:
+            return df
+        columns = TABLE_COLUMNS[sheet]
+        appends = [e.payload for e in entries if e.op == OP_APPEND and e.sheet == sheet]
+        deletes = set()
+        if sheet == SHEET_PRODUCCION:
+            appends += [e.payload["row"] for e in entries if e.op == OP_CLOSE]
+        if sheet == SHEET_EN_CURSO:
+            deletes = {e.payload for e in entries if e.op == OP_DELETE_BOBINA}
+            deletes |= {e.payload["bobina_id"] for e in entries if e.op == OP_CLOSE}
+        if appends:
+            present = _fingerprints(sheet, df, len(appends))
+            rows = [r for r in (_padded(sheet, r) for r in appends) if row_fingerprint(sheet, r) not in present]
+            if rows:
+                extra = pd.DataFrame(rows, columns=columns)
+                df = extra if df is None or df.empty else pd.concat([df, extra], ignore_index=True)
+        if deletes and df is not None and "bobina_id" in df.columns:
+            df = df[~df["bobina_id"].astype(str).str.strip().isin(deletes)].reset_index(drop=True)
+        return df
+
+    # -- flushing -------------------------------------------------------------
+
+    def _claim(self, limit: int) -> list[OutboxEntry]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, op, sheet, payload, attempts FROM outbox "
+                    "WHERE flushed_at IS NULL AND conflict_at IS NULL "
+                    "AND (lease_until IS NULL OR lease_until <= ?) "
+                    "ORDER BY id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                rows = self._without_blocked(rows)
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE outbox SET lease_until = ?, lease_owner = ? WHERE id = ?",
+                        [(now + LEASE_SECONDS, self.owner, r[0]) for r in rows],
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [OutboxEntry(*r) for r in rows]
+
+    def _without_blocked(self, rows: list) -> list:
+        """
+        Drop from ``rows`` the closes and removals of a bobina whose earlier
+        EN_CURSO append is still queued and not among ``rows`` (in backoff
+        or leased by another flusher): they wait for it instead of failing
+        against a sheet that does not have the production yet.
+        """
+        if not any(r[1] != OP_APPEND for r in rows):
+            return rows
+        claimed = {r[0] for r in rows}
+        opened = {}
+        for entry_id, payload in self._conn.execute(
+            "SELECT id, payload FROM outbox "
+            "WHERE flushed_at IS NULL AND conflict_at IS NULL AND op = ? AND sheet = ?",
+            (OP_APPEND, SHEET_EN_CURSO),
+        ):
+            if entry_id in claimed:
+                continue
+            bobina_id = _norm_cell((json.loads(payload) or [""])[0])
+            opened[bobina_id] = min(entry_id, opened.get(bobina_id, entry_id))
+        if not opened:
+            return rows
+        return [r for r in rows if r[1] == OP_APPEND or opened.get(_target(r[1], r[3]), r[0]) >= r[0]]
+
+    def _mark_flushed(self, entries: list[OutboxEntry]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET flushed_at = ?, lease_until = NULL, last_error = NULL WHERE id = ?",
+                [(now, e.id) for e in entries],
+            )
+
+    def _mark_failed(self, entries: list[OutboxEntry], error: Exception):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ?, lease_until = ? WHERE id = ?",
+                [(str(error)[:500], now + backoff_seconds(e.attempts + 1), e.id) for e in entries],
+            )
+
+    def _mark_conflict(self, entry: OutboxEntry, error: Exception):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ?, lease_until = NULL, conflict_at = ? "
+                "WHERE id = ?",
+                (str(error)[:500], time.time(), entry.id),
+            )
+
+    def _release(self, entries: list[OutboxEntry]):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET lease_until = NULL WHERE id = ?",
+                [(e.id,) for e in entries],
+            )
+
+    def flush(self, backend, limit: int = 500) -> int:
+        """
+        Send up to ``limit`` pending entries to ``backend``. Appends are
+        grouped per sheet into one ``append_rows`` call; removals run after
+        the appends they may depend on. Entries that were already attempted
+        are first checked against the backend so a retry never duplicates a
+        row whose previous attempt reached Google but timed out. Returns the
+        number of entries flushed.
+
+        Closes are sent with the backend's atomic ``close_production``, and
+        neither a close nor a removal is claimed while the append of its
+        production is still queued. A close whose production is no longer
+        in EN_CURSO is only marked as flushed once its row is found in
+        PRODUCCION (a previous attempt went through); otherwise it stays
+        queued with the error, and after ``MAX_CLOSE_ATTEMPTS`` it is kept
+        as a conflict (see ``conflicts``) instead of being retried forever.
+        """
+        entries = self._claim(limit)
+        if not entries:
+            return 0
+        appends = defaultdict(list)
+        deletes = []
+        for entry in entries:
+            if entry.op == OP_APPEND:
+                appends[entry.sheet].append(entry)
+            else:
+                deletes.append(entry)
+        flushed = 0
+        failed_sheets = set()
+        for sheet, group in appends.items():
+            try:
+                if any(e.attempts > 0 for e in group):
+                    written, group = self._split_written(backend, sheet, group)
+                    self._mark_flushed(written)
+                    flushed += len(written)
+                if group:
+                    backend.append_rows(sheet, [e.payload for e in group])
+            except Exception as exc:
+                logger.warning("No se pudieron enviar %d filas a %s: %s", len(group), sheet, exc)
+                self._mark_failed(group, exc)
+                failed_sheets.add(sheet)
+                continue
+            self._mark_flushed(group)
+            flushed += len(group)
+        if SHEET_EN_CURSO in failed_sheets:
+            # A removal may target a row whose append has not reached the sheet
+            self._release(deletes)
+            return flushed
+        for entry in deletes:
+            try:
+                if entry.op == OP_CLOSE:
+                    self._flush_close(backend, entry)
+                else:
+                    backend.delete_row_by_bobina(entry.payload)
+            except BobinaNotFoundError as exc:
+                if entry.attempts + 1 < MAX_CLOSE_ATTEMPTS:
+                    logger.warning("No se pudo completar %s de %s: %s", entry.op, entry.payload, exc)
+                    self._mark_failed([entry], exc)
+                else:
+                    # Cerrada desde otra sesión, la API o a mano en la hoja
+                    logger.error("Se descarta %s de %s: no está en curso ni en PRODUCCION", entry.op, entry.payload)
+                    self._mark_conflict(entry, exc)
+                continue
+            except Exception as exc:
+                logger.warning("No se pudo completar %s de %s: %s", entry.op, entry.payload, exc)
+                self._mark_failed([entry], exc)
+                continue
+            self._mark_flushed([entry])
+            flushed += 1
+        return flushed
+
+    def _flush_close(self, backend, entry: OutboxEntry):
+        bobina_id = entry.payload["bobina_id"]
+        row = entry.payload["row"]
+        if entry.attempts > 0 and bobina_id_missing(backend.get_all(SHEET_EN_CURSO), bobina_id):
+            self._confirm_closed(backend, bobina_id, row)
+            return
+        try:
+            backend.close_production(bobina_id, row)
+        except BobinaNotFoundError:
+            self._confirm_closed(backend, bobina_id, row)
+
+    def _confirm_closed(self, backend, bobina_id: str, row: list):
+        """
+        Return if the PRODUCCION ``row`` of ``bobina_id`` already reached
+        the backend; raise ``BobinaNotFoundError`` (the entry stays queued)
+        if the production was neither open nor closed by this entry.
+        """
+        present = _fingerprints(SHEET_PRODUCCION, backend.get_all(SHEET_PRODUCCION), CONFIRM_TAIL_ROWS)
+        if row_fingerprint(SHEET_PRODUCCION, _padded(SHEET_PRODUCCION, row)) not in present:
+            raise BobinaNotFoundError(bobina_id)
+        logger.info("El cierre de %s ya estaba en PRODUCCION", bobina_id)
+
+    def _split_written(self, backend, sheet, group):
+        """Separate entries already present in the backend from the rest."""
+        existing = backend.get_all(sheet)
+        present = _fingerprints(sheet, existing, 4 * len(group) + 50)
+        written = [e for e in group if row_fingerprint(sheet, _padded(sheet, e.payload)) in present]
+        return written, [e for e in group if e not in written]
+
+    def purge(self, older_than: float = KEEP_FLUSHED_SECONDS) -> int:
+        """Delete flushed entries and conflicts older than ``older_than`` seconds."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE COALESCE(flushed_at, conflict_at) < ?",
+                (time.time() - older_than,),
+            )
+        return cur.rowcount
+
+
+def _padded(sheet: str, row: list) -> list:
+    """``row`` cut or padded with "" to the columns of ``sheet``."""
+    width = len(TABLE_COLUMNS[sheet])
+    return (list(row) + [""] * width)[:width]
+
+
+def _target(op: str, payload) -> str:
+    """``bobina_id`` a removal or close entry (raw JSON ``payload``) acts on."""
+    payload = json.loads(payload)
+    return _norm_cell(payload["bobina_id"] if op == OP_CLOSE else payload)
+
+
+def _fingerprints(sheet: str, df: pd.DataFrame, tail: int) -> set:
+    """Fingerprints of the last ``tail`` rows of ``df`` in sheet column order."""
+    if df is None or df.empty:
+        return set()
+    columns = TABLE_COLUMNS[sheet]
+    recent = df.reindex(columns=columns).tail(tail).fillna("")
+    if sheet == SHEET_EN_CURSO:
+        # bobina_id is unique: compare the whole sheet by it
+        recent = df.reindex(columns=columns).fillna("")
+    return {row_fingerprint(sheet, r) for r in recent.values.tolist()}
+
+
+class OutboxFlusher(threading.Thread):
+    """
+    Background thread that drains an ``Outbox`` into a backend. It wakes up
+    every ``interval`` seconds, or shortly after ``wake()`` is called, and
+    lingers ``linger`` seconds so writes submitted together share a batch.
+    """
+
+    def __init__(self, outbox: Outbox, backend, interval: float = 5.0, linger: float = 0.5):
+        super().__init__(name="bicopack-outbox", daemon=True)
+        self.outbox = outbox
+        self.backend = backend
+        self.interval = interval
+        self.linger = linger
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._last_purge = 0.0
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                flushed = self.outbox.flush(self.backend)
+                if time.monotonic() - self._last_purge > 3600:
+                    self.outbox.purge()
+                    self._last_purge = time.monotonic()
+            except Exception:
+                logger.exception("Error vaciando la cola de escrituras")
+                flushed = 0
+            if flushed:
+                continue
+            if self._wake.wait(self.interval):
+                self._wake.clear()
+                self._stop_event.wait(self.linger)
+
+
+def outbox_from_env():
+    """Return an ``Outbox`` if ``BICOPACK_OUTBOX`` is enabled, else None."""
+    if not env_flag("BICOPACK_OUTBOX"):
+        return None
+    return Outbox(os.environ.get("BICOPACK_OUTBOX_PATH", DEFAULT_OUTBOX_PATH))
@@ -0,0 +1,284 @@
+import uuid
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from bicopack.core import (
+    TIPOS_EVENTO,
+    TIPOS_PRODUCCION,
+    clean_row,
+    compute_minutes,
+    get_first_existing_value,
+    parse_hhmm,
+    safe_float,
+    safe_int,
+)
+from bicopack.registry import MachineRegistry
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Validación de registros
+#
+# The checks and row layouts of the start, close, event and flat bobbin
+# forms, shared by the Streamlit pages and the ingestion API
+# (``bicopack.api``), so a record typed by an operator and one sent by a
+# barcode station or a PLC are accepted or rejected by the same rules.
+# Each builder returns the row to append (in the column order of its
+# table) or raises ``RecordError`` with the message the forms show.
+# -----------------------------------------------------------------------------
+
+TURNOS = ("1", "2", "3")
+# Campos de MAQUINAS que se editan desde la configuración (todos menos la
+# máquina, en el orden de la hoja)
+CONFIG_COLUMNS = ("tipo_produccion", "lote_of", "lote_mp", "linea", "planta")
+ORDEN_TRABAJO_PREFIX = "024-"
+
+
+class RecordError(ValueError):
+    """A record rejected by the form rules; the message is shown as is."""
+
+
+class MachineBusyError(RecordError):
+    """A start on a machine that already has an open production."""
+
+    def __init__(self, maquina: int, open_run: dict):
+        super().__init__(f"Ya hay una producción abierta en la máquina {maquina}")
+        self.maquina = maquina
+        self.open_run = open_run
+
+
+def require_fecha(fecha) -> date:
+    """The record date; text must be ISO (``AAAA-MM-DD``)."""
+    if fecha is None or (isinstance(fecha, str) and not fecha.strip()):
+        raise RecordError("Debes seleccionar la fecha")
+    if isinstance(fecha, datetime):
+        return fecha.date()
+    if isinstance(fecha, date):
+        return fecha
+    try:
+        return date.fromisoformat(str(fecha).strip())
+    except ValueError:
+        raise RecordError("La fecha debe tener formato AAAA-MM-DD") from None
+
+
+def require_turno(turno) -> str:
+    if turno is None or str(turno).strip() == "":
+        raise RecordError("Debes seleccionar el turno")
+    turno = str(safe_int(turno, turno)).strip()
+    if turno not in TURNOS:
+        raise RecordError("El turno debe ser 1, 2 o 3")
+    return turno
+
+
+def require_maquina(maquina, registry: MachineRegistry = None) -> int:
+    """A machine number, registered in ``registry`` when one is given."""
+    machine_int = safe_int(maquina)
+    if machine_int is None or machine_int < 1:
+        raise RecordError("La máquina debe ser un número entero positivo")
+    if registry is not None and machine_int not in registry:
+        raise RecordError(f"La máquina {machine_int} no está dada de alta en MAQUINAS")
+    return machine_int
+
+
+def require_hora(value, missing: str, invalid: str):
+    """Parse a required ``HH:MM`` time, with the form's messages."""
+    if value is None or not str(value).strip():
+        raise RecordError(missing)
+    try:
+        return parse_hhmm(value)
+    except Exception:
+        raise RecordError(invalid) from None
+
+
+def check_orden_trabajo(ordenes_trabajo) -> str:
+    """Work orders must be present and start with ``024-``."""
+    ordenes_trabajo = str(ordenes_trabajo or "").strip()
+    if not ordenes_trabajo:
+        raise RecordError("Debes introducir la orden de trabajo")
+    if not ordenes_trabajo.startswith(ORDEN_TRABAJO_PREFIX):
+        raise RecordError(f"La orden de trabajo debe empezar por {ORDEN_TRABAJO_PREFIX}")
+    return ordenes_trabajo
+
+
+def start_row(
+    fecha,
+    turno,
+    maquina,
+    tipo_produccion,
+    lote_mp,
+    lote_of,
+    hora_inicio,
+    operario_inicio,
+    observaciones="",
+    open_run: dict = None,
+    bobina_id: str = None,
+    registry: MachineRegistry = None,
+) -> list:
+    """
+    EN_CURSO row of a production start. ``open_run`` is the open run of
+    the machine, if any: a machine holds one production at a time.
+    """
+    fecha = require_fecha(fecha)
+    turno = require_turno(turno)
+    machine_int = require_maquina(maquina, registry)
+    if tipo_produccion not in TIPOS_PRODUCCION:
+        raise RecordError(f"Tipo de producción desconocido: {tipo_produccion}")
+    hora = require_hora(hora_inicio, "Debes introducir hora inicio", "La hora inicio debe tener formato HH:MM")
+    if open_run is not None:
+        raise MachineBusyError(machine_int, open_run)
+    return [
+        bobina_id or str(uuid.uuid4()),
+        fecha.isoformat(),
+        turno,
+        machine_int,
+        tipo_produccion,
+        lote_mp or "",
+        lote_of or "",
+        hora.strftime("%H:%M"),
+        operario_inicio or "",
+        observaciones or "",
+    ]
+
+
+def close_row(open_run, hora_fin, operario_fin, peso=0.0, taras=0, observaciones="") -> list:
+    """
+    PRODUCCION row closing ``open_run`` (a typed EN_CURSO row). The end date
+    is the next day when the end time is earlier than the start time.
+    """
+    fecha_inicio = open_run["fecha"]
+    if fecha_inicio is None or pd.isna(fecha_inicio):
+        raise RecordError("La fecha de inicio guardada no es válida")
+    fecha_inicio = pd.Timestamp(fecha_inicio).date()
+    hora_fin = require_hora(hora_fin, "Debes introducir hora fin", "La hora fin debe tener formato HH:MM")
+    try:
+        hora_ini = parse_hhmm(str(open_run["hora_inicio"]))
+    except Exception:
+        raise RecordError("La hora de inicio guardada no es válida") from None
+    fecha_fin = fecha_inicio
+    if hora_fin < hora_ini:
+        fecha_fin = fecha_inicio + timedelta(days=1)
+    # Some fields may have alternate column names (lote_materia_prima)
+    lote_mp = get_first_existing_value(open_run, ["lote_mp", "lote_materia_prima"], default="")
+    return [
+        fecha_inicio.isoformat(),
+        fecha_fin.isoformat(),
+        str(open_run["turno"]),
+        int(safe_int(open_run["maquina"], 0)),
+        str(open_run.get("tipo_produccion", "")),
+        lote_mp,
+        str(open_run["lote_of"]),
+        str(open_run["hora_inicio"]),
+        str(open_run["operario_inicio"]),
+        hora_fin.strftime("%H:%M"),
+        operario_fin or "",
+        float(safe_float(peso, 0.0)),
+        int(safe_int(taras, 0)),
+        observaciones or "",
+    ]
+
+
+# Messages of the events form when the start or end time is missing
+_EVENT_MISSING_TIMES = {
+    "Incidencia": "En incidencias debes introducir hora inicio y hora fin",
+    "Tarea - cambio de agujas": "Debes introducir hora inicio y hora fin",
+    "Limpieza": "En limpieza debes introducir hora inicio y hora fin",
+}
+
+
+def event_row(
+    fecha,
+    tipo,
+    maquina,
+    open_run: dict = None,
+    descripcion="",
+    operario="",
+    hora_inicio="",
+    hora_fin="",
+    carga_filetas: bool = False,
+    registry: MachineRegistry = None,
+) -> list:
+    """
+    EVENTOS row of an incident, task or cleaning. The shift and OF come from
+    the open run of the machine; a cleaning that is a fileta load has no
+    times or operator.
+    """
+    fecha = require_fecha(fecha)
+    if tipo not in TIPOS_EVENTO:
+        raise RecordError(f"Tipo de evento desconocido: {tipo}")
+    machine_int = require_maquina(maquina, registry)
+    turno = lote_of = ""
+    if open_run is not None:
+        turno = str(open_run.get("turno", "")).strip()
+        lote_of = str(open_run.get("lote_of", "")).strip()
+    descripcion = descripcion or ""
+    if tipo == "Limpieza" and carga_filetas:
+        hora_inicio = hora_fin = minutos = operario = ""
+        descripcion = f"Carga de filetas: {descripcion.strip()}" if descripcion.strip() else "Carga de filetas"
+    else:
+        hora_inicio, hora_fin = str(hora_inicio or ""), str(hora_fin or "")
+        if not hora_inicio.strip() or not hora_fin.strip():
+            raise RecordError(_EVENT_MISSING_TIMES[tipo])
+        try:
+            parse_hhmm(hora_inicio)
+            parse_hhmm(hora_fin)
+        except Exception:
+            raise RecordError("Las horas deben tener formato HH:MM") from None
+        minutos = compute_minutes(fecha, hora_inicio, hora_fin)
+    return [
+        fecha.isoformat(),
+        turno,
+        machine_int,
+        lote_of,
+        tipo,
+        hora_inicio,
+        hora_fin,
+        minutos,
+        operario or "",
+        descripcion,
+    ]
+
+
+def plana_row(fecha, turno, lotes, ordenes_trabajo, operarios=(), cantidad_reprocesadas=0) -> list:
+    """PLANAS_TURNO row of one shift of flat bobbin reprocessing (up to five operators)."""
+    fecha = require_fecha(fecha)
+    turno = require_turno(turno)
+    ordenes_trabajo = check_orden_trabajo(ordenes_trabajo)
+    cantidad = safe_int(cantidad_reprocesadas)
+    if cantidad is None or cantidad < 0:
+        raise RecordError("La cantidad de bobinas planas reprocesadas debe ser un entero positivo")
+    operarios = (list(operarios) + [""] * 5)[:5]
+    return [fecha.isoformat(), turno, lotes or "", ordenes_trabajo, *operarios, cantidad]
+
+
+def maquinas_rows(current: pd.DataFrame, edited: pd.DataFrame, registry: MachineRegistry = None) -> list:
+    """
+    MAQUINAS rows (``[maquina, tipo_produccion, lote_of, lote_mp, linea,
+    planta]``) of the machines whose configuration in ``edited`` (the
+    configuration grid) differs from ``current`` (the cached typed table,
+    first row of each machine). Machines without a row in ``current`` are
+    new rows unless all their fields are empty, and always when they are
+    not in ``registry`` yet (being registered).
+    """
+
+    def config(rec):
+        return [str(v).strip() for v in clean_row([rec.get(c) for c in CONFIG_COLUMNS])]
+
+    saved = {}
+    if current is not None and not current.empty:
+        for rec in current.drop_duplicates("maquina_norm", keep="first").to_dict("records"):
+            saved[rec["maquina_norm"]] = config(rec)
+    rows = []
+    seen = set()
+    for rec in edited.to_dict("records"):
+        machine_int = require_maquina(rec.get("maquina"))
+        if machine_int in seen:
+            raise RecordError(f"La máquina {machine_int} aparece más de una vez")
+        seen.add(machine_int)
+        values = config(rec)
+        if values[0] and values[0] not in TIPOS_PRODUCCION:
+            raise RecordError(f"Tipo de producción desconocido: {values[0]}")
+        unchanged = values == saved.get(machine_int, [""] * len(CONFIG_COLUMNS))
+        if unchanged and (registry is None or machine_int in registry):
+            continue
+        rows.append([machine_int, *values])
+    return rows
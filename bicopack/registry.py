@@ -0,0 +1,102 @@
+import pandas as pd
+
+from bicopack.core import MAQUINAS_COLS, MAX_MAQUINA, SHEET_MAQUINAS, clean_row
+from bicopack.schema import MAQUINA_DESCONOCIDA, apply_schema
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Registro de máquinas
+#
+# The machines of the deployment, with their line and plant, read from the
+# MAQUINAS table (one row per machine; the optional ``linea`` and
+# ``planta`` columns group them) instead of a fixed range of numbers. The
+# forms offer the registered machines, the panels filter them by plant and
+# line, and ``ShardedBackend`` (``bicopack.storage``) routes the rows of
+# each plant to its own spreadsheet or file. Lookups by machine, line and
+# plant are dictionaries built once per version of MAQUINAS, so a panel of
+# hundreds of machines never scans the table.
+#
+# Machines 1 to ``MAX_MAQUINA`` (the original hall, whose machines need no
+# row in MAQUINAS) are always registered; listing them in MAQUINAS only
+# gives them a line or plant.
+# -----------------------------------------------------------------------------
+
+
+def _text(value) -> str:
+    return str(clean_row([value])[0]).strip()
+
+
+class MachineRegistry:
+    """Registered machines with their plant and line. Treat as read-only."""
+
+    def __init__(self, entries: dict):
+        # Máquina -> (planta, línea), en orden de número
+        self._entries = dict(sorted(entries.items()))
+        self._by_group = {}
+        for maquina, group in self._entries.items():
+            self._by_group.setdefault(group, []).append(maquina)
+
+    @classmethod
+    def from_frame(cls, maquinas: pd.DataFrame = None) -> "MachineRegistry":
+        """
+        Registry of a MAQUINAS frame (typed or raw, None for none). As
+        everywhere else, the first row of a machine wins.
+        """
+        frame = apply_schema(SHEET_MAQUINAS, maquinas)
+        entries = {}
+        for maquina, planta, linea in zip(frame["maquina_norm"], frame["planta"], frame["linea"]):
+            maquina = int(maquina)
+            if maquina == MAQUINA_DESCONOCIDA or maquina < 1 or maquina in entries:
+                continue
+            entries[maquina] = (_text(planta), _text(linea))
+        for maquina in range(1, MAX_MAQUINA + 1):
+            entries.setdefault(maquina, ("", ""))
+        return cls(entries)
+
+    def with_machines(self, rows: list[list]) -> "MachineRegistry":
+        """
+        A copy with the saved MAQUINAS ``rows`` (in the table's column order;
+        rows without ``linea`` or ``planta`` keep the current ones).
+        """
+        entries = dict(self._entries)
+        for row in rows:
+            values = dict(zip(MAQUINAS_COLS, row))
+            maquina = int(values["maquina"])
+            planta, linea = entries.get(maquina, ("", ""))
+            entries[maquina] = (
+                _text(values["planta"]) if "planta" in values else planta,
+                _text(values["linea"]) if "linea" in values else linea,
+            )
+        return MachineRegistry(entries)
+
+    def __contains__(self, maquina) -> bool:
+        return maquina in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def machines(self, planta: str = None, linea: str = None) -> list[int]:
+        """Registered machines, of one plant and/or line when given."""
+        if planta is None and linea is None:
+            return list(self._entries)
+        found = []
+        for (plant, line), maquinas in self._by_group.items():
+            if (planta is None or plant == planta) and (linea is None or line == linea):
+                found.extend(maquinas)
+        return sorted(found)
+
+    def plants(self) -> list[str]:
+        """Plants with machines ("" for the machines without a plant)."""
+        return sorted({plant for plant, _ in self._by_group})
+
+    def lines(self, planta: str = None) -> list[str]:
+        """Lines with machines, of one plant when given."""
+        return sorted({line for plant, line in self._by_group if planta is None or plant == planta})
+
+    def plant_of(self, maquina) -> str:
+        """Plant of ``maquina`` ("" if it has none or is not registered)."""
+        return self._entries.get(maquina, ("", ""))[0]
+
+    def line_of(self, maquina) -> str:
+        """Line of ``maquina`` ("" if it has none or is not registered)."""
+        return self._entries.get(maquina, ("", ""))[1]
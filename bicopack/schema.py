@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_PRODUCCION,
+    SHEET_EVENTOS,
+    SHEET_PLANAS_TURNO,
+    SHEET_MAQUINAS,
+    TABLE_COLUMNS,
+    as_text,
+    map_unique,
+)
+from bicopack.dates import parse_fecha_series
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Esquema de las tablas
+#
+# Declared dtypes for every column of the sheets. The storage backends hand
+# over the raw cell values (strings from ``get_all_values``); the table cache
+# runs ``apply_schema`` once per load so every session gets frames that are
+# already typed: nullable integers for machine numbers and counters, floats
+# for weights, categoricals for the short repeated labels and parsed dates.
+# Columns without a declared type are kept as stripped text.
+#
+# Every table with a ``maquina`` column also gets ``maquina_norm``, a plain
+# int64 copy with ``MAQUINA_DESCONOCIDA`` for missing or invalid values, so
+# it can be compared with ``==`` and used for boolean masks directly.
+# -----------------------------------------------------------------------------
+
+TEXT = "text"
+INT = "int"
+FLOAT = "float"
+CATEGORY = "category"
+DATE = "date"
+
+# Valor de ``maquina_norm`` cuando la máquina no es un número válido
+MAQUINA_DESCONOCIDA = -999
+
+# Columns with a type other than TEXT, per sheet
+TYPED_COLUMNS = {
+    SHEET_EN_CURSO: {
+        "fecha": DATE,
+        "turno": CATEGORY,
+        "maquina": INT,
+        "tipo_produccion": CATEGORY,
+    },
+    SHEET_PRODUCCION: {
+        "fecha_inicio": DATE,
+        "fecha_fin": DATE,
+        "turno": CATEGORY,
+        "maquina": INT,
+        "tipo_produccion": CATEGORY,
+        "peso": FLOAT,
+        "taras": INT,
+    },
+    SHEET_EVENTOS: {
+        "fecha": DATE,
+        "turno": CATEGORY,
+        "maquina": INT,
+        "tipo": CATEGORY,
+        "minutos": INT,
+    },
+    SHEET_PLANAS_TURNO: {
+        "fecha": DATE,
+        "turno": CATEGORY,
+        "cantidad_reprocesadas": INT,
+    },
+    SHEET_MAQUINAS: {
+        "maquina": INT,
+        "tipo_produccion": CATEGORY,
+    },
+}
+
+# Full schema of every table: each column of ``TABLE_COLUMNS`` with its kind
+SCHEMAS = {
+    table: {col: TYPED_COLUMNS.get(table, {}).get(col, TEXT) for col in columns}
+    for table, columns in TABLE_COLUMNS.items()
+}
+
+
+def _parse_number(unique: pd.Series) -> pd.Series:
+    # Admite coma decimal, como ``safe_float``
+    text = as_text(unique).str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce").astype(float)
+
+
+def to_float(values: pd.Series) -> pd.Series:
+    """Convert a column to float64 (``NaN`` when empty or invalid)."""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype(float)
+    return map_unique(values, _parse_number)
+
+
+def to_int(values: pd.Series) -> pd.Series:
+    """
+    Convert a column to nullable ``Int64``. Decimal values are truncated
+    like ``safe_int``; empty or invalid values become ``<NA>``.
+    """
+    if pd.api.types.is_integer_dtype(values):
+        return values.astype("Int64")
+    return pd.Series(np.trunc(to_float(values)), index=values.index).astype("Int64")
+
+
+def to_category(values: pd.Series) -> pd.Series:
+    """Convert a column to a categorical of stripped strings."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    return as_text(values).astype("category")
+
+
+def to_text(values: pd.Series) -> pd.Series:
+    """Convert a column to stripped strings, with "" for missing values."""
+    return as_text(values)
+
+
+CONVERTERS = {
+    TEXT: to_text,
+    INT: to_int,
+    FLOAT: to_float,
+    CATEGORY: to_category,
+    DATE: parse_fecha_series,
+}
+
+
+def maquina_norm(maquina: pd.Series) -> pd.Series:
+    """int64 machine numbers with ``MAQUINA_DESCONOCIDA`` for missing ones."""
+    return to_int(maquina).fillna(MAQUINA_DESCONOCIDA).astype("int64")
+
+
+def apply_schema(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return ``df`` with every column of ``table`` present and converted to
+    its declared type, plus ``maquina_norm`` when the table has machines.
+    Columns outside the schema are kept untouched. Applying the schema to
+    an already typed frame returns the same types.
+    """
+    schema = SCHEMAS[table]
+    if df is None:
+        df = pd.DataFrame(columns=list(schema))
+    else:
+        df = df.copy()
+    for col, kind in schema.items():
+        if col not in df.columns:
+            df[col] = pd.Series([""] * len(df), index=df.index, dtype=object)
+        df[col] = CONVERTERS[kind](df[col])
+    if "maquina" in schema:
+        df["maquina_norm"] = maquina_norm(df["maquina"])
+    return df
+
+
+def empty_table(table: str) -> pd.DataFrame:
+    """Empty, typed frame with the columns of ``table``."""
+    return apply_schema(table, None)
+
+
+def concat_typed(table: str, frames) -> pd.DataFrame:
+    """
+    Concatenate typed frames of ``table``. Categorical columns are given
+    the union of the categories first so they stay categorical instead of
+    falling back to ``object``.
+    """
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames:
+        return empty_table(table)
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    for col, kind in SCHEMAS[table].items():
+        if kind != CATEGORY:
+            continue
+        categories = pd.Index([])
+        for f in frames:
+            categories = categories.union(f[col].cat.categories)
+        frames = [f.assign(**{col: f[col].cat.set_categories(categories)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
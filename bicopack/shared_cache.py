@@ -0,0 +1,422 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_MAQUINAS,
+    MAIN_SHEETS,
+    clean_row,
+    safe_int,
+)
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Caché compartida entre procesos
+#
+# On-disk (SQLite) copy of every table shared by all the Streamlit workers of
+# a host. A single refresher, elected with an exclusive file lock, reads the
+# tables from the real backend every few seconds and stores them here; the
+# workers read from this file instead of calling the Google Sheets API, so
+# API reads depend on how often the data changes and not on how many
+# tablets are open. Writes still go to the real backend, serialised across
+# processes with a second file lock, and are applied to the shared copy
+# right away so every worker sees them.
+#
+# Environment variables used:
+#   BICOPACK_SHARED_CACHE             SQLite file of the shared cache
+#                                     (disabled when empty).
+#   BICOPACK_SHARED_REFRESH_SECONDS   Refresh interval (default: 30).
+#   BICOPACK_SHARED_REFRESHER         "0" to keep this process from acting
+#                                     as refresher (when a dedicated one runs
+#                                     with ``python -m bicopack.shared_cache``).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_SECONDS = 30
+# A snapshot older than this many refresh intervals means the refresher is
+# gone; readers then load the table themselves (one process at a time)
+STALE_INTERVALS = 5
+
+SHARED_TABLES = MAIN_SHEETS + (SHEET_MAQUINAS,)
+
+
+def _row_key(table: str, row: dict):
+    """Key used to find a row again: bobina_id in EN_CURSO, the machine in MAQUINAS."""
+    if table == SHEET_EN_CURSO:
+        return str(row.get("bobina_id", "")).strip() or None
+    if table == SHEET_MAQUINAS:
+        maquina = safe_int(row.get("maquina"))
+        return str(maquina) if maquina is not None else None
+    return None
+
+
+def _row_hashes(frame: pd.DataFrame):
+    if frame.empty or len(frame.columns) == 0:
+        return pd.Series([], dtype="uint64").to_numpy()
+    return pd.util.hash_pandas_object(frame.astype(str), index=False).to_numpy()
+
+
+def _digest(hashes) -> str:
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+class FileLock:
+    """
+    Exclusive lock shared by threads and processes, based on ``flock`` on
+    ``path``. Without ``fcntl`` (Windows) it only serialises threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedSnapshot:
+    """Metadata of a table stored in the shared cache."""
+
+    def __init__(self, table, version, refreshed_at, columns, row_count, digest):
+        self.table = table
+        self.version = version
+        self.refreshed_at = refreshed_at
+        self.columns = json.loads(columns)
+        self.row_count = row_count
+        self.digest = digest
+
+    def age(self) -> float:
+        return time.time() - self.refreshed_at
+
+
+class SharedStore:
+    """
+    Tables stored row by row in a SQLite file. Each table has a version
+    that increases whenever its content changes, either because the
+    refresher stored new data or because a worker applied a write.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "tbl TEXT PRIMARY KEY, "
+            "version INTEGER NOT NULL, "
+            "refreshed_at REAL NOT NULL, "
+            "columns TEXT NOT NULL, "
+            "row_count INTEGER NOT NULL, "
+            "digest TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "tbl TEXT NOT NULL, "
+            "pos INTEGER NOT NULL, "
+            "row_key TEXT, "
+            "data TEXT NOT NULL, "
+            "PRIMARY KEY (tbl, pos))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_key ON rows (tbl, row_key)")
+        # Mutations of the real backend, serialised across processes
+        self.write_lock = FileLock(f"{path}.write.lock")
+        # Readers that find a table missing load it one process at a time
+        self.fill_lock = FileLock(f"{path}.fill.lock")
+        # Held for its whole life by the process acting as refresher
+        self.refresher_lock = FileLock(f"{path}.refresher.lock")
+
+    # -- reads ----------------------------------------------------------------
+
+    def snapshot(self, table: str):
+        """Metadata of ``table`` or None if it was never stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tbl, version, refreshed_at, columns, row_count, digest FROM snapshots WHERE tbl = ?",
+                (table,),
+            ).fetchone()
+        return SharedSnapshot(*row) if row else None
+
+    def versions(self) -> dict[str, int]:
+        """Current version of every stored table."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT tbl, version FROM snapshots").fetchall())
+
+    def read(self, table: str):
+        """Return ``(version, frame)`` for ``table``, or None if not stored."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                meta = self.snapshot(table)
+                if meta is None:
+                    return None
+                data = self._conn.execute(
+                    "SELECT data FROM rows WHERE tbl = ? ORDER BY pos", (table,)
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        rows = [json.loads(d) for (d,) in data]
+        return meta.version, pd.DataFrame(rows, columns=meta.columns)
+
+    # -- refresh --------------------------------------------------------------
+
+    def store(self, table: str, frame: pd.DataFrame, expected_version: int = None) -> bool:
+        """
+        Store a fresh copy of ``table`` read from the backend. The version
+        only changes if the content did. When rows were only added at the
+        end, just the new rows are inserted. If ``expected_version`` is
+        given and a worker changed the table meanwhile, nothing is stored
+        (the next refresh will include that write). Returns True if stored.
+        """
+        frame = frame if frame is not None else pd.DataFrame()
+        columns = [str(c) for c in frame.columns]
+        hashes = _row_hashes(frame)
+        digest = _digest(hashes)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self.snapshot(table)
+                if meta is not None and expected_version is not None and meta.version != expected_version:
+                    self._conn.execute("COMMIT")
+                    return False
+                if meta is not None and meta.digest == digest and meta.columns == columns:
+                    self._conn.execute(
+                        "UPDATE snapshots SET refreshed_at = ? WHERE tbl = ?", (now, table)
+                    )
+                    self._conn.execute("COMMIT")
+                    return True
+                start = 0
+                if (
+                    meta is not None
+                    and meta.digest is not None
+                    and meta.columns == columns
+                    and meta.row_count <= len(frame)
+                    and _digest(hashes[: meta.row_count]) == meta.digest
+                ):
+                    # Solo se han añadido filas al final
+                    start = meta.row_count
+                else:
+                    self._conn.execute("DELETE FROM rows WHERE tbl = ?", (table,))
+                records = frame.iloc[start:].to_dict("records")
+                self._conn.executemany(
+                    "INSERT INTO rows (tbl, pos, row_key, data) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            table,
+                            start + i,
+                            _row_key(table, rec),
+                            json.dumps(clean_row(list(rec.values())), ensure_ascii=False, default=str),
+                        )
+                        for i, rec in enumerate(records)
+                    ],
+                )
+                version = (meta.version if meta is not None else 0) + 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO snapshots "
+                    "(tbl, version, refreshed_at, columns, row_count, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                    (table, version, now, json.dumps(columns), len(frame), digest),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    # -- write-through patches ------------------------------------------------
+
+    def _patch(self, table: str, func):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self.snapshot(table)
+                if meta is None:
+                    self._conn.execute("COMMIT")
+                    return
+                delta = func(meta)
+                # After a patch the digest no longer matches the backend
+                # content; the next refresh stores the table again.
+                self._conn.execute(
+                    "UPDATE snapshots SET version = version + 1, row_count = row_count + ?, digest = NULL "
+                    "WHERE tbl = ?",
+                    (delta, table),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def append(self, table: str, rows: list[list]):
+        """Append rows written by a worker (in the sheet's column order)."""
+
+        def insert(meta):
+            last = self._conn.execute(
+                "SELECT COALESCE(MAX(pos), -1) FROM rows WHERE tbl = ?", (table,)
+            ).fetchone()[0]
+            width = len(meta.columns)
+            for i, row in enumerate(rows):
+                row = (clean_row(row) + [""] * width)[:width]
+                self._conn.execute(
+                    "INSERT INTO rows (tbl, pos, row_key, data) VALUES (?, ?, ?, ?)",
+                    (
+                        table,
+                        last + 1 + i,
+                        _row_key(table, dict(zip(meta.columns, row))),
+                        json.dumps(row, ensure_ascii=False, default=str),
+                    ),
+                )
+            return len(rows)
+
+        self._patch(table, insert)
+
+    def delete_key(self, table: str, key):
+        """Remove the rows of ``table`` whose key is ``key``."""
+        key = str(key).strip()
+
+        def delete(meta):
+            cur = self._conn.execute("DELETE FROM rows WHERE tbl = ? AND row_key = ?", (table, key))
+            return -cur.rowcount
+
+        self._patch(table, delete)
+
+    def upsert_maquina(self, maquina: int, values: dict):
+        """Update the stored MAQUINAS row of ``maquina`` (or add it)."""
+        key = str(int(maquina))
+
+        def upsert(meta):
+            found = self._conn.execute(
+                "SELECT pos, data FROM rows WHERE tbl = ? AND row_key = ? ORDER BY pos LIMIT 1",
+                (SHEET_MAQUINAS, key),
+            ).fetchone()
+            if found is not None:
+                pos, data = found
+                row = dict(zip(meta.columns, json.loads(data)))
+                row.update(values)
+                self._conn.execute(
+                    "UPDATE rows SET data = ? WHERE tbl = ? AND pos = ?",
+                    (json.dumps(clean_row([row.get(c, "") for c in meta.columns]), ensure_ascii=False, default=str),
+                     SHEET_MAQUINAS, pos),
+                )
+                return 0
+            last = self._conn.execute(
+                "SELECT COALESCE(MAX(pos), -1) FROM rows WHERE tbl = ?", (SHEET_MAQUINAS,)
+            ).fetchone()[0]
+            row = {"maquina": int(maquina), **values}
+            self._conn.execute(
+                "INSERT INTO rows (tbl, pos, row_key, data) VALUES (?, ?, ?, ?)",
+                (SHEET_MAQUINAS, last + 1, key,
+                 json.dumps(clean_row([row.get(c, "") for c in meta.columns]), ensure_ascii=False, default=str)),
+            )
+            return 1
+
+        self._patch(SHEET_MAQUINAS, upsert)
+
+
+class SharedCacheRefresher(threading.Thread):
+    """
+    Background thread that keeps the ``SharedStore`` filled from ``backend``.
+    Every process may start one, but only the one holding the store's
+    refresher lock does any work; if that process exits, another takes over.
+    """
+
+    def __init__(self, store: SharedStore, backend, tables=SHARED_TABLES, interval: float = DEFAULT_REFRESH_SECONDS):
+        super().__init__(name="bicopack-shared-cache", daemon=True)
+        self.store = store
+        self.backend = backend
+        self.tables = tuple(tables)
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self.active = False
+
+    def stop(self):
+        self._stop_event.set()
+
+    def refresh_once(self):
+        """Read every table from the backend and store the ones that changed."""
+        before = self.store.versions()
+        frames = self.backend.get_many(list(self.tables))
+        for table in self.tables:
+            if getattr(self.backend, "stale_since", lambda t: None)(table) is not None:
+                # Copia antigua servida por el circuito: no cuenta como refresco
+                continue
+            self.store.store(table, frames[table], expected_version=before.get(table))
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if not self.active:
+                self.active = self.store.refresher_lock.acquire(blocking=False)
+            if self.active:
+                try:
+                    self.refresh_once()
+                except Exception:
+                    logger.exception("Error refrescando la caché compartida")
+            self._stop_event.wait(self.interval)
+
+
+def refresh_seconds_from_env() -> float:
+    return float(os.environ.get("BICOPACK_SHARED_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS))
+
+
+def shared_store_from_env():
+    """Return a ``SharedStore`` if ``BICOPACK_SHARED_CACHE`` is set, else None."""
+    path = os.environ.get("BICOPACK_SHARED_CACHE", "").strip()
+    if not path:
+        return None
+    return SharedStore(path)
+
+
+def main():
+    """Run a dedicated refresher in the foreground."""
+    from bicopack.storage import backend_from_env
+
+    logging.basicConfig(level=logging.INFO)
+    store = shared_store_from_env()
+    if store is None:
+        raise ValueError("Falta la variable de entorno BICOPACK_SHARED_CACHE")
+    refresher = SharedCacheRefresher(store, backend_from_env(shared=False), interval=refresh_seconds_from_env())
+    logger.info("Esperando el turno de refresco de %s", store.path)
+    refresher.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+import os
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from http import HTTPStatus
+
+import requests
+from requests.adapters import HTTPAdapter
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+from bicopack import metrics
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Cliente de Google Sheets con control de cuota
+#
+# HTTP client plugged into gspread (``gspread.authorize(http_client=...)``) so
+# every request of the app goes through the same policy:
+#   • a token bucket sized to the per-minute Sheets quota, shared by all the
+#     threads of the process, that makes callers wait instead of getting 429s;
+#   • single-flight: identical GET requests in flight at the same time share
+#     one HTTP call and its response;
+#   • retries with exponential backoff and full jitter for 429, 408 and 5xx
+#     answers and for network errors (writes are only retried on 429, which
+#     Google rejects before applying them);
+#   • a circuit breaker that, after several consecutive failures, fails fast
+#     for a while with ``SheetsUnavailableError`` so the storage backend can
+#     serve its last good snapshot instead of piling up requests.
+# All the clients of a process share one authorised session per service
+# account, with a pool of keep-alive connections, and its OAuth token is
+# refreshed in the background a few minutes before it expires, so no
+# request waits for a TLS handshake or a token.
+#
+# Environment variables used:
+#   BICOPACK_SHEETS_QUOTA_PER_MINUTE   Requests per minute (default: 60).
+#   BICOPACK_SHEETS_MAX_RETRIES        Retries per request (default: 4).
+#   BICOPACK_SHEETS_BREAKER_FAILURES   Consecutive failures that open the
+#                                      circuit (default: 5).
+#   BICOPACK_SHEETS_BREAKER_SECONDS    Time the circuit stays open
+#                                      (default: 60).
+#   BICOPACK_SHEETS_POOL_SIZE          Keep-alive connections kept open
+#                                      (default: 10).
+#   BICOPACK_TOKEN_REFRESH_MARGIN      Seconds before expiry at which the
+#                                      token is refreshed (default: 300).
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUOTA_PER_MINUTE = 60
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_SECONDS = 60
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 32.0
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TOKEN_REFRESH_MARGIN = 300
+# Wait before retrying a failed token refresh
+TOKEN_RETRY_SECONDS = 30
+
+RETRYABLE_STATUS = {
+    HTTPStatus.REQUEST_TIMEOUT,
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+}
+
+
+class SheetsUnavailableError(RuntimeError):
+    """Raised while the circuit breaker is open."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(
+            f"Google Sheets no está disponible temporalmente (se reintentará en {int(retry_in) + 1} s)"
+        )
+        self.retry_in = retry_in
+
+
+def is_transient(exc: Exception) -> bool:
+    """True for errors caused by quota, server or network problems."""
+    if isinstance(exc, SheetsUnavailableError):
+        return True
+    if isinstance(exc, APIError):
+        return exc.code in RETRYABLE_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the ``attempt``-th retry (1-based)."""
+    cap = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+
+class TokenBucket:
+    """Allow ``rate`` requests per ``per`` seconds, with bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, per: float = 60.0, capacity: float = None):
+        self.rate = rate / per
+        self.capacity = capacity if capacity is not None else max(1.0, rate / 6)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Take one token, waiting for it if needed. False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers share its outcome."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class CircuitBreaker:
+    """
+    Closed while requests succeed. After ``failures`` consecutive transient
+    failures it opens for ``reset_seconds``; then one trial request is let
+    through (half-open) and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failures: int = DEFAULT_BREAKER_FAILURES, reset_seconds: float = DEFAULT_BREAKER_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._count = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def before(self):
+        """Raise ``SheetsUnavailableError`` if the request may not go out."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed >= self.reset_seconds and not self._trial:
+                self._trial = True
+                return
+            raise SheetsUnavailableError(max(0.0, self.reset_seconds - elapsed))
+
+    def success(self):
+        with self._lock:
+            self._count = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._count += 1
+            if self._trial or self._count >= self.failures:
+                if self._opened_at is None or self._trial:
+                    logger.warning("Circuito de Google Sheets abierto tras %s fallos", self._count)
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class SheetsRequestPolicy:
+    """Quota, coalescing, retry and breaker settings shared by a process."""
+
+    def __init__(
+        self,
+        quota_per_minute: float = DEFAULT_QUOTA_PER_MINUTE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        breaker_failures: int = DEFAULT_BREAKER_FAILURES,
+        breaker_seconds: float = DEFAULT_BREAKER_SECONDS,
+    ):
+        self.bucket = TokenBucket(quota_per_minute)
+        self.single_flight = SingleFlight()
+        self.breaker = CircuitBreaker(breaker_failures, breaker_seconds)
+        self.max_retries = max_retries
+
+    def send(self, method: str, key, func):
+        """Send one request through the policy; ``func`` performs it."""
+        if method.upper() == "GET":
+            return self.single_flight.do(key, lambda: self._send(method, func))
+        return self._send(method, func)
+
+    def _send(self, method: str, func):
+        idempotent = method.upper() == "GET"
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before()
+            except SheetsUnavailableError:
+                metrics.REGISTRY.inc(metrics.SHEETS_REJECTED, reason="breaker")
+                raise
+            waited = time.perf_counter()
+            self.bucket.acquire()
+            metrics.REGISTRY.inc(metrics.SHEETS_QUOTA_WAIT, time.perf_counter() - waited)
+            try:
+                response = func()
+            except Exception as exc:
+                if not is_transient(exc):
+                    # Un error de la petición (403, 404...) no es una caída
+                    self.breaker.success()
+                    raise
+                rate_limited = isinstance(exc, APIError) and exc.code == HTTPStatus.TOO_MANY_REQUESTS
+                attempt += 1
+                if attempt > self.max_retries or not (idempotent or rate_limited):
+                    self.breaker.failure()
+                    raise
+                delay = backoff_delay(attempt)
+                metrics.REGISTRY.inc(metrics.SHEETS_RETRIES, method=method.upper())
+                logger.info("Reintento %s de Google Sheets en %.1f s: %s", attempt, delay, exc)
+                time.sleep(delay)
+                continue
+            self.breaker.success()
+            return response
+
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+
+def default_policy() -> SheetsRequestPolicy:
+    """The process-wide policy configured from the environment."""
+    global _default_policy
+    with _default_policy_lock:
+        if _default_policy is None:
+            _default_policy = SheetsRequestPolicy(
+                quota_per_minute=float(os.environ.get("BICOPACK_SHEETS_QUOTA_PER_MINUTE", DEFAULT_QUOTA_PER_MINUTE)),
+                max_retries=int(os.environ.get("BICOPACK_SHEETS_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                breaker_failures=int(os.environ.get("BICOPACK_SHEETS_BREAKER_FAILURES", DEFAULT_BREAKER_FAILURES)),
+                breaker_seconds=float(os.environ.get("BICOPACK_SHEETS_BREAKER_SECONDS", DEFAULT_BREAKER_SECONDS)),
+            )
+        return _default_policy
+
+
+def _request_key(method, endpoint, params, data, json):
+    params = sorted(params.items()) if isinstance(params, dict) else params
+    return repr((method.upper(), endpoint, params, data, json))
+
+
+def _status(exc: Exception) -> str:
+    if isinstance(exc, APIError):
+        return str(exc.code)
+    return type(exc).__name__
+
+
+class QuotaAwareHTTPClient(HTTPClient):
+    """
+    gspread HTTP client that sends every request through ``default_policy()``.
+    Each attempt is counted in ``bicopack.metrics`` by worksheet and status.
+    """
+
+    policy = None
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        policy = self.policy or default_policy()
+        key = _request_key(method, endpoint, params, data, json)
+        sheet = metrics.request_target(endpoint, params)
+
+        def attempt():
+            start = time.perf_counter()
+            try:
+                response = super(QuotaAwareHTTPClient, self).request(
+                    method, endpoint, params=params, data=data, json=json, files=files, headers=headers
+                )
+            except Exception as exc:
+                metrics.record_sheets_request(sheet, method, _status(exc), time.perf_counter() - start)
+                raise
+            metrics.record_sheets_request(sheet, method, str(response.status_code), time.perf_counter() - start)
+            return response
+
+        return policy.send(method, key, attempt)
+
+
+# -----------------------------------------------------------------------------
+# Shared session and token refresh
+# -----------------------------------------------------------------------------
+
+def pooled_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """A ``requests`` session keeping up to ``pool_size`` connections alive per host."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
+
+
+class TokenRefresher(threading.Thread):
+    """
+    Refresh ``credentials`` ``margin`` seconds before their token expires
+    (right away if they have none yet), so requests never pay for it.
+    """
+
+    def __init__(self, credentials, request, margin: float = DEFAULT_TOKEN_REFRESH_MARGIN):
+        super().__init__(name="bicopack-token", daemon=True)
+        self.credentials = credentials
+        self.request = request
+        self.margin = margin
+        self._stop_event = threading.Event()
+
+    def seconds_left(self):
+        """Seconds until the current token expires, or None without a token."""
+        expiry = self.credentials.expiry
+        if not self.credentials.token or expiry is None:
+            return None
+        # google-auth guarda la caducidad como UTC sin zona
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            left = self.seconds_left()
+            if left is not None and left > self.margin:
+                self._stop_event.wait(left - self.margin)
+                continue
+            try:
+                self.credentials.refresh(self.request)
+            except Exception as exc:
+                logger.warning("No se pudo renovar el token de Google: %s", exc)
+                self._stop_event.wait(TOKEN_RETRY_SECONDS)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def authorized_session(credentials):
+    """
+    The process-wide authorised session of the service account of
+    ``credentials``, created on first use with a keep-alive connection
+    pool (``BICOPACK_SHEETS_POOL_SIZE``) and a ``TokenRefresher``.
+    """
+    from google.auth.transport.requests import AuthorizedSession, Request
+
+    key = getattr(credentials, "service_account_email", None) or id(credentials)
+    with _sessions_lock:
+        if key not in _sessions:
+            pool_size = int(os.environ.get("BICOPACK_SHEETS_POOL_SIZE", DEFAULT_POOL_SIZE))
+            margin = float(os.environ.get("BICOPACK_TOKEN_REFRESH_MARGIN", DEFAULT_TOKEN_REFRESH_MARGIN))
+            # Token requests also reuse their connection
+            token_request = Request(pooled_session(1))
+            session = AuthorizedSession(credentials, auth_request=token_request)
+            session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+            TokenRefresher(credentials, token_request, margin).start()
+            _sessions[key] = session
+        return _sessions[key]
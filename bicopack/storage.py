@@ -0,0 +1,1692 @@
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_PRODUCCION,
+    SHEET_EVENTOS,
+    SHEET_PLANAS_TURNO,
+    SHEET_MAQUINAS,
+    TABLE_COLUMNS,
+    BobinaNotFoundError,
+    MachineOccupiedError,
+    TableChangedError,
+    bobina_id_missing,
+    clean_row,
+    env_flag,
+    safe_int,
+)
+from bicopack.outbox import OutboxFlusher, _norm_cell, outbox_from_env
+from bicopack.registry import MachineRegistry
+from bicopack.shared_cache import (
+    STALE_INTERVALS,
+    SharedCacheRefresher,
+    refresh_seconds_from_env,
+    shared_store_from_env,
+)
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Almacenamiento
+#
+# Every read and write of the app goes through a ``StorageBackend``. Two
+# engines are provided:
+#   • ``SheetsBackend``  the original Google Sheets storage (gspread);
+#   • ``SQLiteBackend``  a local SQLite file with indexes on ``maquina``,
+#                        the date columns and ``bobina_id``.
+# ``MirroredBackend`` combines both: reads and writes hit the local SQLite
+# file and every write is then replicated to Google Sheets, which is kept as
+# a mirror for the office. ``ShardedBackend`` spreads the rows of several
+# plants over one engine per plant.
+#
+# Environment variables used:
+#   BICOPACK_STORAGE        "sheets" (default) or "sqlite".
+#   BICOPACK_SQLITE_PATH    SQLite file for the "sqlite" engine
+#                           (default: bicopack.db).
+#   BICOPACK_SHEETS_MIRROR  "1" to mirror SQLite writes to Google Sheets.
+#   BICOPACK_INCREMENTAL_SYNC  "0" to always download append-only sheets in
+#                           full (default: incremental tail sync).
+#   BICOPACK_FULL_SYNC_SECONDS  Seconds between safety full downloads of an
+#                           incrementally synced sheet (default: 21600).
+#   BICOPACK_OUTBOX         "1" to queue Google Sheets writes in a local
+#                           outbox flushed in the background (see
+#                           ``bicopack.outbox``).
+#   BICOPACK_SHARED_CACHE   SQLite file of the cache shared by every worker
+#                           process (see ``bicopack.shared_cache``).
+#   BICOPACK_PLANTAS        JSON object with the plants that keep their rows
+#                           in an engine of their own, e.g.
+#                           {"Nave 2": {"sheet_id": "...", "sqlite_path": "..."}}
+#                           (``ShardedBackend``; the plant of each machine is
+#                           the ``planta`` column of MAQUINAS).
+#
+# gspread and google-auth are only imported when a Google Sheets client is
+# created, so pages that never reach the sheets (and the local engine) do
+# not pay for them. ``warm_up`` does that work ahead of the first request.
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+STORAGE_SHEETS = "sheets"
+STORAGE_SQLITE = "sqlite"
+
+DEFAULT_SQLITE_PATH = "bicopack.db"
+
+# Sheets that only ever grow at the bottom. They are synced incrementally by
+# downloading only the rows added since the previous read.
+APPEND_ONLY_SHEETS = (SHEET_PRODUCCION, SHEET_EVENTOS, SHEET_PLANAS_TURNO)
+# Seconds ``ShardedBackend`` keeps the machine registry that routes the rows
+REGISTRY_SECONDS = 300
+DEFAULT_FULL_SYNC_SECONDS = 6 * 3600
+
+# Position of ``maquina`` in an EN_CURSO row
+EN_CURSO_MAQUINA = TABLE_COLUMNS[SHEET_EN_CURSO].index("maquina")
+
+# Columns indexed in the SQLite engine for each table
+SQLITE_INDEXES = {
+    SHEET_EN_CURSO: ["bobina_id", "maquina", "fecha"],
+    SHEET_PRODUCCION: ["maquina", "fecha_inicio", "fecha_fin"],
+    SHEET_EVENTOS: ["maquina", "fecha"],
+    SHEET_PLANAS_TURNO: ["fecha"],
+    SHEET_MAQUINAS: ["maquina"],
+}
+
+
+def table_columns(table: str) -> list[str]:
+    """Return the column layout of ``table`` or raise ``ValueError``."""
+    try:
+        return TABLE_COLUMNS[table]
+    except KeyError:
+        raise ValueError(f"Tabla desconocida: {table}") from None
+
+
+class StorageBackend:
+    """
+    Interface shared by all storage engines. Tables are identified by their
+    sheet name (``SHEET_EN_CURSO``, ``SHEET_MAQUINAS``...). Rows are plain
+    lists ordered like the table's column constant.
+    """
+
+    name = "base"
+
+    def get_all(self, table: str) -> pd.DataFrame:
+        """Return every record of ``table`` as a DataFrame."""
+        raise NotImplementedError
+
+    def get_many(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        """
+        Return the records of several tables at once, keyed by table name.
+        Engines that can fetch tables together override this.
+        """
+        return {table: self.get_all(table) for table in dict.fromkeys(tables)}
+
+    def append_row(self, table: str, row: list, key: str = None):
+        """
+        Append a single row to ``table``. ``key`` is an optional idempotency
+        key: engines that retry writes use it to never store a row twice.
+        Returns False if the row was dropped as a duplicate (a repeated key
+        or a double click caught by the write-behind outbox), else True.
+        """
+        return bool(self.append_rows(table, [row]))
+
+    def append_rows(self, table: str, rows: list[list], keys: list[str] = None) -> list[list]:
+        """
+        Append several rows to ``table`` in one operation. ``keys`` are
+        optional idempotency keys, one per row, as in ``append_row``; rows
+        with a key are never taken for a double click. Returns the rows
+        stored (or queued): all of ``rows`` but the dropped duplicates.
+        """
+        raise NotImplementedError
+
+    def start_production(self, row: list):
+        """
+        Append the EN_CURSO ``row`` of a start or reopen only if its machine
+        has no open production in the stored table, checked right before
+        the write rather than against a cached copy. Raises
+        ``MachineOccupiedError`` otherwise.
+        """
+        raise NotImplementedError
+
+    def delete_row_by_bobina(self, bobina_id) -> bool:
+        """
+        Delete the EN_CURSO row whose ``bobina_id`` matches. Returns True if a
+        row was removed.
+        """
+        raise NotImplementedError
+
+    def close_production(self, bobina_id, row: list):
+        """
+        Close an open production: append ``row`` to PRODUCCION and delete the
+        EN_CURSO row of ``bobina_id``. Raises ``BobinaNotFoundError`` if the
+        production is no longer open. Engines that can do both changes in
+        one atomic operation override this default.
+        """
+        if bobina_id_missing(self.get_all(SHEET_EN_CURSO), bobina_id):
+            raise BobinaNotFoundError(bobina_id)
+        self.append_row(SHEET_PRODUCCION, row)
+        self.delete_row_by_bobina(bobina_id)
+
+    def upsert_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        """Update the MAQUINAS row of ``maquina`` or insert it if missing."""
+        raise NotImplementedError
+
+    def upsert_maquinas(self, rows: list[list]):
+        """
+        Update or insert several MAQUINAS ``rows`` (``[maquina,
+        tipo_produccion, lote_of, lote_mp, linea, planta]``; a shorter row
+        leaves the last columns as they are), in one operation where the
+        engine can.
+        """
+        raise NotImplementedError
+
+    def delete_first_rows(self, table: str, rows: list[list]) -> int:
+        """
+        Delete the first ``len(rows)`` rows of ``table`` if they still hold
+        ``rows`` (as returned by ``get_all``). Raises ``TableChangedError``
+        if they do not. Used by the archive job to move old rows out of the
+        append-only sheets; returns the number of rows deleted.
+        """
+        raise NotImplementedError
+
+    def warm_up(self):
+        """
+        Do the slow one-off work of the engine (credentials, token,
+        connections, opening files) ahead of the first request.
+        """
+
+    def pending_writes(self):
+        """
+        Counts of queued, flushed and conflicting writes for engines with a
+        write-behind outbox (``{"pending", "flushed", "conflicts",
+        "last_error"}``), None otherwise.
+        """
+        return None
+
+    def stale_since(self, table: str):
+        """
+        Timestamp (``time.time()``) of the data returned by the last read of
+        ``table`` when it was an old snapshot served because the source was
+        unavailable; None when the data is current.
+        """
+        return None
+
+
+def same_rows(expected: list[list], actual: list[list]) -> bool:
+    """True if both lists hold the same rows (10, 10.0 and "10" are equal)."""
+    if len(expected) != len(actual):
+        return False
+    for a, b in zip(expected, actual):
+        width = max(len(a), len(b))
+        a = [_norm_cell(v) for v in clean_row(_pad_row(a, width))]
+        b = [_norm_cell(v) for v in clean_row(_pad_row(b, width))]
+        if a != b:
+            return False
+    return True
+
+
+def check_machine_free(row: list, open_rows):
+    """
+    Raise ``MachineOccupiedError`` if ``open_rows`` (``(bobina_id, maquina)``
+    pairs of EN_CURSO) include the machine of the EN_CURSO ``row``.
+    """
+    maquina = safe_int(row[EN_CURSO_MAQUINA])
+    for bobina_id, value in open_rows:
+        if maquina is not None and safe_int(value) == maquina:
+            raise MachineOccupiedError(maquina, str(bobina_id).strip())
+
+
+# -----------------------------------------------------------------------------
+# Google Sheets engine
+# -----------------------------------------------------------------------------
+
+def sheets_client_from_env():
+    """
+    Create a gspread client using the service account JSON string. Its
+    requests share the process-wide keep-alive session of the account.
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    from bicopack.sheets_client import QuotaAwareHTTPClient, authorized_session
+
+    sa_json = os.environ.get("GOOGLE_SERVICE_ACCOUNT", "")
+    if not sa_json:
+        raise ValueError("Falta la variable de entorno GOOGLE_SERVICE_ACCOUNT")
+    info = json.loads(sa_json)
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive",
+    ]
+    creds = Credentials.from_service_account_info(info, scopes=scopes)
+    # Cuota, reintentos y circuito compartidos por todas las peticiones
+    return gspread.authorize(creds, http_client=QuotaAwareHTTPClient, session=authorized_session(creds))
+
+
+def _column_letter(col: int) -> str:
+    """Return the A1 column letter(s) of the 1-based column ``col``."""
+    from gspread.utils import rowcol_to_a1
+
+    return rowcol_to_a1(1, max(col, 1)).rstrip("0123456789")
+
+
+def _pad_row(row, width: int) -> list:
+    """Pad or truncate a raw sheet row to ``width`` cells."""
+    row = list(row)[:width]
+    return row + [""] * (width - len(row))
+
+
+def _cell_data(value) -> dict:
+    """Convert a cleaned value to Sheets API ``CellData`` (RAW input)."""
+    if value is None or value == "":
+        return {}
+    if isinstance(value, bool):
+        return {"userEnteredValue": {"boolValue": value}}
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+
+def _header_requests(ws, columns: list[str], position: dict) -> list[dict]:
+    """
+    ``batch_update`` requests writing the headers of ``columns`` in row 1 at
+    their ``position``, widening the sheet first if it has too few columns.
+    """
+    if not columns:
+        return []
+    requests = []
+    width = max(position[c] for c in columns) + 1
+    if width > ws.col_count:
+        requests.append({
+            "appendDimension": {"sheetId": ws.id, "dimension": "COLUMNS", "length": width - ws.col_count}
+        })
+    for col in columns:
+        requests.append({
+            "updateCells": {
+                "range": {
+                    "sheetId": ws.id,
+                    "startRowIndex": 0,
+                    "endRowIndex": 1,
+                    "startColumnIndex": position[col],
+                    "endColumnIndex": position[col] + 1,
+                },
+                "rows": [{"values": [_cell_data(col)]}],
+                "fields": "userEnteredValue",
+            }
+        })
+    return requests
+
+
+def _delete_row_request(ws, row: int) -> dict:
+    """``batch_update`` request deleting the 1-based sheet ``row`` of ``ws``."""
+    return {
+        "deleteDimension": {
+            "range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": row - 1, "endIndex": row}
+        }
+    }
+
+
+def _updated_row(response) -> int:
+    """1-based row written by an ``append_row`` call, or None if unknown."""
+    try:
+        updated = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    match = re.search(r"![A-Z]+(\d+)", updated)
+    return int(match.group(1)) if match else None
+
+
+def records_frame(header: list, rows: list[list]) -> pd.DataFrame:
+    """
+    Build a DataFrame from raw sheet values: rows are padded to the header
+    width and cells are kept as the strings returned by the API. Types are
+    assigned later, once per load, by ``bicopack.schema``.
+    """
+    width = len(header)
+    data = [_pad_row(r, width) for r in rows]
+    return pd.DataFrame(data, columns=header)
+
+
+class _TailState:
+    """Rows already downloaded from an append-only worksheet."""
+
+    def __init__(self, values: list[list]):
+        values = [list(r) for r in values if r is not None]
+        if values == [[]]:
+            values = []
+        self.header = values[0] if values else []
+        width = len(self.header)
+        # Number of sheet rows loaded, header included
+        self.row_count = len(values)
+        self.last_row = _pad_row(values[-1], width) if values else []
+        self.frame = records_frame(self.header, values[1:]) if values else pd.DataFrame()
+        self.synced_at = time.monotonic()
+
+    def expired(self, max_age: float) -> bool:
+        return max_age > 0 and time.monotonic() - self.synced_at >= max_age
+
+    def tail_range(self) -> str:
+        """
+        A1 range of the rows not loaded yet, starting one row early so the
+        last known row can be checked. None if only the header was loaded,
+        in which case a full read is just as cheap.
+        """
+        if self.row_count < 2:
+            return None
+        return f"A{self.row_count}:{_column_letter(len(self.header))}"
+
+    def matches(self, values: list[list]) -> bool:
+        """True if ``values`` starts with the last row already loaded."""
+        return bool(values) and _pad_row(values[0], len(self.header)) == self.last_row
+
+    def extend(self, rows: list[list]):
+        """Append newly downloaded rows to the cached frame."""
+        width = len(self.header)
+        self.frame = pd.concat(
+            [self.frame, records_frame(self.header, rows)],
+            ignore_index=True,
+        )
+        self.row_count += len(rows)
+        self.last_row = _pad_row(rows[-1], width)
+
+
+class SheetsBackend(StorageBackend):
+    """
+    Storage on Google Sheets. EN_CURSO, PRODUCCION, EVENTOS and PLANAS_TURNO
+    live in the spreadsheet ``GOOGLE_SHEET_ID``; MAQUINAS lives in
+    ``GOOGLE_SHEET_ID_MAQUINAS``. The client, spreadsheets and worksheets are
+    opened lazily and reused.
+
+    Append-only sheets (``APPEND_ONLY_SHEETS``) are synced incrementally:
+    the backend remembers how many rows it has loaded and later reads only
+    download the tail, starting at the last known row. If that row no longer
+    matches, the sheet was edited or shrunk and it is downloaded again in
+    full; a full download is also forced every ``full_sync_seconds``.
+
+    EN_CURSO keeps an index from ``bobina_id`` to sheet row, refreshed on
+    every read and kept up to date on appends and deletes. Before a row is
+    deleted its first cell is read back to confirm the index; on mismatch
+    only the ``bobina_id`` column is downloaded to rebuild it. Deletes and
+    closes run under a lock so concurrent sessions never remove a row
+    located with a stale index.
+
+    Requests go through ``QuotaAwareHTTPClient`` (quota, retries, circuit
+    breaker). When a read fails for a transient reason the last good frame
+    of each table is returned instead and ``stale_since`` reports its age,
+    so the app never shows an empty table for a quota error.
+    """
+
+    name = STORAGE_SHEETS
+
+    def __init__(
+        self,
+        client=None,
+        sheet_id: str = None,
+        sheet_id_maquinas: str = None,
+        incremental: bool = None,
+        full_sync_seconds: float = None,
+    ):
+        self._client = client
+        # Backend of the main spreadsheet, for a plant's (see ``for_sheet``)
+        self._parent = None
+        self._sheet_id = sheet_id
+        self._sheet_id_maquinas = sheet_id_maquinas
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._lock = threading.RLock()
+        if incremental is None:
+            incremental = env_flag("BICOPACK_INCREMENTAL_SYNC", default=True)
+        if full_sync_seconds is None:
+            full_sync_seconds = float(
+                os.environ.get("BICOPACK_FULL_SYNC_SECONDS", DEFAULT_FULL_SYNC_SECONDS)
+            )
+        self.incremental = incremental
+        self.full_sync_seconds = full_sync_seconds
+        self._tails = {}
+        self._tail_locks = {}
+        self._bobina_rows = None
+        self._en_curso_lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bicopack-sheets")
+        # Last good frame of each table: (time.time() of the read, frame)
+        self._snapshots = {}
+        self._stale = {}
+
+    def client(self):
+        """Return the gspread client, creating it on first use."""
+        with self._lock:
+            if self._client is None:
+                self._client = self._parent.client() if self._parent is not None else sheets_client_from_env()
+            return self._client
+
+    def _sheet_id_for(self, table: str) -> str:
+        if table == SHEET_MAQUINAS:
+            sheet_id = self._sheet_id_maquinas or os.environ.get("GOOGLE_SHEET_ID_MAQUINAS", "")
+            if not sheet_id:
+                raise ValueError("Falta la variable de entorno GOOGLE_SHEET_ID_MAQUINAS")
+        else:
+            sheet_id = self._sheet_id or os.environ.get("GOOGLE_SHEET_ID", "")
+            if not sheet_id:
+                raise ValueError("Falta la variable de entorno GOOGLE_SHEET_ID")
+        return sheet_id
+
+    def spreadsheet(self, table: str):
+        """Open (once) the spreadsheet that holds ``table``."""
+        return self.open_spreadsheet(self._sheet_id_for(table))
+
+    def open_spreadsheet(self, sheet_id: str):
+        """
+        Open (once) the spreadsheet ``sheet_id``. The backends of the plants
+        (``for_sheet``) use the cache of the main one, keyed by sheet id.
+        """
+        if self._parent is not None:
+            return self._parent.open_spreadsheet(sheet_id)
+        with self._lock:
+            if sheet_id not in self._spreadsheets:
+                self._spreadsheets[sheet_id] = self.client().open_by_key(sheet_id)
+            return self._spreadsheets[sheet_id]
+
+    def for_sheet(self, sheet_id: str) -> "SheetsBackend":
+        """
+        Backend for ``sheet_id``, a spreadsheet with the same sheets as the
+        main one (a plant of ``ShardedBackend``). It shares this backend's
+        client, token and opened spreadsheets; MAQUINAS stays here.
+        """
+        shard = SheetsBackend(
+            sheet_id=sheet_id,
+            sheet_id_maquinas=self._sheet_id_maquinas,
+            incremental=self.incremental,
+            full_sync_seconds=self.full_sync_seconds,
+        )
+        shard._parent = self
+        return shard
+
+    def worksheet(self, table: str):
+        """Open (once) the worksheet for ``table``."""
+        table_columns(table)
+        with self._lock:
+            if table not in self._worksheets:
+                self._worksheets[table] = self.spreadsheet(table).worksheet(table)
+            return self._worksheets[table]
+
+    def warm_up(self):
+        """
+        Create the client (credentials, token, connection pool) and open
+        both spreadsheets and their worksheets, with one metadata request
+        per spreadsheet.
+        """
+        by_sheet = {}
+        for table in TABLE_COLUMNS:
+            if table == SHEET_MAQUINAS and self._parent is not None:
+                continue
+            by_sheet.setdefault(self._sheet_id_for(table), []).append(table)
+        for tables in by_sheet.values():
+            worksheets = {ws.title: ws for ws in self.spreadsheet(tables[0]).worksheets()}
+            with self._lock:
+                for table in tables:
+                    if table in worksheets:
+                        self._worksheets.setdefault(table, worksheets[table])
+
+    # -- last good snapshots --------------------------------------------------
+
+    def _with_snapshots(self, tables: list[str], load) -> dict[str, pd.DataFrame]:
+        try:
+            frames = load()
+        except Exception as exc:
+            from bicopack.sheets_client import is_transient
+
+            with self._lock:
+                available = all(t in self._snapshots for t in tables)
+            if not (is_transient(exc) and available):
+                raise
+            logger.warning("Google Sheets no responde; se sirven los últimos datos leídos: %s", exc)
+            with self._lock:
+                for table in tables:
+                    self._stale[table] = self._snapshots[table][0]
+                return {t: self._snapshots[t][1].copy() for t in tables}
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                self._snapshots[table] = (now, frames[table])
+                self._stale.pop(table, None)
+        return frames
+
+    def stale_since(self, table: str):
+        with self._lock:
+            return self._stale.get(table)
+
+    def get_all(self, table: str) -> pd.DataFrame:
+        return self._with_snapshots([table], lambda: {table: self._get_all(table)})[table]
+
+    def _get_all(self, table: str) -> pd.DataFrame:
+        if self.incremental and table in APPEND_ONLY_SHEETS:
+            return self._get_all_incremental(table)
+        ws = self.worksheet(table)
+        if table == SHEET_EN_CURSO:
+            with self._en_curso_lock:
+                values = ws.get(pad_values=True)
+                return self._en_curso_frame(values)
+        values = ws.get_all_values()
+        if not values:
+            return pd.DataFrame()
+        return records_frame(values[0], values[1:])
+
+    def _table_lock(self, table: str):
+        with self._lock:
+            return self._tail_locks.setdefault(table, threading.Lock())
+
+    def _get_all_incremental(self, table: str) -> pd.DataFrame:
+        with self._table_lock(table):
+            state = self._tails.get(table)
+            if state is None or state.expired(self.full_sync_seconds):
+                state = self._full_sync(table)
+            else:
+                state = self._tail_sync(table, state)
+            return state.frame.copy()
+
+    def _full_sync(self, table: str) -> _TailState:
+        ws = self.worksheet(table)
+        state = _TailState(ws.get(pad_values=True))
+        self._tails[table] = state
+        return state
+
+    def _tail_sync(self, table: str, state: _TailState) -> _TailState:
+        tail_range = state.tail_range()
+        if tail_range is None:
+            return self._full_sync(table)
+        ws = self.worksheet(table)
+        values = ws.get(tail_range, pad_values=True)
+        return self._apply_tail(table, state, values)
+
+    def _apply_tail(self, table: str, state: _TailState, values: list[list]) -> _TailState:
+        values = [list(r) for r in values]
+        if not state.matches(values):
+            # The sheet was edited or shrunk above the tail: reload it entirely
+            return self._full_sync(table)
+        if len(values) > 1:
+            state.extend(values[1:])
+        return state
+
+    def get_many(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        """
+        Load several tables with one round trip per spreadsheet: every main
+        spreadsheet range goes in a single ``values_batch_get`` request while
+        MAQUINAS is fetched concurrently from its own spreadsheet on a worker
+        thread. Append-only sheets already loaded only request their tail.
+        """
+        tables = list(dict.fromkeys(tables))
+        for table in tables:
+            table_columns(table)
+        return self._with_snapshots(tables, lambda: self._get_many(tables))
+
+    def _get_many(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        main = [t for t in tables if t != SHEET_MAQUINAS]
+        future = None
+        if SHEET_MAQUINAS in tables:
+            future = self._executor.submit(self._get_all, SHEET_MAQUINAS)
+        frames = {}
+        if main:
+            frames.update(self._batch_get_main(main))
+        if future is not None:
+            frames[SHEET_MAQUINAS] = future.result()
+        return {table: frames[table] for table in tables}
+
+    def _batch_get_main(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        from gspread.utils import absolute_range_name
+
+        incremental = sorted(t for t in tables if self.incremental and t in APPEND_ONLY_SHEETS)
+        locks = [self._table_lock(t) for t in incremental]
+        for lock in locks:
+            lock.acquire()
+        try:
+            plans = []
+            for table in tables:
+                state = self._tails.get(table) if table in incremental else None
+                if state is not None and (
+                    state.expired(self.full_sync_seconds) or state.tail_range() is None
+                ):
+                    state = None
+                if state is not None:
+                    plans.append((table, state, absolute_range_name(table, state.tail_range())))
+                else:
+                    plans.append((table, None, absolute_range_name(table)))
+            response = self.spreadsheet(SHEET_EN_CURSO).values_batch_get(
+                [rng for _, _, rng in plans]
+            )
+            value_ranges = response.get("valueRanges", [])
+            frames = {}
+            for (table, state, _), value_range in zip(plans, value_ranges):
+                values = value_range.get("values", [])
+                if table in incremental:
+                    if state is None:
+                        state = _TailState(values)
+                        self._tails[table] = state
+                    else:
+                        state = self._apply_tail(table, state, values)
+                    frames[table] = state.frame.copy()
+                elif table == SHEET_EN_CURSO:
+                    with self._en_curso_lock:
+                        frames[table] = self._en_curso_frame(values)
+                elif values:
+                    frames[table] = records_frame(values[0], values[1:])
+                else:
+                    frames[table] = pd.DataFrame()
+            return frames
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    # -- EN_CURSO row index ---------------------------------------------------
+
+    def _en_curso_frame(self, values: list[list]) -> pd.DataFrame:
+        """Build the EN_CURSO frame from raw values and refresh the index."""
+        values = [list(r) for r in values]
+        if values == [[]]:
+            values = []
+        self._bobina_rows = self._index_column([r[0] if r else "" for r in values])
+        if not values:
+            return pd.DataFrame()
+        return records_frame(values[0], values[1:])
+
+    @staticmethod
+    def _index_column(column: list) -> dict:
+        """Map each ``bobina_id`` of the first column to its 1-based row."""
+        index = {}
+        for i, value in enumerate(column):
+            key = str(value).strip()
+            if i > 0 and key and key not in index:
+                index[key] = i + 1
+        return index
+
+    def _rebuild_bobina_index(self, ws):
+        self._bobina_rows = self._index_column(ws.col_values(1))
+
+    def _locate_bobina(self, bobina_id):
+        """
+        Return ``(row, below)``: the current 1-based sheet row of
+        ``bobina_id`` in EN_CURSO (None if it is not there) and the values of
+        the row below it, read back together to confirm the index. Must be
+        called with ``_en_curso_lock`` held.
+        """
+        key = str(bobina_id).strip()
+        ws = self.worksheet(SHEET_EN_CURSO)
+        for _ in range(2):
+            if self._bobina_rows is None:
+                self._rebuild_bobina_index(ws)
+            row = self._bobina_rows.get(key)
+            if row is None:
+                return None, []
+            last = _column_letter(len(TABLE_COLUMNS[SHEET_EN_CURSO]))
+            values = [list(r) for r in ws.get(f"A{row}:{last}{row + 1}")]
+            if values and values[0] and str(values[0][0]).strip() == key:
+                return row, values[1] if len(values) > 1 else []
+            self._bobina_rows = None
+        return None, []
+
+    def _delete_en_curso(self, bobina_id, requests: list = ()) -> bool:
+        """
+        Delete the EN_CURSO row of ``bobina_id`` with one ``batch_update``
+        that applies ``requests`` first. Returns False if it is not there.
+        Must be called with ``_en_curso_lock`` held.
+
+        Sheets has no conditional delete: the row goes by index, so a writer
+        in another process (the API, another server, a manual edit) that
+        removes a row above it between the read-back and the batch makes the
+        batch delete the row below instead. The first column is read again
+        afterwards; if ``bobina_id`` moved up by one, the row deleted by
+        mistake is appended back and the right one deleted. Any other shift
+        is logged, since the row removed by mistake cannot be told.
+        """
+        key = str(bobina_id).strip()
+        ws = self.worksheet(SHEET_EN_CURSO)
+        target, below = self._locate_bobina(key)
+        if target is None:
+            return False
+        self.spreadsheet(SHEET_EN_CURSO).batch_update({"requests": [*requests, _delete_row_request(ws, target)]})
+        self._rebuild_bobina_index(ws)
+        moved = self._bobina_rows.get(key)
+        if moved is None:
+            return True
+        fixup = [_delete_row_request(ws, moved)]
+        if moved == target - 1 and below and str(below[0]).strip():
+            logger.warning("EN_CURSO cambió durante el borrado de %s; se repone %s", key, below[0])
+            fixup.append({
+                "appendCells": {
+                    "sheetId": ws.id,
+                    "rows": [{"values": [_cell_data(v) for v in clean_row(below)]}],
+                    "fields": "userEnteredValue",
+                }
+            })
+        else:
+            logger.error("EN_CURSO cambió durante el borrado de %s y se borró otra fila (la %s)", key, target)
+        self.spreadsheet(SHEET_EN_CURSO).batch_update({"requests": fixup})
+        self._bobina_rows = None
+        return True
+
+    # -- writes ---------------------------------------------------------------
+
+    def append_row(self, table: str, row: list, key: str = None):
+        ws = self.worksheet(table)
+        row = clean_row(row)
+        if table != SHEET_EN_CURSO:
+            ws.append_row(row, value_input_option="RAW")
+            return True
+        with self._en_curso_lock:
+            self._append_en_curso(ws, row)
+        return True
+
+    def _append_en_curso(self, ws, row: list):
+        """Append ``row`` to EN_CURSO and index it. Needs ``_en_curso_lock``."""
+        response = ws.append_row(row, value_input_option="RAW")
+        written = _updated_row(response)
+        if written is None or self._bobina_rows is None:
+            self._bobina_rows = None
+        elif row and str(row[0]).strip():
+            self._bobina_rows.setdefault(str(row[0]).strip(), written)
+
+    def start_production(self, row: list):
+        """
+        Read the ``bobina_id`` to ``maquina`` columns of EN_CURSO (a few
+        dozen cells, also used to refresh the row index) and append ``row``
+        if its machine is free. Two processes can still interleave between
+        the read and the append; the shared cache's write lock closes that
+        window between the workers of one server.
+        """
+        ws = self.worksheet(SHEET_EN_CURSO)
+        row = clean_row(row)
+        with self._en_curso_lock:
+            values = [list(r) for r in ws.get(f"A1:{_column_letter(EN_CURSO_MAQUINA + 1)}")]
+            self._bobina_rows = self._index_column([r[0] if r else "" for r in values])
+            open_rows = [(r[0], r[EN_CURSO_MAQUINA]) for r in values[1:] if len(r) > EN_CURSO_MAQUINA]
+            check_machine_free(row, open_rows)
+            self._append_en_curso(ws, row)
+
+    def append_rows(self, table: str, rows: list[list], keys: list[str] = None) -> list[list]:
+        if not rows:
+            return rows
+        ws = self.worksheet(table)
+        if table != SHEET_EN_CURSO:
+            ws.append_rows([clean_row(r) for r in rows], value_input_option="RAW")
+            return rows
+        with self._en_curso_lock:
+            ws.append_rows([clean_row(r) for r in rows], value_input_option="RAW")
+            # Rebuilt lazily on the next delete
+            self._bobina_rows = None
+        return rows
+
+    def delete_row_by_bobina(self, bobina_id) -> bool:
+        with self._en_curso_lock:
+            return self._delete_en_curso(bobina_id)
+
+    def close_production(self, bobina_id, row: list):
+        """
+        Append ``row`` to PRODUCCION and delete the EN_CURSO row of
+        ``bobina_id`` with a single ``batch_update`` request, which Google
+        applies atomically: either both changes happen or neither does.
+        The row is deleted by index, checked afterwards as described in
+        ``_delete_en_curso``.
+        """
+        produccion = self.worksheet(SHEET_PRODUCCION)
+        append = {
+            "appendCells": {
+                "sheetId": produccion.id,
+                "rows": [{"values": [_cell_data(v) for v in clean_row(row)]}],
+                "fields": "userEnteredValue",
+            }
+        }
+        with self._en_curso_lock:
+            if not self._delete_en_curso(bobina_id, [append]):
+                raise BobinaNotFoundError(bobina_id)
+
+    def upsert_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        self.upsert_maquinas([[maquina, tipo_produccion, lote_of, lote_mp]])
+
+    def upsert_maquinas(self, rows: list[list]):
+        """
+        Read MAQUINAS once and write only the cells that differ plus the
+        rows of new machines with a single ``batch_update`` request. Cells
+        are placed by the header row, so ``linea`` and ``planta`` may be in
+        any column. A column the rows set that the sheet does not have yet
+        (``linea`` and ``planta`` in older sheets) gets its header after the
+        last one, in the same request.
+        """
+        if not rows:
+            return
+        ws_m = self.worksheet(SHEET_MAQUINAS)
+        data = ws_m.get_all_values()
+        header = [str(h).strip() for h in data[0]] if data else []
+        columns = table_columns(SHEET_MAQUINAS)
+        used = {c for row in rows for c in columns[: len(row)]}
+        missing = [c for c in columns if c not in header and (c in used or c == "maquina")]
+        position = {c: header.index(c) for c in columns if c in header}
+        last = max([len(header)] + [len(r) for r in data])
+        position.update({c: last + i for i, c in enumerate(missing)})
+        requests = _header_requests(ws_m, missing, position)
+        # Fila de cada máquina existente (data[0] contiene encabezados); como
+        # antes, manda la primera
+        row_index = {}
+        for idx, row in enumerate(data[1:], start=2):
+            if len(row) > position["maquina"]:
+                row_index.setdefault(safe_int(row[position["maquina"]], -1), idx)
+        new_rows = []
+        for values in rows:
+            values = dict(zip(columns, clean_row(values)))
+            target = row_index.get(int(values["maquina"]))
+            if target is None:
+                # No existe, insertar una nueva fila al final
+                cells = [""] * (max(position[c] for c in values) + 1)
+                for col, value in values.items():
+                    cells[position[col]] = value
+                new_rows.append({"values": [_cell_data(v) for v in cells]})
+                continue
+            current = _pad_row(data[target - 1], max(position.values()) + 1)
+            for col, value in values.items():
+                pos = position[col]
+                if str(current[pos]).strip() == str(value).strip():
+                    continue
+                requests.append({
+                    "updateCells": {
+                        "range": {
+                            "sheetId": ws_m.id,
+                            "startRowIndex": target - 1,
+                            "endRowIndex": target,
+                            "startColumnIndex": pos,
+                            "endColumnIndex": pos + 1,
+                        },
+                        "rows": [{"values": [_cell_data(value)]}],
+                        "fields": "userEnteredValue",
+                    }
+                })
+        if new_rows:
+            requests.append({
+                "appendCells": {"sheetId": ws_m.id, "rows": new_rows, "fields": "userEnteredValue"}
+            })
+        if requests:
+            self.spreadsheet(SHEET_MAQUINAS).batch_update({"requests": requests})
+        if missing:
+            logger.info("Añadidas a %s las columnas %s", SHEET_MAQUINAS, ", ".join(missing))
+
+    def delete_first_rows(self, table: str, rows: list[list]) -> int:
+        """
+        Read back the first ``len(rows)`` data rows and delete them with one
+        request if they are unchanged. Rows appended meanwhile go below them
+        and are not affected. The incremental state of the sheet is dropped
+        so the next read downloads it again.
+        """
+        if not rows:
+            return 0
+        ws = self.worksheet(table)
+        width = max(len(r) for r in rows)
+        last = len(rows) + 1
+        with self._table_lock(table), self._en_curso_lock:
+            current = ws.get(f"A2:{_column_letter(width)}{last}", pad_values=True)
+            if not same_rows(rows, [list(r) for r in current]):
+                raise TableChangedError(table)
+            ws.delete_rows(2, last)
+            self._tails.pop(table, None)
+            if table == SHEET_EN_CURSO:
+                self._bobina_rows = None
+        return len(rows)
+
+
+# -----------------------------------------------------------------------------
+# SQLite engine
+# -----------------------------------------------------------------------------
+
+def _quote(identifier: str) -> str:
+    """Quote an SQLite identifier (table or column name)."""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Local storage in a single SQLite file. Each table keeps the sheet column
+    layout plus an autoincrement ``_rowid`` that preserves append order, so
+    reads return rows in the same order as the sheet. Columns are declared
+    without a type so values keep the type they were written with, exactly
+    like cells in Google Sheets.
+    """
+
+    name = STORAGE_SQLITE
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            for table, columns in TABLE_COLUMNS.items():
+                cols_sql = ", ".join(_quote(c) for c in columns)
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {_quote(table)} "
+                    f"(_rowid INTEGER PRIMARY KEY AUTOINCREMENT, {cols_sql})"
+                )
+                # Columnas añadidas después de crear el fichero (linea y planta)
+                existing = {r[1] for r in self._conn.execute(f"PRAGMA table_info({_quote(table)})")}
+                for col in columns:
+                    if col not in existing:
+                        self._conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)}")
+                for col in SQLITE_INDEXES.get(table, []):
+                    self._conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{table}_{col}')} "
+                        f"ON {_quote(table)} ({_quote(col)})"
+                    )
+
+    def get_all(self, table: str) -> pd.DataFrame:
+        columns = table_columns(table)
+        cols_sql = ", ".join(_quote(c) for c in columns)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {cols_sql} FROM {_quote(table)} ORDER BY _rowid"
+            ).fetchall()
+        return pd.DataFrame(rows, columns=columns)
+
+    def count(self, table: str) -> int:
+        """Return the number of rows stored in ``table``."""
+        table_columns(table)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0]
+
+    def append_rows(self, table: str, rows: list[list], keys: list[str] = None) -> list[list]:
+        if not rows:
+            return rows
+        columns = table_columns(table)
+        width = len(columns)
+        values = []
+        for row in rows:
+            row = clean_row(list(row)[:width])
+            values.append(row + [""] * (width - len(row)))
+        cols_sql = ", ".join(_quote(c) for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO {_quote(table)} ({cols_sql}) VALUES ({marks})",
+                values,
+            )
+        return rows
+
+    def start_production(self, row: list):
+        """Check the machine and insert in one ``BEGIN IMMEDIATE`` transaction."""
+        columns = table_columns(SHEET_EN_CURSO)
+        values = clean_row(list(row)[: len(columns)])
+        values += [""] * (len(columns) - len(values))
+        cols_sql = ", ".join(_quote(c) for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        table = _quote(SHEET_EN_CURSO)
+        maquina = safe_int(values[EN_CURSO_MAQUINA])
+        with self._lock, self._conn:
+            # Bloquea la escritura desde la lectura: otro proceso no puede colarse
+            self._conn.execute("BEGIN IMMEDIATE")
+            # La máquina puede estar guardada como número o como texto
+            open_rows = self._conn.execute(
+                f"SELECT bobina_id, maquina FROM {table} WHERE maquina = ? OR maquina = ?",
+                (maquina, str(maquina)),
+            ).fetchall()
+            check_machine_free(values, open_rows)
+            self._conn.execute(f"INSERT INTO {table} ({cols_sql}) VALUES ({marks})", values)
+
+    def delete_row_by_bobina(self, bobina_id) -> bool:
+        table = _quote(SHEET_EN_CURSO)
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                f"DELETE FROM {table} WHERE _rowid = ("
+                f"SELECT _rowid FROM {table} WHERE bobina_id = ? ORDER BY _rowid LIMIT 1)",
+                (str(bobina_id).strip(),),
+            )
+            return cur.rowcount > 0
+
+    def close_production(self, bobina_id, row: list):
+        """Append to PRODUCCION and delete from EN_CURSO in one transaction."""
+        columns = table_columns(SHEET_PRODUCCION)
+        values = clean_row(list(row)[: len(columns)])
+        values += [""] * (len(columns) - len(values))
+        cols_sql = ", ".join(_quote(c) for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        en_curso = _quote(SHEET_EN_CURSO)
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                f"DELETE FROM {en_curso} WHERE _rowid = ("
+                f"SELECT _rowid FROM {en_curso} WHERE bobina_id = ? ORDER BY _rowid LIMIT 1)",
+                (str(bobina_id).strip(),),
+            )
+            if cur.rowcount == 0:
+                raise BobinaNotFoundError(bobina_id)
+            self._conn.execute(
+                f"INSERT INTO {_quote(SHEET_PRODUCCION)} ({cols_sql}) VALUES ({marks})",
+                values,
+            )
+
+    def upsert_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        self.upsert_maquinas([[maquina, tipo_produccion, lote_of, lote_mp]])
+
+    def upsert_maquinas(self, rows: list[list]):
+        table = _quote(SHEET_MAQUINAS)
+        columns = table_columns(SHEET_MAQUINAS)
+        with self._lock, self._conn:
+            for row in rows:
+                values = dict(zip(columns, clean_row(row)))
+                maquina = int(values.pop("maquina"))
+                # La máquina puede estar guardada como número o como texto
+                found = self._conn.execute(
+                    f"SELECT _rowid FROM {table} WHERE maquina = ? OR maquina = ? ORDER BY _rowid LIMIT 1",
+                    (maquina, str(maquina)),
+                ).fetchone()
+                if found is None:
+                    cols_sql = ", ".join(_quote(c) for c in ["maquina", *values])
+                    marks = ", ".join("?" for _ in range(len(values) + 1))
+                    self._conn.execute(
+                        f"INSERT INTO {table} ({cols_sql}) VALUES ({marks})", (maquina, *values.values())
+                    )
+                elif values:
+                    sets = ", ".join(f"{_quote(c)} = ?" for c in values)
+                    self._conn.execute(
+                        f"UPDATE {table} SET {sets} WHERE _rowid = ?", (*values.values(), found[0])
+                    )
+
+    def delete_first_rows(self, table: str, rows: list[list]) -> int:
+        if not rows:
+            return 0
+        columns = table_columns(table)
+        cols_sql = ", ".join(_quote(c) for c in columns)
+        with self._lock, self._conn:
+            first = self._conn.execute(
+                f"SELECT _rowid, {cols_sql} FROM {_quote(table)} ORDER BY _rowid LIMIT ?",
+                (len(rows),),
+            ).fetchall()
+            if not same_rows(rows, [list(r[1:]) for r in first]):
+                raise TableChangedError(table)
+            self._conn.execute(
+                f"DELETE FROM {_quote(table)} WHERE _rowid <= ?", (first[-1][0],)
+            )
+        return len(rows)
+
+    def replace_table(self, table: str, df: pd.DataFrame):
+        """Replace the whole content of ``table`` with the rows of ``df``."""
+        columns = table_columns(table)
+        rows = []
+        if df is not None and not df.empty:
+            for col in columns:
+                if col not in df.columns:
+                    df = df.assign(**{col: ""})
+            rows = df[columns].values.tolist()
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {_quote(table)}")
+        self.append_rows(table, rows)
+
+
+# -----------------------------------------------------------------------------
+# Local storage mirrored to Google Sheets
+# -----------------------------------------------------------------------------
+
+class MirroredBackend(StorageBackend):
+    """
+    Read and write on ``primary`` and replicate every write to ``mirror``.
+    Mirror failures are logged but never block the operator: the local store
+    is the source of truth. Empty primary tables are seeded from the mirror
+    when the backend is created.
+    """
+
+    def __init__(self, primary: "SQLiteBackend | ShardedBackend", mirror: StorageBackend, seed: bool = True):
+        self.primary = primary
+        self.mirror = mirror
+        self.name = f"{primary.name}+{mirror.name}"
+        if seed:
+            self._seed_empty_tables()
+
+    def _seed_empty_tables(self):
+        # MAQUINAS primero: un primario por plantas reparte el resto por ella
+        tables = [SHEET_MAQUINAS, *(t for t in TABLE_COLUMNS if t != SHEET_MAQUINAS)]
+        for table in tables:
+            try:
+                if self.primary.count(table) == 0:
+                    self.primary.replace_table(table, self.mirror.get_all(table))
+            except Exception:
+                logger.exception("No se pudo copiar %s desde el espejo", table)
+
+    def _mirror(self, method: str, *args):
+        try:
+            getattr(self.mirror, method)(*args)
+        except Exception:
+            logger.exception("Fallo al replicar %s en el espejo", method)
+
+    def get_all(self, table: str) -> pd.DataFrame:
+        return self.primary.get_all(table)
+
+    def get_many(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        return self.primary.get_many(tables)
+
+    def append_row(self, table: str, row: list, key: str = None):
+        stored = self.primary.append_row(table, row)
+        self._mirror("append_row", table, row, key)
+        return stored
+
+    def append_rows(self, table: str, rows: list[list], keys: list[str] = None) -> list[list]:
+        stored = self.primary.append_rows(table, rows, keys)
+        self._mirror("append_rows", table, rows, keys)
+        return stored
+
+    def start_production(self, row: list):
+        self.primary.start_production(row)
+        self._mirror("append_row", SHEET_EN_CURSO, row)
+
+    def delete_row_by_bobina(self, bobina_id) -> bool:
+        deleted = self.primary.delete_row_by_bobina(bobina_id)
+        if deleted:
+            self._mirror("delete_row_by_bobina", bobina_id)
+        return deleted
+
+    def close_production(self, bobina_id, row: list):
+        self.primary.close_production(bobina_id, row)
+        self._mirror("close_production", bobina_id, row)
+
+    def upsert_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        self.primary.upsert_maquina(maquina, tipo_produccion, lote_of, lote_mp)
+        self._mirror("upsert_maquina", maquina, tipo_produccion, lote_of, lote_mp)
+
+    def upsert_maquinas(self, rows: list[list]):
+        self.primary.upsert_maquinas(rows)
+        self._mirror("upsert_maquinas", rows)
+
+    def delete_first_rows(self, table: str, rows: list[list]) -> int:
+        deleted = self.primary.delete_first_rows(table, rows)
+        self._mirror("delete_first_rows", table, rows)
+        return deleted
+
+    def warm_up(self):
+        self.primary.warm_up()
+        self._mirror("warm_up")
+
+    def pending_writes(self):
+        return self.mirror.pending_writes()
+
+
+# -----------------------------------------------------------------------------
+# One engine per plant
+# -----------------------------------------------------------------------------
+
+class ShardedBackend(StorageBackend):
+    """
+    Rows of several plants, each plant in its own engine (a spreadsheet or
+    a SQLite file) so no single spreadsheet has to hold a whole company.
+    ``home`` keeps MAQUINAS, PLANAS_TURNO and the plants without an engine
+    of their own; every other row goes to the engine of its machine's plant
+    (``bicopack.registry``). Reads return the rows of ``home`` followed by
+    those of each plant, fetched concurrently.
+
+    ``delete_first_rows`` splits the rows by the counts of the last read of
+    the table, which is the read the archive job takes its block from; each
+    engine still checks its part before deleting it.
+    """
+
+    def __init__(self, home: StorageBackend, shards: dict, registry_seconds: float = REGISTRY_SECONDS):
+        self.home = home
+        self.shards = dict(shards)
+        self.name = f"{home.name}+plantas"
+        self.registry_seconds = registry_seconds
+        self._registry = None
+        self._registry_at = 0.0
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.shards)), thread_name_prefix="bicopack-plantas")
+
+    def engines(self) -> list:
+        return [self.home, *self.shards.values()]
+
+    def registry(self, refresh: bool = False) -> MachineRegistry:
+        """Registry of the machines in MAQUINAS, read again every ``registry_seconds``."""
+        with self._lock:
+            registry = self._registry
+            expired = time.monotonic() - self._registry_at > self.registry_seconds
+        if registry is None or refresh or expired:
+            registry = MachineRegistry.from_frame(self.home.get_all(SHEET_MAQUINAS))
+            with self._lock:
+                self._registry = registry
+                self._registry_at = time.monotonic()
+        return registry
+
+    def engine_for(self, table: str, row: list) -> StorageBackend:
+        """Engine that stores ``row`` of ``table``."""
+        columns = TABLE_COLUMNS[table]
+        if table == SHEET_MAQUINAS or "maquina" not in columns:
+            return self.home
+        maquina = safe_int(_pad_row(row, len(columns))[columns.index("maquina")])
+        registry = self.registry()
+        if maquina not in registry:
+            # Puede haberse dado de alta desde otro proceso
+            registry = self.registry(refresh=True)
+        return self.shards.get(registry.plant_of(maquina), self.home)
+
+    # -- reads ------------------------------------------------------------------
+
+    def get_all(self, table: str) -> pd.DataFrame:
+        return self.get_many([table])[table]
+
+    def get_many(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        tables = list(dict.fromkeys(tables))
+        sharded = [t for t in tables if t != SHEET_MAQUINAS]
+        futures = [self._executor.submit(engine.get_many, sharded) for engine in self.shards.values()] if sharded else []
+        frames = self.home.get_many(tables)
+        parts = [future.result() for future in futures]
+        for table in sharded:
+            pieces = [frames[table]] + [part[table] for part in parts]
+            with self._lock:
+                self._counts[table] = [len(piece) for piece in pieces]
+            pieces = [piece for piece in pieces if not piece.empty]
+            if pieces:
+                frames[table] = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0]
+        return frames
+
+    def stale_since(self, table: str):
+        stale = [s for s in (engine.stale_since(table) for engine in self.engines()) if s is not None]
+        return min(stale) if stale else None
+
+    def count(self, table: str) -> int:
+        """Return the number of rows of ``table`` over every engine."""
+        engines = [self.home] if table == SHEET_MAQUINAS else self.engines()
+        return sum(engine.count(table) for engine in engines)
+
+    # -- writes -----------------------------------------------------------------
+
+    def append_row(self, table: str, row: list, key: str = None):
+        return self.engine_for(table, row).append_row(table, row, key=key)
+
+    def append_rows(self, table: str, rows: list[list], keys: list[str] = None) -> list[list]:
+        groups = {}
+        for i, row in enumerate(rows):
+            groups.setdefault(self.engine_for(table, row), []).append(i)
+        stored = []
+        for engine, indexes in groups.items():
+            group_keys = None if keys is None else [keys[i] for i in indexes]
+            stored.extend(engine.append_rows(table, [rows[i] for i in indexes], group_keys))
+        return stored
+
+    def start_production(self, row: list):
+        self.engine_for(SHEET_EN_CURSO, row).start_production(row)
+
+    def delete_row_by_bobina(self, bobina_id) -> bool:
+        return any(engine.delete_row_by_bobina(bobina_id) for engine in self.engines())
+
+    def close_production(self, bobina_id, row: list):
+        engine = self.engine_for(SHEET_PRODUCCION, row)
+        try:
+            engine.close_production(bobina_id, row)
+        except BobinaNotFoundError:
+            # La máquina ha cambiado de planta con la producción abierta
+            for other in self.engines():
+                if other is not engine and not bobina_id_missing(other.get_all(SHEET_EN_CURSO), bobina_id):
+                    other.close_production(bobina_id, row)
+                    return
+            raise
+
+    def upsert_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        self.upsert_maquinas([[maquina, tipo_produccion, lote_of, lote_mp]])
+
+    def upsert_maquinas(self, rows: list[list]):
+        self.home.upsert_maquinas(rows)
+        with self._lock:
+            self._registry = None
+
+    def delete_first_rows(self, table: str, rows: list[list]) -> int:
+        if not rows:
+            return 0
+        with self._lock:
+            counts = self._counts.get(table)
+        if counts is None:
+            raise TableChangedError(table)
+        deleted = 0
+        start = 0
+        for engine, count in zip(self.engines(), counts):
+            part = rows[start: start + count]
+            start += count
+            if part:
+                deleted += engine.delete_first_rows(table, part)
+        return deleted
+
+    def replace_table(self, table: str, df: pd.DataFrame):
+        """
+        Replace ``table`` on every engine with the rows of ``df`` of its
+        plant; an engine with no rows in ``df`` is left empty.
+        """
+        columns = table_columns(table)
+        with self._lock:
+            self._counts.pop(table, None)
+        if table == SHEET_MAQUINAS:
+            self.home.replace_table(table, df)
+            with self._lock:
+                self._registry = None
+            return
+        groups = {engine: [] for engine in self.engines()}
+        if df is not None and not df.empty:
+            for col in columns:
+                if col not in df.columns:
+                    df = df.assign(**{col: ""})
+            for row in df[columns].values.tolist():
+                groups[self.engine_for(table, row)].append(row)
+        for engine, rows in groups.items():
+            engine.replace_table(table, pd.DataFrame(rows, columns=columns))
+
+    def warm_up(self):
+        for engine in self.engines():
+            engine.warm_up()
+
+
+def plants_from_env() -> dict:
+    """
+    Plants with an engine of their own, from ``BICOPACK_PLANTAS``: a JSON
+    object ``{"<planta>": {"sheet_id": "...", "sqlite_path": "..."}}``.
+    """
+    raw = os.environ.get("BICOPACK_PLANTAS", "").strip()
+    if not raw:
+        return {}
+    return {str(planta).strip(): config for planta, config in json.loads(raw).items()}
+
+
+def with_plant_shards(home: StorageBackend, setting: str, make) -> StorageBackend:
+    """
+    Wrap ``home`` in a ``ShardedBackend`` with one engine per plant of
+    ``BICOPACK_PLANTAS``, built by ``make`` from the plant's ``setting``.
+    """
+    plantas = plants_from_env()
+    if not plantas:
+        return home
+    shards = {}
+    for planta, config in plantas.items():
+        value = str((config or {}).get(setting, "")).strip()
+        if not value:
+            raise ValueError(f"BICOPACK_PLANTAS: falta {setting} de la planta {planta}")
+        shards[planta] = make(value)
+    return ShardedBackend(home, shards)
+
+
+# -----------------------------------------------------------------------------
+# Write-behind outbox
+# -----------------------------------------------------------------------------
+
+class WriteBehindBackend(StorageBackend):
+    """
+    Queue appends and EN_CURSO removals in a durable ``Outbox`` and return
+    immediately; an ``OutboxFlusher`` thread sends them to ``inner`` in
+    batches. Reads come from ``inner`` with the pending writes applied on
+    top, so the operator sees a saved row right away. Starts, closes and
+    removals are checked against that view before they are queued, so they
+    fail here rather than in the flusher. Machine configuration writes are
+    not queued.
+    """
+
+    def __init__(self, inner: StorageBackend, outbox, start: bool = True):
+        self.inner = inner
+        self.outbox = outbox
+        self.name = f"{inner.name}+outbox"
+        self._check_lock = threading.Lock()
+        self.flusher = OutboxFlusher(outbox, inner)
+        if start:
+            self.flusher.start()
+
+    def get_all(self, table: str) -> pd.DataFrame:
+        return self.outbox.overlay(table, self.inner.get_all(table))
+
+    def get_many(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        frames = self.inner.get_many(tables)
+        return {table: self.outbox.overlay(table, df) for table, df in frames.items()}
+
+    def append_row(self, table: str, row: list, key: str = None):
+        table_columns(table)
+        queued = self.outbox.enqueue_append(table, row, key)
+        self.flusher.wake()
+        return queued
+
+    def append_rows(self, table: str, rows: list[list], keys: list[str] = None) -> list[list]:
+        table_columns(table)
+        keys = keys if keys is not None else [None] * len(rows)
+        queued = [row for row, key in zip(rows, keys) if self.outbox.enqueue_append(table, row, key)]
+        self.flusher.wake()
+        return queued
+
+    def start_production(self, row: list):
+        # Checked against the stored table with the queued writes on top
+        with self._check_lock:
+            en_curso = self.get_all(SHEET_EN_CURSO)
+            if not en_curso.empty:
+                check_machine_free(row, en_curso[["bobina_id", "maquina"]].itertuples(index=False))
+            self.append_row(SHEET_EN_CURSO, row)
+
+    def delete_row_by_bobina(self, bobina_id) -> bool:
+        # Checked like a close: only an open production is queued for removal
+        with self._check_lock:
+            if bobina_id_missing(self.get_all(SHEET_EN_CURSO), bobina_id):
+                return False
+            queued = self.outbox.enqueue_delete_bobina(bobina_id)
+        self.flusher.wake()
+        return queued
+
+    def close_production(self, bobina_id, row: list):
+        # Checked against the stored EN_CURSO with the queued writes on top
+        # (a queued close already hides the bobina), then queued as one
+        # entry keyed by bobina_id and flushed with the atomic close of the
+        # inner engine.
+        with self._check_lock:
+            if bobina_id_missing(self.get_all(SHEET_EN_CURSO), bobina_id):
+                raise BobinaNotFoundError(bobina_id)
+            if not self.outbox.enqueue_close(bobina_id, row):
+                raise BobinaNotFoundError(bobina_id)
+        self.flusher.wake()
+
+    def upsert_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        self.inner.upsert_maquina(maquina, tipo_produccion, lote_of, lote_mp)
+
+    def upsert_maquinas(self, rows: list[list]):
+        self.inner.upsert_maquinas(rows)
+
+    def delete_first_rows(self, table: str, rows: list[list]) -> int:
+        # Queued rows are always appended below the ones being removed
+        return self.inner.delete_first_rows(table, rows)
+
+    def warm_up(self):
+        self.inner.warm_up()
+
+    def pending_writes(self):
+        return self.outbox.stats()
+
+    def stale_since(self, table: str):
+        return self.inner.stale_since(table)
+
+
+def with_outbox(backend: StorageBackend) -> StorageBackend:
+    """Wrap ``backend`` in a ``WriteBehindBackend`` if the outbox is enabled."""
+    outbox = outbox_from_env()
+    if outbox is None:
+        return backend
+    return WriteBehindBackend(backend, outbox)
+
+
+class SharedCacheBackend(StorageBackend):
+    """
+    Serve reads from a ``SharedStore`` filled by a single refresher process
+    and send writes to ``inner`` while holding the store's cross-process
+    write lock, applying each write to the shared copy before releasing it.
+    A table missing from the store, or not refreshed for a while, is loaded
+    from ``inner`` by one process at a time. Frames are kept per version,
+    so rereading an unchanged table costs one small query.
+    """
+
+    def __init__(self, inner: StorageBackend, store, refresh_seconds: float = None):
+        self.inner = inner
+        self.store = store
+        self.name = f"{inner.name}+shared"
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else refresh_seconds_from_env()
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _usable(self, meta) -> bool:
+        return meta is not None and meta.age() < self.refresh_seconds * STALE_INTERVALS
+
+    def _read(self, table: str, any_age: bool = False):
+        meta = self.store.snapshot(table)
+        if meta is None or not (any_age or self._usable(meta)):
+            return None
+        with self._lock:
+            cached = self._frames.get(table)
+        if cached is not None and cached[0] == meta.version:
+            return cached[1].copy(deep=False)
+        result = self.store.read(table)
+        if result is None:
+            return None
+        with self._lock:
+            self._frames[table] = result
+        return result[1].copy(deep=False)
+
+    def get_all(self, table: str) -> pd.DataFrame:
+        return self.get_many([table])[table]
+
+    def get_many(self, tables: list[str]) -> dict[str, pd.DataFrame]:
+        tables = list(dict.fromkeys(tables))
+        frames = {t: self._read(t) for t in tables}
+        missing = [t for t in tables if frames[t] is None]
+        if missing:
+            with self.store.fill_lock:
+                # Otro proceso puede haberlas cargado mientras esperábamos
+                for table in missing:
+                    frames[table] = self._read(table)
+                still = [t for t in missing if frames[t] is None]
+                if still:
+                    before = self.store.versions()
+                    try:
+                        loaded = self.inner.get_many(still)
+                    except Exception as exc:
+                        from bicopack.sheets_client import is_transient
+
+                        # Mejor una copia antigua que una tabla vacía
+                        old = {t: self._read(t, any_age=True) for t in still}
+                        if not is_transient(exc) or any(f is None for f in old.values()):
+                            raise
+                        frames.update(old)
+                        return {t: frames[t] for t in tables}
+                    for table in still:
+                        self.store.store(table, loaded[table], expected_version=before.get(table))
+                        frames[table] = loaded[table]
+        return {t: frames[t] for t in tables}
+
+    def append_row(self, table: str, row: list, key: str = None):
+        with self.store.write_lock:
+            stored = self.inner.append_row(table, row, key=key)
+            if stored:
+                self.store.append(table, [row])
+            return stored
+
+    def append_rows(self, table: str, rows: list[list], keys: list[str] = None) -> list[list]:
+        with self.store.write_lock:
+            stored = self.inner.append_rows(table, rows, keys)
+            if stored:
+                self.store.append(table, stored)
+            return stored
+
+    def start_production(self, row: list):
+        with self.store.write_lock:
+            try:
+                self.inner.start_production(row)
+            except MachineOccupiedError:
+                # Abierta desde otro servidor: la copia compartida está atrasada
+                self.store.store(SHEET_EN_CURSO, self.inner.get_all(SHEET_EN_CURSO))
+                raise
+            self.store.append(SHEET_EN_CURSO, [row])
+
+    def delete_row_by_bobina(self, bobina_id) -> bool:
+        with self.store.write_lock:
+            found = self.inner.delete_row_by_bobina(bobina_id)
+            self.store.delete_key(SHEET_EN_CURSO, bobina_id)
+            return found
+
+    def close_production(self, bobina_id, row: list):
+        with self.store.write_lock:
+            try:
+                self.inner.close_production(bobina_id, row)
+            except BobinaNotFoundError:
+                self.store.delete_key(SHEET_EN_CURSO, bobina_id)
+                raise
+            self.store.append(SHEET_PRODUCCION, [row])
+            self.store.delete_key(SHEET_EN_CURSO, bobina_id)
+
+    def upsert_maquina(self, maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+        with self.store.write_lock:
+            self.inner.upsert_maquina(maquina, tipo_produccion, lote_of, lote_mp)
+            self.store.upsert_maquina(
+                maquina, {"tipo_produccion": tipo_produccion, "lote_of": lote_of, "lote_mp": lote_mp}
+            )
+
+    def upsert_maquinas(self, rows: list[list]):
+        with self.store.write_lock:
+            self.inner.upsert_maquinas(rows)
+            columns = table_columns(SHEET_MAQUINAS)
+            for row in rows:
+                values = dict(zip(columns, row))
+                self.store.upsert_maquina(values.pop("maquina"), values)
+
+    def delete_first_rows(self, table: str, rows: list[list]) -> int:
+        with self.store.write_lock:
+            deleted = self.inner.delete_first_rows(table, rows)
+            # Rare bulk change: store the table again instead of patching it
+            self.store.store(table, self.inner.get_all(table))
+            return deleted
+
+    def warm_up(self):
+        self.inner.warm_up()
+
+    def pending_writes(self):
+        return self.inner.pending_writes()
+
+    def stale_since(self, table: str):
+        # Sin refresco durante dos intervalos: el refrescador no consigue leer
+        meta = self.store.snapshot(table)
+        if meta is not None and meta.age() >= 2 * self.refresh_seconds:
+            return meta.refreshed_at
+        return self.inner.stale_since(table)
+
+
+def with_shared_cache(backend: StorageBackend) -> StorageBackend:
+    """
+    Wrap ``backend`` in a ``SharedCacheBackend`` if ``BICOPACK_SHARED_CACHE``
+    is set, and start this process's candidate refresher unless
+    ``BICOPACK_SHARED_REFRESHER`` is disabled.
+    """
+    store = shared_store_from_env()
+    if store is None:
+        return backend
+    refresh_seconds = refresh_seconds_from_env()
+    if env_flag("BICOPACK_SHARED_REFRESHER", default=True):
+        SharedCacheRefresher(store, backend, interval=refresh_seconds).start()
+    return SharedCacheBackend(backend, store, refresh_seconds)
+
+
+def _sheets_with_plants() -> StorageBackend:
+    sheets = SheetsBackend()
+    return with_plant_shards(sheets, "sheet_id", sheets.for_sheet)
+
+
+def backend_from_env(shared: bool = True) -> StorageBackend:
+    """
+    Build the storage backend selected by ``BICOPACK_STORAGE``. With
+    ``shared`` (the default) it is wrapped in the cross-process shared
+    cache when ``BICOPACK_SHARED_CACHE`` is set.
+    """
+    kind = os.environ.get("BICOPACK_STORAGE", STORAGE_SHEETS).strip().lower() or STORAGE_SHEETS
+    if kind == STORAGE_SHEETS:
+        backend = with_outbox(_sheets_with_plants())
+    elif kind == STORAGE_SQLITE:
+        backend = with_plant_shards(
+            SQLiteBackend(os.environ.get("BICOPACK_SQLITE_PATH", DEFAULT_SQLITE_PATH)), "sqlite_path", SQLiteBackend
+        )
+        if env_flag("BICOPACK_SHEETS_MIRROR"):
+            # Local writes are already fast: only the mirror goes through the outbox
+            backend = MirroredBackend(backend, with_outbox(_sheets_with_plants()))
+    else:
+        raise ValueError(f"Valor no válido para BICOPACK_STORAGE: {kind}")
+    return with_shared_cache(backend) if shared else backend
@@ -0,0 +1,622 @@
+import time
+import logging
+import tempfile
+import threading
+
+import pandas as pd
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from bicopack import metrics
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_MAQUINAS,
+    SHEET_PRODUCCION,
+    BobinaNotFoundError,
+    MachineOccupiedError,
+    clean_row,
+)
+from bicopack.cache import TableCache, ttl_from_env
+from bicopack.changes import change_hub_from_env
+from bicopack.machine_state import STATE_TABLES, MachineStateIndex
+from bicopack.registry import MachineRegistry
+from bicopack.schema import empty_table
+
+
+# -----------------------------------------------------------------------------
+# Bicopack – Acceso a datos desde Streamlit
+#
+# Storage access shared by the main script and the pages under ``pages/``:
+# the cached backend, the process-wide table cache, the per-machine state
+# and the write helpers that keep both up to date. Each page declares the
+# tables it needs and loads only those through ``load_tables``. The loads
+# and the ``gs_*`` helpers are timed as spans of ``bicopack.metrics``.
+# Every write helper publishes the tables it changed (``bicopack.changes``)
+# and the dashboards that ``watch_tables`` are rerun when one of theirs
+# changes, here or in another process. In kiosk mode (``?kiosco=1``, for
+# the wall screens) those dashboards are fragments redrawn on a timer from
+# a view kept in the session (``live_view``), rebuilt only when a version
+# of its tables changes. Rerunning another session relies on Streamlit
+# internals; if they are missing (a Streamlit upgrade) every dashboard
+# falls back to that timer. The machines come from the registry of MAQUINAS
+# (``machine_registry``) and the panels filter them by plant and line
+# (``machine_filter``, ``?planta=`` and ``?linea=`` in the URL).
+#
+# The storage engines, the archive, the KPIs, the export and the importer
+# are imported by the helpers that use them, so importing this module for
+# the first page does not load them all.
+# -----------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two redraws of a live panel in kiosk mode
+KIOSK_SECONDS = 30
+
+# Set when this Streamlit lacks the internals ``_rerun_session`` uses
+_rerun_unavailable = False
+
+
+@st.cache_resource
+def _storage():
+    """Create and cache the storage backend selected by ``BICOPACK_STORAGE``."""
+    from bicopack.storage import backend_from_env
+
+    return backend_from_env()
+
+
+@st.cache_resource
+def _table_cache():
+    """
+    Create the process-wide table cache shared by every session. Reads are
+    cached for ``BICOPACK_CACHE_TTL`` seconds (5 minutes by default); writes
+    patch the cached table they touch.
+    """
+    return TableCache(_storage(), ttl=ttl_from_env())
+
+
+@st.cache_resource
+def _changes():
+    """
+    Change notifications shared by every session. Tables changed by other
+    processes are dropped from the table cache before the sessions that
+    watch them are rerun.
+    """
+    cache = _table_cache()
+    hub = change_hub_from_env()
+    hub.on_remote(lambda tables: [cache.invalidate(table) for table in tables])
+    return hub.start()
+
+
+def _notify(*tables):
+    # Los avisos nunca deben impedir guardar un registro
+    try:
+        _changes().publish(tables)
+    except Exception:
+        logger.exception("No se pudo avisar del cambio de %s", ", ".join(tables))
+
+
+@st.cache_resource
+def _archive():
+    """Monthly files of the archived PRODUCCION and EVENTOS rows."""
+    from bicopack.archive import archive_from_env
+
+    return archive_from_env()
+
+
+@st.cache_resource
+def _kpis():
+    """Materialised KPI rollups shared by every session (``BICOPACK_KPI_PATH``)."""
+    from bicopack.kpis import kpi_store_from_env
+
+    return kpi_store_from_env()
+
+
+@st.cache_resource
+def start_metrics_exporters():
+    """
+    Start the ``/metrics`` endpoint and/or metrics file configured with
+    ``BICOPACK_METRICS_PORT`` and ``BICOPACK_METRICS_FILE``, once per process.
+    """
+    return metrics.start_exporters_from_env()
+
+
+@st.cache_resource
+def warm_up():
+    """
+    Start, once per process, a background thread that prepares the storage
+    backend (credentials, token, connections, spreadsheets) and loads the
+    tables of the machine state, which the default page and the forms need.
+    """
+    storage, cache = _storage(), _table_cache()
+
+    def run():
+        started = time.perf_counter()
+        try:
+            storage.warm_up()
+            cache.get_many(STATE_TABLES)
+        except Exception:
+            logger.exception("No se pudo preparar el almacenamiento por adelantado")
+            return
+        logger.info("Almacenamiento preparado en %.1f s", time.perf_counter() - started)
+
+    thread = threading.Thread(target=run, name="bicopack-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+@st.cache_resource
+def _machine_states():
+    """
+    Per-machine state (configuration, open run, last event) shared by every
+    session. It is rebuilt when the cached tables change version and
+    updated in place by the write helpers below.
+    """
+    return MachineStateIndex()
+
+
+@metrics.timed()
+def gs_append_row(sheet_name: str, row: list, key: str = None):
+    """
+    Append a row to a table. The row is cleaned to ensure values are JSON
+    serialisable. ``key`` is an optional idempotency key used by the
+    write-behind outbox. After appending, the row is added to the cached
+    table, the machine state and the KPIs so subsequent reads reflect it
+    without reloading; a row dropped as a duplicate (a double click) is
+    not. Returns whether the row was stored.
+    """
+    row = clean_row(row)
+    if not _storage().append_row(sheet_name, row, key=key):
+        return False
+    version = _table_cache().apply_append(sheet_name, row)
+    _machine_states().apply_append(sheet_name, row, version)
+    _fold_kpis(sheet_name, [row])
+    _notify(sheet_name)
+    return True
+
+
+def _fold_kpis(sheet_name: str, rows: list):
+    # Los indicadores nunca deben impedir guardar un registro
+    try:
+        _kpis().add_rows(sheet_name, rows)
+    except Exception:
+        logger.exception("No se pudieron actualizar los indicadores de %s", sheet_name)
+
+
+@metrics.timed()
+def gs_get_all(sheet_name: str):
+    """
+    Retrieve all records from a table as a DataFrame.
+    Served from the process-wide table cache to reduce API calls.
+    """
+    return _table_cache().get(sheet_name)
+
+
+@metrics.timed()
+def gs_get_maquinas():
+    """Retrieve all machine records from the MAQUINAS table."""
+    return _table_cache().get(SHEET_MAQUINAS)
+
+
+@metrics.timed()
+def gs_get_tables(sheet_names: tuple):
+    """
+    Retrieve several tables in a single load and return them as a dict of
+    DataFrames keyed by sheet name. Only the tables missing or expired in
+    the cache are fetched: on Google Sheets all ranges of the main
+    spreadsheet travel in one batch request and MAQUINAS is fetched
+    concurrently, so a cold page costs one round trip instead of one per
+    table.
+    """
+    return _table_cache().get_many(sheet_names)
+
+
+@metrics.timed()
+def gs_delete_row_by_bobina(bobina_id):
+    """
+    Delete the row in the EN_CURSO table whose ``bobina_id`` matches
+    ``bobina_id``. After deletion, the row is also removed from the cached
+    EN_CURSO table.
+    """
+    _storage().delete_row_by_bobina(bobina_id)
+    version = _table_cache().apply_delete_bobina(bobina_id)
+    _machine_states().apply_delete_bobina(bobina_id, version)
+    _notify(SHEET_EN_CURSO)
+
+
+@metrics.timed()
+def gs_start_production(row: list):
+    """
+    Open a production (a start or a reopen): append ``row`` to EN_CURSO
+    only if its machine is still free in the stored table, whatever the
+    cache says. If another station took the machine first, the cached
+    EN_CURSO is dropped so the page reloads it, and the error is raised.
+    """
+    row = clean_row(row)
+    try:
+        _storage().start_production(row)
+    except MachineOccupiedError:
+        _table_cache().invalidate(SHEET_EN_CURSO)
+        raise
+    version = _table_cache().apply_append(SHEET_EN_CURSO, row)
+    _machine_states().apply_append(SHEET_EN_CURSO, row, version)
+    _notify(SHEET_EN_CURSO)
+
+
+@metrics.timed()
+def gs_close_production(bobina_id, row: list):
+    """
+    Close an open production: append ``row`` to PRODUCCION and delete the
+    EN_CURSO row of ``bobina_id`` as a single storage operation (one atomic
+    batch request on Google Sheets), then apply both changes to the cached
+    tables. If the production was already closed from another station the
+    row is dropped from the cache and the error is raised.
+    """
+    row = clean_row(row)
+    try:
+        _storage().close_production(bobina_id, row)
+    except BobinaNotFoundError:
+        version = _table_cache().apply_delete_bobina(bobina_id)
+        _machine_states().apply_delete_bobina(bobina_id, version)
+        raise
+    _table_cache().apply_append(SHEET_PRODUCCION, row)
+    version = _table_cache().apply_delete_bobina(bobina_id)
+    _machine_states().apply_delete_bobina(bobina_id, version)
+    _fold_kpis(SHEET_PRODUCCION, [row])
+    _notify(SHEET_EN_CURSO, SHEET_PRODUCCION)
+
+
+@metrics.timed()
+def gs_save_maquina(maquina: int, tipo_produccion: str, lote_of: str, lote_mp: str):
+    """
+    Create or update the configuration of a machine in the MAQUINAS table and
+    apply the change to the cached MAQUINAS table.
+    """
+    gs_save_maquinas([[maquina, tipo_produccion, lote_of, lote_mp]])
+
+
+@metrics.timed()
+def gs_save_maquinas(rows: list):
+    """
+    Create or update the configuration of several machines with one
+    storage write and one patch of the cached MAQUINAS table. Rows follow
+    the MAQUINAS columns (``[maquina, tipo_produccion, lote_of, lote_mp,
+    linea, planta]``); a shorter row leaves the last columns as they are.
+    """
+    if not rows:
+        return
+    _storage().upsert_maquinas(rows)
+    version = _table_cache().apply_maquinas(rows)
+    _machine_states().apply_maquinas(rows, version)
+    _notify(SHEET_MAQUINAS)
+
+
+# -----------------------------------------------------------------------------
+# Page data
+# -----------------------------------------------------------------------------
+
+def load_tables(tables) -> dict:
+    """
+    Load the tables a page needs, typed, as a dict keyed by sheet name. All
+    of them arrive in a single load (one request per spreadsheet); if that
+    fails each table is tried on its own. A table that cannot be read is
+    replaced by an empty one with an error on screen, and tables served
+    from an old snapshot (Google Sheets unavailable) show a warning with
+    their age, so a quota problem never looks like an empty register.
+    """
+    tables = tuple(tables)
+    with metrics.span("load_tables"), st.spinner("Cargando datos..."):
+        try:
+            frames = gs_get_tables(tables)
+        except Exception:
+            frames = {}
+            for table in tables:
+                try:
+                    frames[table] = gs_get_all(table)
+                except Exception as e:
+                    st.error(f"No se pudo cargar {table}: {e}")
+                    frames[table] = empty_table(table)
+    _warn_stale(tables)
+    return frames
+
+
+def _warn_stale(tables):
+    now = time.time()
+    stale = []
+    for table in tables:
+        since = _table_cache().stale_since(table)
+        if since is not None:
+            stale.append(f"{table} (hace {max(0, int((now - since) // 60))} min)")
+    if stale:
+        st.warning(
+            "Google Sheets no responde: se muestran los últimos datos leídos de "
+            + ", ".join(stale)
+        )
+
+
+def load_history(table: str, since=None, until=None):
+    """
+    Typed rows of PRODUCCION or EVENTOS dated between ``since`` and
+    ``until``, merging the cached sheet with the archived months that the
+    range overlaps. Ranges within the hot window never open a file.
+    """
+    from bicopack.archive import read_range
+
+    hot = load_tables((table,))[table]
+    return read_range(table, hot, _archive(), since, until)
+
+
+def export_download(table: str, fmt: str, **filters):
+    """
+    Callable for ``st.download_button`` that writes the filtered rows of
+    ``table`` (archived months plus the cached sheet) to a temporary file,
+    chunk by chunk, when the user clicks the button.
+    """
+    from bicopack.export import export_table
+
+    hot = load_tables((table,))[table]
+    archive = _archive()
+
+    def build():
+        out = tempfile.TemporaryFile()
+        export_table(table, hot, archive, out, fmt, **filters)
+        out.seek(0)
+        return out
+
+    return build
+
+
+def kpi_store():
+    """
+    The KPI rollups, built from the full history (sheets and archive) the
+    first time they are needed; afterwards the write helpers keep them up
+    to date row by row.
+    """
+    from bicopack.kpis import KPI_TABLES
+
+    store = _kpis()
+    if store.built_at() is None:
+        with st.spinner("Calculando los indicadores a partir del histórico..."):
+            store.rebuild({table: load_history(table) for table in KPI_TABLES})
+    return store
+
+
+def import_job(table: str, path: str, chunk_rows: int, restart: bool = False):
+    """
+    ``ImportJob`` of the file ``path`` into ``table`` with the app's
+    storage backend, picking up its saved progress unless ``restart``.
+    """
+    from bicopack.importer import ImportJob
+
+    return ImportJob(_storage(), table, path, chunk_rows=chunk_rows, kpis=_kpis(), restart=restart)
+
+
+def run_import(job, progress=None):
+    """
+    Run ``job`` and drop the imported table from the cache, so the panels
+    reload it with the new rows (also after an interrupted import).
+    """
+    try:
+        return job.run(progress)
+    finally:
+        _table_cache().invalidate(job.table)
+        _notify(job.table)
+
+
+def machine_states(tables=STATE_TABLES) -> MachineStateIndex:
+    """
+    Per-machine state synchronised with the cached ``tables``. Only the
+    parts built from those tables are refreshed, so a page that needs just
+    the machine configuration does not load EVENTOS.
+    """
+    with metrics.span("machine_states"):
+        try:
+            return _machine_states().sync(_table_cache(), tables)
+        except Exception:
+            states = MachineStateIndex()
+            states.build(load_tables(tables))
+            return states
+
+
+def machine_registry() -> MachineRegistry:
+    """Machines registered in MAQUINAS, with their plant and line."""
+    return machine_states((SHEET_MAQUINAS,)).registry
+
+
+def _group_select(label: str, param: str, options: list, key: str):
+    """Selectbox of a plant or line ("Todas" first), preselected from ``?param=``."""
+    if len(options) < 2:
+        return None
+    options = [None, *options]
+    wanted = st.query_params.get(param)
+    index = options.index(wanted) if wanted in options else 0
+    return st.selectbox(
+        label,
+        options,
+        index=index,
+        format_func=lambda o: "Todas" if o is None else (o or "(sin asignar)"),
+        key=key,
+    )
+
+
+def machine_filter(key: str, registry: MachineRegistry = None):
+    """
+    ``(planta, linea)`` chosen in the plant and line selectboxes (None for
+    all). A selectbox is only shown when there is more than one to choose
+    from, so a single-hall deployment sees no filter at all.
+    """
+    registry = registry or machine_registry()
+    planta = _group_select("Planta", "planta", registry.plants(), f"{key}_planta")
+    linea = _group_select("Línea", "linea", registry.lines(planta), f"{key}_linea")
+    return planta, linea
+
+
+def watch_tables(tables):
+    """
+    Rerun this session as soon as one of ``tables`` is written, from this
+    process or another, so a dashboard shows the change without waiting
+    for the cache TTL or a click. Only the changed table is reloaded.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None or not _rerun_available():
+        # Sin avisos: los fragmentos se redibujan con el reloj (``live_every``)
+        return
+    session_id = ctx.session_id
+    _changes().subscribe(session_id, tables, lambda changed: _rerun_session(session_id))
+
+
+def stop_watching():
+    """Cancel the ``watch_tables`` of this session (the page changed)."""
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        _changes().unsubscribe(ctx.session_id)
+
+
+def kiosk_mode() -> bool:
+    """True with ``?kiosco=1`` in the URL (a wall screen showing one panel all day)."""
+    return st.query_params.get("kiosco", "") not in ("", "0")
+
+
+def live_every():
+    """
+    ``run_every`` of the live panels' fragments: the kiosk timer, also used
+    when other sessions cannot be rerun on a change; else None.
+    """
+    return KIOSK_SECONDS if kiosk_mode() or not _rerun_available() else None
+
+
+def live_view(key: str, tables, build):
+    """
+    ``build()`` for the current data of ``tables``, kept in the session
+    under ``key`` and rebuilt only when the version of one of them changes
+    (a write, a change from another process or an expired cache entry).
+    A timer tick with no changes loads nothing and rebuilds nothing, so the
+    fragment only redraws what depends on the clock.
+    """
+    tables = tuple(tables)
+    cache = _table_cache()
+    versions = cache.fresh_versions(tables)
+    if None in versions.values():
+        try:
+            # Caducadas o descartadas: se recargan aquí para saber su versión
+            cache.snapshot(tables)
+        except Exception:
+            logger.debug("No se pudieron recargar %s", ", ".join(tables), exc_info=True)
+        versions = cache.fresh_versions(tables)
+    held = st.session_state.get(key)
+    if held is None or held[0] != versions:
+        held = (versions, build())
+        st.session_state[key] = held
+    else:
+        _warn_stale(tables)
+    return held[1]
+
+
+def _disable_reruns():
+    global _rerun_unavailable
+    if not _rerun_unavailable:
+        _rerun_unavailable = True
+        logger.warning(
+            "Esta versión de Streamlit no permite refrescar otras sesiones: "
+            "los paneles se redibujarán cada %s s", KIOSK_SECONDS
+        )
+
+
+def _rerun_available() -> bool:
+    """False once this Streamlit turned out to lack what ``_rerun_session`` uses."""
+    if not _rerun_unavailable and runtime.exists():
+        manager = getattr(runtime.get_instance(), "_session_mgr", None)
+        if not hasattr(manager, "get_active_session_info"):
+            _disable_reruns()
+    return not _rerun_unavailable
+
+
+def _rerun_session(session_id) -> bool:
+    """
+    Rerun ``session_id`` on its current page and widget values, as
+    Streamlit does when a source file changes. Streamlit has no public API
+    to rerun another session, so this uses its session manager; False if
+    the session is gone or the internals are not available (then the live
+    panels fall back to the timer of ``live_every``).
+    """
+    try:
+        info = runtime.get_instance()._session_mgr.get_active_session_info(session_id)
+        if info is None:
+            return False
+        session = info.session
+        session._event_loop.call_soon_threadsafe(session.request_rerun, session._client_state)
+    except AttributeError:
+        _disable_reruns()
+        return False
+    except Exception:
+        logger.debug("No se pudo refrescar la sesión %s", session_id, exc_info=True)
+        return False
+    return True
+
+
+def show_pending_writes():
+    """Show the state of the write-behind queue, if enabled (BICOPACK_OUTBOX=1)."""
+    try:
+        pending_writes = _storage().pending_writes()
+    except Exception:
+        pending_writes = None
+    if pending_writes is not None:
+        st.caption(
+            f"Escrituras pendientes de enviar: {pending_writes['pending']} · "
+            f"enviadas: {pending_writes['flushed']}"
+        )
+        if pending_writes["pending"] and pending_writes["last_error"]:
+            st.warning(f"Reintentando el envío a Google Sheets: {pending_writes['last_error']}")
+        if pending_writes.get("conflicts"):
+            st.error(
+                f"{pending_writes['conflicts']} cierre(s) no se enviaron: la producción ya se había "
+                "cerrado desde otro sitio. Revisa PRODUCCION."
+            )
+
+
+# -----------------------------------------------------------------------------
+# Diagnostics
+# -----------------------------------------------------------------------------
+
+def show_diagnostics(trace):
+    """
+    Hidden panel (``?diagnostico=1``) with the spans of this rerun, the
+    Google Sheets requests and the cache hit ratio of this process, and
+    the metrics in the Prometheus text format.
+    """
+    with st.expander("Diagnóstico", expanded=True):
+        st.markdown("**Tiempos de esta ejecución**")
+        spans = pd.DataFrame(
+            [
+                {
+                    "bloque": "\u2003" * s["depth"] + s["span"],
+                    "inicio (ms)": round(s["start"] * 1000, 1),
+                    "duración (ms)": None if s["seconds"] is None else round(s["seconds"] * 1000, 1),
+                }
+                for s in trace.spans
+            ]
+        )
+        st.dataframe(spans, hide_index=True, use_container_width=True)
+
+        st.markdown("**Peticiones a Google Sheets**")
+        sheets = pd.DataFrame(metrics.REGISTRY.samples(metrics.SHEETS_REQUESTS))
+        latency = pd.DataFrame(metrics.REGISTRY.samples(metrics.SHEETS_SECONDS))
+        if sheets.empty:
+            st.caption("Sin peticiones desde que arrancó el proceso.")
+        else:
+            latency["media (ms)"] = (latency["sum"] / latency["count"] * 1000).round(1)
+            table = sheets.pivot_table(
+                index=["sheet", "method"], columns="status", values="value", aggfunc="sum", fill_value=0
+            )
+            table = table.join(latency.set_index(["sheet", "method"])[["media (ms)"]])
+            st.dataframe(table.reset_index(), hide_index=True, use_container_width=True)
+
+        st.markdown("**Caché de tablas**")
+        cache = pd.DataFrame(metrics.REGISTRY.samples(metrics.CACHE_REQUESTS))
+        if not cache.empty:
+            cache = cache.pivot_table(index="table", columns="result", values="value", aggfunc="sum", fill_value=0)
+            cache = cache.reindex(columns=["hit", "miss"], fill_value=0)
+            cache["% aciertos"] = (100 * cache["hit"] / (cache["hit"] + cache["miss"])).round(1)
+            st.dataframe(cache.reset_index(), hide_index=True, use_container_width=True)
+
+        st.code(metrics.REGISTRY.render(), language="text")
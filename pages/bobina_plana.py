@@ -0,0 +1,65 @@
+"""
+Registro de la producción de bobina plana reprocesada (un registro por turno).
+"""
+import streamlit as st
+
+from bicopack.core import SHEET_PLANAS_TURNO
+from bicopack.records import RecordError, plana_row
+from bicopack.ui import gs_append_row
+
+# Esta página solo escribe: no necesita cargar ninguna tabla
+TABLES = ()
+
+st.subheader("Producción bobina plana reprocesada (1 registro por turno)")
+with st.form("planas_turno_form"):
+    # Solicitar fecha y turno sin valores por defecto. Se pide al usuario
+    # seleccionarlos manualmente.
+    fecha = st.date_input(
+        "Fecha",
+        value=None,
+        key="planas_fecha",
+    )
+    turno = st.selectbox(
+        "Turno",
+        ["1", "2", "3"],
+        index=None,
+        placeholder="Selecciona turno",
+        key="planas_turno",
+    )
+    # Permitir ingresar varios lotes y órdenes de trabajo
+    lotes = st.text_input("Lotes")
+    ordenes_trabajo = st.text_input("Ordenes de trabajo", placeholder="024-1234")
+    st.markdown("**Operarios del turno**")
+    operario_1 = st.text_input("Operario 1")
+    operario_2 = st.text_input("Operario 2")
+    operario_3 = st.text_input("Operario 3")
+    operario_4 = st.text_input("Operario 4")
+    operario_5 = st.text_input("Operario 5")
+    st.markdown("**Cantidad de bobinas planas reprocesadas**")
+    cantidad_reprocesadas = st.number_input(
+        "Cantidad de bobinas planas reprocesadas",
+        min_value=0,
+        step=1,
+    )
+    guardar = st.form_submit_button("Guardar producción bobina plana reprocesada")
+    if guardar:
+        # Fecha, turno y regla del prefijo 024- para las órdenes de trabajo,
+        # las mismas que aplica la API de ingesta (bicopack.records)
+        try:
+            row = plana_row(
+                fecha,
+                turno,
+                lotes,
+                ordenes_trabajo,
+                [operario_1, operario_2, operario_3, operario_4, operario_5],
+                cantidad_reprocesadas,
+            )
+        except RecordError as e:
+            st.error(str(e))
+            st.stop()
+        try:
+            gs_append_row(SHEET_PLANAS_TURNO, row)
+            st.success("Producción bobina plana reprocesada guardada")
+            st.rerun()
+        except Exception as e:
+            st.error(f"No se pudo guardar la producción de bobina plana reprocesada: {e}")
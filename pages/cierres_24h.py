@@ -0,0 +1,83 @@
+"""
+Panel para revisar producciones que se han cerrado recientemente.
+Muestra las producciones cerradas en las últimas 24 horas para que los
+supervisores puedan comprobar si el cierre fue correcto y, en caso
+necesario, reabrir la producción. Al reabrir una producción se crea
+un nuevo registro en la hoja EN_CURSO con los datos originales, con
+un nuevo identificador único. El registro en la hoja PRODUCCION no
+se elimina, de modo que quede constancia del cierre anterior.
+"""
+
+import uuid
+
+import streamlit as st
+import pandas as pd
+
+from bicopack.core import SHEET_PRODUCCION, MachineOccupiedError, safe_int
+from bicopack.dates import combine_fecha_hora, format_fecha, within_last_hours
+from bicopack.ui import gs_start_production, load_tables
+
+# Tablas que necesita esta página: PRODUCCION solo se descarga aquí
+TABLES = (SHEET_PRODUCCION,)
+df_produccion = load_tables(TABLES)[SHEET_PRODUCCION]
+
+st.subheader("Producciones cerradas últimas 24 horas")
+# Filtrar las producciones cerradas en las últimas 24 horas
+if not df_produccion.empty:
+    # Calcular un datetime de cierre para todas las filas a la vez
+    df_produccion["dt_end"] = combine_fecha_hora(df_produccion["fecha_fin"], df_produccion["hora_fin"])
+    df_recent = df_produccion[within_last_hours(df_produccion["dt_end"], 24)].copy()
+else:
+    df_recent = pd.DataFrame(columns=df_produccion.columns)
+if df_recent.empty:
+    st.info("No hay producciones cerradas en las últimas 24 horas")
+else:
+    # Construir etiquetas legibles para cada producción
+    def _build_label(r):
+        return (
+            f"Máquina {r.get('maquina', '')} – {r.get('tipo_produccion', '')} "
+            f"– OF {r.get('lote_of', '')} – fin {r.get('hora_fin', '')}"
+        )
+    df_recent["label"] = df_recent.apply(_build_label, axis=1)
+    seleccion = st.selectbox("Selecciona producción cerrada", df_recent["label"])
+    fila = df_recent[df_recent["label"] == seleccion].iloc[0]
+    # Mostrar detalles básicos de la producción cerrada
+    st.markdown("**Detalles de la producción cerrada:**")
+    st.write(f"Fecha inicio: {format_fecha(fila.get('fecha_inicio'))}")
+    st.write(f"Fecha fin: {format_fecha(fila.get('fecha_fin'))}")
+    st.write(f"Turno: {fila.get('turno', '')}")
+    st.write(f"Máquina: {fila.get('maquina', '')}")
+    st.write(f"Tipo de producción: {fila.get('tipo_produccion', '')}")
+    st.write(f"Lote MP: {fila.get('lote_mp', '')}")
+    st.write(f"OF: {fila.get('lote_of', '')}")
+    st.write(f"Hora inicio: {fila.get('hora_inicio', '')}")
+    st.write(f"Operario inicio: {fila.get('operario_inicio', '')}")
+    st.write(f"Hora fin: {fila.get('hora_fin', '')}")
+    st.write(f"Operario fin: {fila.get('operario_fin', '')}")
+    st.write(f"Observaciones: {fila.get('observaciones', '')}")
+    # Botón para reabrir la producción
+    if st.button("Volver a abrir esta producción"):
+        # Construir un nuevo registro para EN_CURSO a partir de los datos de la producción cerrada
+        new_bobina_id = str(uuid.uuid4())
+        # Usar fecha de inicio original para la reapertura
+        nueva_fila = [
+            new_bobina_id,
+            format_fecha(fila.get("fecha_inicio")),
+            str(fila.get("turno", "")),
+            int(safe_int(fila.get("maquina", 0), 0)),
+            str(fila.get("tipo_produccion", "")),
+            str(fila.get("lote_mp", "")),
+            str(fila.get("lote_of", "")),
+            str(fila.get("hora_inicio", "")),
+            str(fila.get("operario_inicio", "")),
+            str(fila.get("observaciones", "")),
+        ]
+        try:
+            # Solo si la máquina sigue libre en la hoja
+            gs_start_production(nueva_fila)
+            st.success("Producción reabierta correctamente")
+            st.rerun()
+        except MachineOccupiedError as e:
+            st.warning(f"⚠️ No se puede reabrir: {e}")
+        except Exception as e:
+            st.error(f"No se pudo reabrir la producción: {e}")
@@ -0,0 +1,77 @@
+"""
+Panel para editar los datos de las máquinas (tipo de producción, lote OF,
+lote de materia prima, línea y planta) desde la propia aplicación. Estos
+valores se utilizan para autocompletar los formularios de inicio de
+producción e incidencias y para agrupar las máquinas en los paneles. Todas
+las máquinas (o las de una planta o línea) se editan en una tabla y, al
+guardar, solo se escriben las que han cambiado respecto a MAQUINAS, todas a
+la vez. Las máquinas nuevas se dan de alta aquí y quedan en MAQUINAS.
+"""
+
+import streamlit as st
+import pandas as pd
+
+from bicopack.core import SHEET_MAQUINAS, TIPOS_PRODUCCION
+from bicopack.records import CONFIG_COLUMNS, RecordError, maquinas_rows
+from bicopack.ui import gs_save_maquinas, load_tables, machine_filter, machine_states
+
+# Tablas que necesita esta página
+TABLES = (SHEET_MAQUINAS,)
+df_maquinas = load_tables(TABLES)[SHEET_MAQUINAS]
+
+st.subheader("Configuración de máquinas")
+estados = machine_states(TABLES)
+planta, linea = machine_filter("configuracion", estados.registry)
+
+# Alta de máquinas: se añaden a la tabla y se guardan con el resto
+nuevas = st.session_state.setdefault("maquinas_nuevas", [])
+with st.expander("Dar de alta una máquina"):
+    numero = st.number_input("Número de máquina", min_value=1, step=1, value=None, key="maquina_nueva")
+    if st.button("Añadir a la tabla") and numero is not None:
+        if int(numero) in estados.registry or int(numero) in nuevas:
+            st.warning(f"La máquina {int(numero)} ya está en la tabla")
+        else:
+            nuevas.append(int(numero))
+
+# Mostrar las máquinas dadas de alta (y las nuevas) para permitir crear o
+# editar datos, con los valores actuales de cada una (vacíos si no tiene)
+grid = pd.DataFrame([
+    {"maquina": m, **{col: estados.get(m).config_value(col) for col in CONFIG_COLUMNS}}
+    for m in estados.registry.machines(planta, linea) + sorted(nuevas)
+])
+
+# Dentro de un formulario: las ediciones no recargan la página hasta guardar
+with st.form("configuracion_maquinas"):
+    editado = st.data_editor(
+        grid,
+        hide_index=True,
+        use_container_width=True,
+        disabled=["maquina"],
+        column_config={
+            "maquina": st.column_config.NumberColumn("Máquina", format="%d"),
+            "tipo_produccion": st.column_config.SelectboxColumn("Tipo de producción", options=TIPOS_PRODUCCION),
+            "lote_of": st.column_config.TextColumn("Lote OF"),
+            "lote_mp": st.column_config.TextColumn("Lote materia prima"),
+            "linea": st.column_config.TextColumn("Línea"),
+            "planta": st.column_config.TextColumn("Planta"),
+        },
+        key="maquinas_editor",
+    )
+    guardar = st.form_submit_button("Guardar cambios")
+if guardar:
+    try:
+        cambios = maquinas_rows(df_maquinas, editado, estados.registry)
+    except RecordError as e:
+        st.error(str(e))
+        st.stop()
+    if not cambios:
+        st.info("No hay cambios que guardar")
+    else:
+        # Actualizar o insertar las máquinas cambiadas en una sola escritura
+        try:
+            gs_save_maquinas(cambios)
+            nuevas.clear()
+            st.success(f"Datos guardados: {len(cambios)} máquina(s)")
+            st.rerun()
+        except Exception as e:
+            st.error(f"No se pudieron guardar los cambios: {e}")
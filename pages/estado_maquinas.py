@@ -0,0 +1,75 @@
+"""
+Panel de estado de máquinas.
+Muestra las máquinas dadas de alta, de una planta o línea si se elige, con
+su configuración actual
+(tipo de producción, lotes OF y MP) y el estado de cada máquina. Si la
+máquina está en producción, también se muestran los datos de la
+producción abierta (tipo actual, OF actual, lote MP actual, hora de
+inicio y operario), además del último evento registrado. En modo quiosco
+(``?kiosco=1``) la tabla se comprueba cada ``KIOSK_SECONDS`` y solo se
+vuelve a montar cuando cambia alguna de sus tablas.
+"""
+
+import streamlit as st
+import pandas as pd
+
+from bicopack.dates import format_fecha
+from bicopack.machine_state import STATE_TABLES
+from bicopack.ui import live_every, live_view, machine_filter, machine_states, watch_tables
+
+# Tablas que necesita esta página: configuración, producciones abiertas y
+# eventos, a través del estado por máquina
+TABLES = STATE_TABLES
+# Se vuelve a dibujar en cuanto alguien guarda en estas tablas
+watch_tables(TABLES)
+
+
+def _preparar(planta, linea):
+    """Una fila por máquina de la planta y línea a partir del estado por máquina."""
+    estados = machine_states(TABLES)
+    # Preparar una lista con la información de cada máquina (sin recorrer
+    # las tablas para cada una)
+    status_rows = []
+    for m in estados.registry.machines(planta, linea):
+        estado_maquina = estados.get(m)
+        open_run = estado_maquina.open_run or {}
+        last_event = estado_maquina.last_event
+        if last_event:
+            ultimo_evento = (
+                f"{last_event.get('tipo', '')} {format_fecha(last_event.get('fecha'))} "
+                f"{last_event.get('hora_inicio', '')}"
+            ).strip()
+        else:
+            ultimo_evento = ""
+        status_rows.append({
+            "Máquina": m,
+            "Línea": estados.registry.line_of(m),
+            "Tipo config": estado_maquina.config_value("tipo_produccion"),
+            "OF config": estado_maquina.config_value("lote_of"),
+            "Lote MP config": estado_maquina.config_value("lote_mp"),
+            "Estado": "En producción" if estado_maquina.busy else "Libre",
+            "Tipo actual": str(open_run.get("tipo_produccion", "")),
+            "OF actual": str(open_run.get("lote_of", "")),
+            "Lote MP actual": str(open_run.get("lote_mp", "")),
+            "Inicio actual": str(open_run.get("hora_inicio", "")),
+            "Operario actual": str(open_run.get("operario_inicio", "")),
+            "Último evento": ultimo_evento,
+        })
+    # Convertir a DataFrame ordenado por número de máquina
+    return pd.DataFrame(status_rows).sort_values(by="Máquina")
+
+
+st.subheader("Estado de máquinas")
+# El filtro queda fuera del fragmento: cambiarlo vuelve a montar la página
+planta, linea = machine_filter("estado_maquinas")
+
+
+@st.fragment(run_every=live_every())
+def panel():
+    df_status = live_view(
+        f"estado_maquinas:{planta}:{linea}", TABLES, lambda: _preparar(planta, linea)
+    )
+    st.dataframe(df_status, use_container_width=True, hide_index=True)
+
+
+panel()
@@ -0,0 +1,58 @@
+"""
+Exportación de PRODUCCION, EVENTOS y PLANAS_TURNO por rango de fechas,
+máquinas y OF, en CSV o Parquet. Incluye los meses archivados y la hoja, y
+el fichero se genera por bloques al pulsar "Descargar".
+"""
+import datetime
+
+import streamlit as st
+
+from bicopack.core import SHEET_MAQUINAS, SHEET_PLANAS_TURNO, current_date_madrid
+from bicopack.export import EXPORT_TABLES, FORMATS, export_file_name
+from bicopack.ui import export_download, machine_registry
+
+# Solo las máquinas dadas de alta; la hoja elegida se carga (desde la
+# caché) al preparar la descarga
+TABLES = (SHEET_MAQUINAS,)
+
+st.subheader("Exportar datos")
+hoy = current_date_madrid()
+# Por defecto, el mes anterior completo
+fin_mes_anterior = hoy.replace(day=1) - datetime.timedelta(days=1)
+tabla = st.selectbox("Hoja", EXPORT_TABLES, key="exportar_tabla")
+rango = st.date_input(
+    "Fechas",
+    value=(fin_mes_anterior.replace(day=1), fin_mes_anterior),
+    key="exportar_fechas",
+)
+maquinas = st.multiselect(
+    "Máquinas (todas si no se elige ninguna)",
+    machine_registry().machines(),
+    key="exportar_maquinas",
+    disabled=tabla == SHEET_PLANAS_TURNO,
+)
+lote_of = st.text_input(
+    "Orden de trabajo" if tabla == SHEET_PLANAS_TURNO else "OF",
+    placeholder="024-",
+    key="exportar_of",
+    help="Se exportan las filas cuya OF contiene este texto",
+)
+formato = st.radio("Formato", FORMATS, horizontal=True, key="exportar_formato")
+
+# Mientras se elige el rango, el selector devuelve solo la fecha inicial
+desde, hasta = (rango[0], rango[-1]) if rango else (None, None)
+st.download_button(
+    "Descargar",
+    data=export_download(
+        tabla,
+        formato,
+        since=desde,
+        until=hasta,
+        maquinas=maquinas if tabla != SHEET_PLANAS_TURNO else None,
+        lote_of=lote_of,
+    ),
+    file_name=export_file_name(tabla, formato, desde, hasta),
+    mime="text/csv" if formato == "csv" else "application/vnd.apache.parquet",
+    on_click="ignore",
+    key="exportar_descargar",
+)
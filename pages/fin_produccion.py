@@ -0,0 +1,53 @@
+"""
+Formulario de fin de producción: pasa una producción abierta de EN_CURSO a
+PRODUCCION con la hora de fin, el peso y las taras.
+"""
+import streamlit as st
+import pandas as pd
+
+from bicopack.core import SHEET_EN_CURSO
+from bicopack.records import RecordError, close_row
+from bicopack.ui import gs_close_production, load_tables
+
+# Tablas que necesita esta página
+TABLES = (SHEET_EN_CURSO,)
+df_en_curso = load_tables(TABLES)[SHEET_EN_CURSO]
+
+st.subheader("Fin producción")
+df = df_en_curso.copy()
+if df.empty:
+    st.info("No hay producciones abiertas")
+else:
+    # Build a human-friendly label for each open production
+    df["label"] = df.apply(
+        lambda r: f"Máquina {r['maquina']} – {r.get('tipo_produccion', '')} – OF {r['lote_of']} – inicio {r['hora_inicio']}",
+        axis=1
+    )
+    seleccion = st.selectbox("Selecciona producción", df["label"])
+    fila = df[df["label"] == seleccion].iloc[0]
+    # La fecha de inicio ya viene parseada (NaT si no era válida)
+    if pd.isna(fila["fecha"]):
+        st.error("La fecha de inicio guardada no es válida")
+        st.stop()
+    with st.form("fin_produccion"):
+        hora_fin_txt = st.text_input("Hora fin (HH:MM)", placeholder="ej: 15:10")
+        operario_fin = st.text_input("Operario")
+        peso = st.number_input("Peso", min_value=0.0)
+        taras = st.number_input("Taras", min_value=0, step=1)
+        observaciones_fin = st.text_area("Observaciones")
+        guardar = st.form_submit_button("Guardar fin")
+        if guardar:
+            # La fecha de fin pasa al día siguiente si la hora de fin es
+            # anterior a la de inicio (bicopack.records, igual que la API)
+            try:
+                row = close_row(fila, hora_fin_txt, operario_fin, peso, taras, observaciones_fin)
+            except RecordError as e:
+                st.error(str(e))
+                st.stop()
+            try:
+                # Alta en PRODUCCION y baja en EN_CURSO en una sola operación
+                gs_close_production(fila["bobina_id"], row)
+                st.success("Producción cerrada")
+                st.rerun()
+            except Exception as e:
+                st.error(f"No se pudo cerrar la producción: {e}")
@@ -0,0 +1,80 @@
+"""
+Importación de histórico de producción e incidencias desde ficheros CSV o
+Excel. El fichero se escribe en la hoja por bloques, respetando la cuota de
+Google Sheets, y si la importación se interrumpe se reanuda donde se quedó
+al volver a subir el mismo fichero.
+"""
+import os
+import hashlib
+
+import streamlit as st
+
+from bicopack.importer import DEFAULT_CHUNK_ROWS, IMPORT_TABLES, import_dir_from_env
+from bicopack.ui import import_job, run_import
+
+# Esta página solo escribe: no necesita cargar ninguna tabla
+TABLES = ()
+
+st.subheader("Importar histórico")
+st.caption(
+    "Columnas con los mismos nombres que la hoja (fecha_inicio, maquina, hora_inicio...). "
+    "Las fechas pueden venir como AAAA-MM-DD o DD/MM/AAAA y las horas como HH:MM."
+)
+tabla = st.selectbox("Hoja de destino", IMPORT_TABLES, key="importar_tabla")
+fichero = st.file_uploader("Fichero CSV o Excel", type=["csv", "xlsx", "xlsm"], key="importar_fichero")
+filas_bloque = st.number_input(
+    "Filas por bloque", min_value=50, max_value=5000, value=DEFAULT_CHUNK_ROWS, step=50, key="importar_bloque"
+)
+if fichero is None:
+    st.stop()
+
+# El fichero se guarda con un nombre derivado de su contenido para que, al
+# subirlo otra vez, se encuentre el progreso de la importación anterior
+datos = fichero.getvalue()
+directorio = os.path.join(import_dir_from_env(), tabla)
+os.makedirs(directorio, exist_ok=True)
+ruta = os.path.join(directorio, f"{hashlib.sha1(datos).hexdigest()[:16]}-{os.path.basename(fichero.name)}")
+if not os.path.exists(ruta):
+    with open(ruta, "wb") as f:
+        f.write(datos)
+del datos
+
+reiniciar = st.checkbox("Empezar de cero (ignorar el progreso guardado)", key="importar_reiniciar")
+try:
+    job = import_job(tabla, ruta, int(filas_bloque), restart=reiniciar)
+except Exception as e:
+    st.error(f"No se puede preparar la importación: {e}")
+    st.stop()
+
+estado = job.progress
+if estado.finished:
+    st.success(f"Este fichero ya se importó: {estado.written} filas guardadas, {estado.rejected} rechazadas")
+elif estado.done:
+    st.info(f"Importación interrumpida: se reanudará tras la fila {estado.done} ({estado.written} ya guardadas)")
+
+if not estado.finished and st.button("Reanudar importación" if estado.done else "Importar", key="importar_boton"):
+    barra = st.progress(0.0, text="Importando...")
+
+    def avance(progreso):
+        fraccion = min(1.0, progreso.done / progreso.total) if progreso.total else 0.0
+        barra.progress(
+            fraccion,
+            text=f"{progreso.done} filas leídas · {progreso.written} guardadas · {progreso.rejected} rechazadas",
+        )
+
+    try:
+        estado = run_import(job, avance)
+        barra.progress(1.0, text="Importación terminada")
+        st.success(f"{estado.written} filas guardadas en {tabla}, {estado.rejected} rechazadas")
+    except Exception as e:
+        st.error(f"La importación se ha detenido: {e}. Pulsa de nuevo para reanudarla.")
+
+if os.path.exists(job.rejected_path):
+    with open(job.rejected_path, "rb") as f:
+        st.download_button(
+            "Descargar filas rechazadas",
+            f.read(),
+            file_name=f"{os.path.splitext(fichero.name)[0]}.rechazadas.csv",
+            mime="text/csv",
+            key="importar_rechazadas",
+        )
@@ -0,0 +1,132 @@
+"""
+Formulario para registrar incidencias, tareas (cambio de agujas) y
+limpiezas. El turno y la OF se toman de la producción abierta en la
+máquina elegida.
+"""
+import streamlit as st
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_EVENTOS,
+    SHEET_MAQUINAS,
+    TIPOS_EVENTO,
+    safe_int,
+)
+from bicopack.records import RecordError, event_row
+from bicopack.ui import gs_append_row, machine_states
+
+# Tablas que necesita esta página: las producciones abiertas y las
+# máquinas dadas de alta
+TABLES = (SHEET_EN_CURSO, SHEET_MAQUINAS)
+estados = machine_states(TABLES)
+
+st.subheader("Registrar incidencia / tarea / limpieza")
+# Seleccionar el tipo de evento fuera del formulario para que, al cambiar
+# su valor, la página se vuelva a ejecutar y se actualicen los campos
+tipo_evento = st.selectbox("Tipo", TIPOS_EVENTO, key="evento_tipo")
+# Para limpieza, mostrar la opción de carga de filetas fuera del formulario
+carga_filetas = False
+if tipo_evento == "Limpieza":
+    carga_filetas = st.checkbox(
+        "¿Carga de filetas?",
+        key="limpieza_carga_filetas",
+    )
+
+with st.form("evento_form"):
+    # Fecha sin autocompletado
+    fecha = st.date_input(
+        "Fecha",
+        value=None,
+        key="evento_fecha",
+    )
+    # Selección de máquina
+    maquina = st.selectbox(
+        "Máquina",
+        estados.registry.machines(),
+        key="maquina_evento",
+    )
+    # Auto-detect current shift and OF for the selected machine
+    turno_auto = ""
+    lote_of_auto = ""
+    machine_int = safe_int(maquina, -999)
+    abierta = estados.get(machine_int).open_run
+    if abierta is not None:
+        turno_auto = str(abierta.get("turno", "")).strip()
+        lote_of_auto = str(abierta.get("lote_of", "")).strip()
+    if lote_of_auto:
+        st.caption(f"OF detectada automáticamente para esa máquina: {lote_of_auto}")
+    # Descripción común
+    descripcion = st.text_area("Descripción")
+    # Inicializar variables comunes
+    hora_inicio_txt = ""
+    hora_fin_txt = ""
+    # Campos específicos según el tipo de evento seleccionado
+    if tipo_evento == "Incidencia":
+        operario = st.text_input("Operario")
+        hora_inicio_txt = st.text_input(
+            "Hora inicio (HH:MM)",
+            placeholder="ej: 10:20",
+            key="inc_hora_ini",
+        )
+        hora_fin_txt = st.text_input(
+            "Hora fin (HH:MM)",
+            placeholder="ej: 10:40",
+            key="inc_hora_fin",
+        )
+    elif tipo_evento == "Tarea - cambio de agujas":
+        operario = st.selectbox("Operario", ["John", "Rafa"])
+        hora_inicio_txt = st.text_input(
+            "Hora inicio (HH:MM)",
+            placeholder="ej: 10:20",
+            key="agujas_ini",
+        )
+        hora_fin_txt = st.text_input(
+            "Hora fin (HH:MM)",
+            placeholder="ej: 10:40",
+            key="agujas_fin",
+        )
+    elif tipo_evento == "Limpieza":
+        # Si es carga de filetas (marcada fuera del formulario), no pedir operario ni horas
+        if carga_filetas:
+            operario = ""
+            hora_inicio_txt = ""
+            hora_fin_txt = ""
+        else:
+            operario = st.text_input("Operario")
+            hora_inicio_txt = st.text_input(
+                "Hora inicio (HH:MM)",
+                placeholder="ej: 10:20",
+                key="limp_hora_ini",
+            )
+            hora_fin_txt = st.text_input(
+                "Hora fin (HH:MM)",
+                placeholder="ej: 10:40",
+                key="limp_hora_fin",
+            )
+    # Botón de guardar
+    guardar = st.form_submit_button("Guardar evento")
+    if guardar:
+        # Horas obligatorias salvo en la carga de filetas, con los minutos
+        # calculados como en la API de ingesta (bicopack.records)
+        try:
+            row = event_row(
+                fecha,
+                tipo_evento,
+                machine_int,
+                open_run=abierta,
+                descripcion=descripcion,
+                operario=operario,
+                hora_inicio=hora_inicio_txt,
+                hora_fin=hora_fin_txt,
+                carga_filetas=carga_filetas,
+                registry=estados.registry,
+            )
+        except RecordError as e:
+            st.error(str(e))
+            st.stop()
+        try:
+            gs_append_row(SHEET_EVENTOS, row)
+            st.success("Evento guardado")
+            st.rerun()
+        except Exception as e:
+            st.error(f"No se pudo guardar el evento: {e}")
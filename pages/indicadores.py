@@ -0,0 +1,95 @@
+"""
+Indicadores de producción por máquina, turno y día: disponibilidad, kg por
+hora produciendo y minutos de parada por causa. Lee los acumulados que se
+mantienen al guardar cada producción y cada evento, sin descargar el
+histórico de las hojas.
+"""
+import datetime
+
+import streamlit as st
+import pandas as pd
+
+from bicopack.core import SHEET_MAQUINAS, current_date_madrid
+from bicopack.kpis import kpi_frame
+from bicopack.ui import kpi_store, machine_registry
+
+# Esta página solo carga las máquinas dadas de alta y los indicadores
+# acumulados (la primera vez se calculan a partir del histórico de
+# PRODUCCION y EVENTOS)
+TABLES = (SHEET_MAQUINAS,)
+store = kpi_store()
+
+st.subheader("Indicadores")
+hoy = current_date_madrid()
+col_fechas, col_grupo = st.columns(2)
+with col_fechas:
+    rango = st.date_input(
+        "Fechas",
+        value=(hoy - datetime.timedelta(days=6), hoy),
+        key="kpi_fechas",
+    )
+with col_grupo:
+    agrupar = st.selectbox(
+        "Agrupar por",
+        ["Máquina", "Día", "Turno", "Día y turno", "Día, turno y máquina"],
+        key="kpi_agrupar",
+    )
+maquinas = st.multiselect(
+    "Máquinas (todas si no se elige ninguna)",
+    machine_registry().machines(),
+    key="kpi_maquinas",
+)
+
+# Mientras se elige el rango, el selector devuelve solo la fecha inicial
+desde, hasta = (rango[0], rango[-1]) if rango else (hoy, hoy)
+produccion = store.produccion(desde, hasta, maquinas)
+paradas = store.paradas(desde, hasta, maquinas)
+
+GRUPOS = {
+    "Máquina": ["maquina"],
+    "Día": ["fecha"],
+    "Turno": ["turno"],
+    "Día y turno": ["fecha", "turno"],
+    "Día, turno y máquina": ["fecha", "turno", "maquina"],
+}
+kpis = kpi_frame(produccion, paradas, by=GRUPOS[agrupar])
+if kpis.empty:
+    st.info("No hay producciones ni eventos en esas fechas")
+else:
+    total = kpi_frame(produccion.assign(total=1), paradas.assign(total=1), by=["total"]).iloc[0]
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Disponibilidad", f"{total['disponibilidad']:.0%}")
+    c2.metric("Kg/hora", "-" if pd.isna(total["kg_hora"]) else f"{total['kg_hora']:.1f}")
+    c3.metric("Minutos de parada", int(total["minutos_parada"]))
+
+    mostrar = kpis.rename(columns={
+        "fecha": "Fecha",
+        "turno": "Turno",
+        "maquina": "Máquina",
+        "turnos": "Turnos",
+        "producciones": "Producciones",
+        "peso": "Kg",
+        "taras": "Taras",
+        "minutos_produccion": "Min. produciendo",
+        "minutos_parada": "Min. parada",
+        "disponibilidad": "Disponibilidad",
+        "kg_hora": "Kg/hora",
+    })
+    st.dataframe(
+        mostrar,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Disponibilidad": st.column_config.ProgressColumn(
+                "Disponibilidad", format="percent", min_value=0, max_value=1
+            ),
+            "Kg/hora": st.column_config.NumberColumn("Kg/hora", format="%.1f"),
+        },
+    )
+
+    st.markdown("**Minutos de parada por causa**")
+    if paradas.empty:
+        st.info("No hay paradas en esas fechas")
+    else:
+        causas = paradas.groupby("tipo")["minutos"].sum().sort_values(ascending=False)
+        st.bar_chart(causas, horizontal=True)
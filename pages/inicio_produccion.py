@@ -0,0 +1,108 @@
+"""
+Formulario de inicio de producción. La máquina elegida autocompleta el tipo
+de producción y los lotes con su configuración, y no se permite abrir una
+segunda producción en una máquina ocupada.
+"""
+import streamlit as st
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_MAQUINAS,
+    TIPOS_PRODUCCION,
+    MachineOccupiedError,
+    safe_int,
+)
+from bicopack.records import MachineBusyError, RecordError, start_row
+from bicopack.ui import gs_start_production, machine_states
+
+# Tablas que necesita esta página: solo el estado por máquina (configuración
+# y producciones abiertas), sin descargar las tablas históricas
+TABLES = (SHEET_MAQUINAS, SHEET_EN_CURSO)
+estados = machine_states(TABLES)
+
+st.subheader("Inicio producción")
+# Inputs para fecha, turno y máquina fuera del formulario para permitir que
+# la página se recargue automáticamente cuando cambie la máquina (sin
+# necesidad de callbacks dentro de un formulario, que Streamlit no permite).
+# Solicitar la fecha y el turno sin valores por defecto, de forma que
+# los operarios deban seleccionarlos manualmente. Cuando ``value`` es
+# ``None`` o ``index`` es ``None``, Streamlit muestra un campo vacío y
+# devuelve ``None`` hasta que el usuario elige un valor.
+fecha = st.date_input(
+    "Fecha",
+    value=None,
+    key="inicio_fecha",
+)
+turno = st.selectbox(
+    "Turno",
+    ["1", "2", "3"],
+    index=None,
+    placeholder="Selecciona turno",
+    key="inicio_turno",
+)
+# Solo las máquinas dadas de alta en MAQUINAS
+maquina = st.selectbox("Máquina", estados.registry.machines())
+
+# Autocompletar datos en función de la máquina seleccionada
+machine_int = safe_int(maquina, -999)
+estado_maquina = estados.get(machine_int)
+tipo_auto = estado_maquina.config_value("tipo_produccion")
+lote_of_auto = estado_maquina.config_value("lote_of")
+lote_mp_auto = estado_maquina.config_value("lote_mp")
+
+# Seleccionar índice inicial para el tipo de producción
+index_tipo = 0
+if tipo_auto and tipo_auto in TIPOS_PRODUCCION:
+    index_tipo = TIPOS_PRODUCCION.index(tipo_auto)
+
+# Formulario para el resto de datos de inicio de producción
+with st.form("inicio_produccion"):
+    tipo_produccion = st.selectbox("Tipo producción", TIPOS_PRODUCCION, index=index_tipo)
+    lote_mp = st.text_input("Lote materia prima", value=lote_mp_auto)
+    lote_of = st.text_input("OF", value=lote_of_auto)
+    # Mensaje si no hay datos precargados
+    if not tipo_auto and not lote_of_auto and not lote_mp_auto:
+        st.caption("Esta máquina no tiene datos cargados o está parada.")
+    operario_inicio = st.text_input("Operario")
+    hora_inicio_txt = st.text_input("Hora inicio (HH:MM)", placeholder="ej: 14:30")
+    observaciones_inicio = st.text_area("Observaciones")
+    guardar = st.form_submit_button("Guardar inicio")
+    if guardar:
+        # Mismas comprobaciones que la API de ingesta (bicopack.records)
+        try:
+            row = start_row(
+                fecha,
+                turno,
+                machine_int,
+                tipo_produccion,
+                lote_mp,
+                lote_of,
+                hora_inicio_txt,
+                operario_inicio,
+                observaciones_inicio,
+                open_run=estados.get(machine_int).open_run,
+                registry=estados.registry,
+            )
+        except MachineBusyError as e:
+            registro_abierto = e.open_run
+            st.warning("⚠️ Ya hay una producción abierta en esa máquina")
+            st.info(
+                f"Tipo: {registro_abierto.get('tipo_produccion', '')}\n"
+                f"OF: {registro_abierto.get('lote_of', '')}\n"
+                f"Lote MP: {registro_abierto.get('lote_mp', '')}\n"
+                f"Inicio: {registro_abierto.get('hora_inicio', '')}\n"
+                f"Operario: {registro_abierto.get('operario_inicio', '')}"
+            )
+            st.stop()
+        except RecordError as e:
+            st.error(str(e))
+            st.stop()
+        try:
+            # Se comprueba de nuevo contra la hoja justo antes de guardar
+            gs_start_production(row)
+            st.success("Producción iniciada")
+            st.rerun()
+        except MachineOccupiedError as e:
+            st.warning(f"⚠️ {e}")
+        except Exception as e:
+            st.error(f"No se pudo guardar el inicio: {e}")
@@ -0,0 +1,55 @@
+"""
+Panel de incidencias, tareas y limpiezas registradas en las últimas 24 horas.
+"""
+import streamlit as st
+
+from bicopack.core import SHEET_EVENTOS
+from bicopack.dates import filter_last_hours_events
+from bicopack.ui import live_every, load_tables, watch_tables
+
+# Tablas que necesita esta página
+TABLES = (SHEET_EVENTOS,)
+# Se vuelve a dibujar en cuanto alguien guarda en estas tablas
+watch_tables(TABLES)
+
+st.subheader("Incidencias / tareas últimas 24 horas")
+
+
+# Con el reloj de ``live_every`` si los avisos de cambios no llegan
+@st.fragment(run_every=live_every())
+def panel():
+    df = load_tables(TABLES)[SHEET_EVENTOS].copy()
+    if df.empty:
+        st.info("No hay incidencias o tareas registradas")
+    else:
+        df = filter_last_hours_events(df, hours=24)
+        if df.empty:
+            st.info("No hay incidencias o tareas en las últimas 24 horas")
+        else:
+            mostrar = df[[
+                "maquina",
+                "tipo",
+                "hora_inicio",
+                "hora_fin",
+                "operario",
+                "lote_of",
+                "descripcion",
+            ]].copy()
+            mostrar.columns = [
+                "Máquina",
+                "Tipo",
+                "Hora inicio",
+                "Hora fin",
+                "Operario",
+                "OF",
+                "Motivo",
+            ]
+            mostrar = mostrar.sort_values(
+                by=["Máquina", "Hora inicio"],
+                ascending=[True, False],
+                na_position="last",
+            )
+            st.dataframe(mostrar, use_container_width=True, hide_index=True)
+
+
+panel()
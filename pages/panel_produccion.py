@@ -0,0 +1,74 @@
+"""
+Panel de producción en curso: una fila por producción abierta con el tiempo
+que lleva produciendo, de todas las máquinas o de una planta o línea. En modo
+quiosco (``?kiosco=1``) el panel se vuelve a
+dibujar solo cada ``KIOSK_SECONDS``: las filas se preparan de nuevo cuando
+cambia EN_CURSO y entre medias solo se recalcula el tiempo.
+"""
+import streamlit as st
+
+from bicopack.core import SHEET_EN_CURSO, SHEET_MAQUINAS
+from bicopack.dates import combine_fecha_hora, elapsed_minutes, format_elapsed
+from bicopack.ui import live_every, live_view, load_tables, machine_filter, machine_registry, watch_tables
+
+# Tablas que necesita esta página (MAQUINAS para filtrar por planta y línea)
+TABLES = (SHEET_EN_CURSO, SHEET_MAQUINAS)
+# Se vuelve a dibujar en cuanto alguien guarda en estas tablas
+watch_tables(TABLES)
+
+
+def _preparar(planta, linea):
+    """Filas del panel, sin el tiempo, y el inicio de cada producción."""
+    df = load_tables(TABLES)[SHEET_EN_CURSO]
+    if planta is not None or linea is not None:
+        maquinas = machine_registry().machines(planta, linea)
+        df = df[df["maquina_norm"].isin(maquinas)]
+    if df.empty:
+        return None, None
+    # Inicio de todas las filas a la vez
+    inicio = combine_fecha_hora(df["fecha"], df["hora_inicio"], default_hora=None)
+    mostrar = df[[
+        "maquina",
+        "tipo_produccion",
+        "lote_of",
+        "lote_mp",
+        "hora_inicio",
+        "operario_inicio",
+    ]].copy()
+    mostrar.columns = [
+        "Máquina",
+        "Tipo",
+        "OF",
+        "Lote MP",
+        "Inicio",
+        "Operario",
+    ]
+    # Sort by machine (numeric, unknown last) and start time
+    mostrar = mostrar.sort_values(
+        by=["Máquina", "Inicio"],
+        ascending=[True, True],
+        na_position="last",
+    )
+    return mostrar, inicio
+
+
+st.subheader("Producción en curso")
+# El filtro queda fuera del fragmento: cambiarlo vuelve a montar la página
+planta, linea = machine_filter("panel_produccion")
+
+
+@st.fragment(run_every=live_every())
+def panel():
+    mostrar, inicio = live_view(
+        f"panel_produccion:{planta}:{linea}", TABLES, lambda: _preparar(planta, linea)
+    )
+    if mostrar is None:
+        st.info("No hay producciones en curso")
+        return
+    # Minutos desde el inicio: lo único que cambia entre dos vueltas del reloj
+    mostrar = mostrar.copy()
+    mostrar["Tiempo produciendo"] = format_elapsed(elapsed_minutes(inicio))
+    st.dataframe(mostrar, use_container_width=True, hide_index=True)
+
+
+panel()
@@ -0,0 +1,70 @@
+import pytest
+
+from bicopack.core import EN_CURSO_COLS, PRODUCCION_COLS, TABLE_COLUMNS
+from bicopack.outbox import Outbox
+from bicopack.storage import SheetsBackend, SQLiteBackend
+
+
+class FlakyBackend:
+    """
+    Wrap a backend and raise ``ConnectionError`` from the methods listed in
+    ``failing`` (a set the test changes), like a Sheets outage would.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.failing = set()
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.inner, name)
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            if name in self.failing:
+                raise ConnectionError(f"{name} no disponible")
+            return method(*args, **kwargs)
+
+        return call
+
+
+def en_curso_row(bobina_id: str, maquina: int = 1) -> list:
+    values = {"bobina_id": bobina_id, "fecha": "2024-01-05", "turno": "1", "maquina": maquina,
+              "tipo_produccion": "Saco", "hora_inicio": "08:00", "operario_inicio": "ana"}
+    return [values.get(c, "") for c in EN_CURSO_COLS]
+
+
+def produccion_row(maquina: int = 1, peso: float = 12.5) -> list:
+    values = {"fecha_inicio": "2024-01-05", "fecha_fin": "2024-01-05", "turno": "1", "maquina": maquina,
+              "tipo_produccion": "Saco", "hora_inicio": "08:00", "operario_inicio": "ana",
+              "hora_fin": "09:30", "operario_fin": "ana", "peso": peso, "taras": 1}
+    return [values.get(c, "") for c in PRODUCCION_COLS]
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / "bicopack.db"))
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path / "outbox.db"))
+
+
+def expire_leases(outbox: Outbox):
+    """End every backoff and lease, as if the retry time had come."""
+    outbox._conn.execute("UPDATE outbox SET lease_until = NULL")
+
+
+@pytest.fixture
+def sheets_client():
+    from benchmarks.run import fake_client
+
+    return fake_client({t: [list(columns)] for t, columns in TABLE_COLUMNS.items()})
+
+
+@pytest.fixture
+def sheets_backend(sheets_client):
+    from benchmarks.run import SHEET_ID, SHEET_ID_MAQUINAS
+
+    return SheetsBackend(client=sheets_client, sheet_id=SHEET_ID, sheet_id_maquinas=SHEET_ID_MAQUINAS)
@@ -0,0 +1,87 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from bicopack.api import IngestService, make_server
+from bicopack.core import SHEET_EN_CURSO, SHEET_PRODUCCION
+
+from tests.conftest import FlakyBackend
+
+
+@pytest.fixture
+def backend(sqlite_backend):
+    return FlakyBackend(sqlite_backend)
+
+
+@pytest.fixture
+def service(backend):
+    return IngestService(backend)
+
+
+@pytest.fixture
+def post(service):
+    server = make_server(service, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def send(path: str, body) -> tuple:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_port}{path}",
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    yield send
+    server.shutdown()
+    server.server_close()
+
+
+START = {"fecha": "2024-01-05", "turno": "1", "maquina": 3, "tipo_produccion": "Saco",
+         "hora_inicio": "08:00", "operario": "ana", "bobina_id": "b1"}
+
+
+def test_start_and_close(post, sqlite_backend):
+    assert post("/inicios", START)[0] == 201
+    # Un reintento del mismo inicio no abre otra producción
+    assert post("/inicios", START) == (201, {"ok": True, "bobina_id": "b1", "duplicado": True})
+
+    status, body = post("/cierres", {"bobina_id": "b1", "hora_fin": "09:00", "operario": "ana", "peso": 10})
+    assert (status, body["ok"]) == (201, True)
+    assert sqlite_backend.get_all(SHEET_EN_CURSO).empty
+    assert len(sqlite_backend.get_all(SHEET_PRODUCCION)) == 1
+    assert post("/cierres", {"bobina_id": "b1", "hora_fin": "09:05"})[0] == 409
+
+
+def test_event_without_times_is_rejected(post):
+    status, body = post("/eventos", {"fecha": "2024-01-05", "tipo": "Incidencia", "maquina": 3})
+    assert status == 422
+    assert not body["ok"]
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/inicios", START),
+    ("/cierres", {"bobina_id": "b1", "hora_fin": "09:00"}),
+    ("/eventos", {"fecha": "2024-01-05", "tipo": "Incidencia", "maquina": 3,
+                  "hora_inicio": "08:00", "hora_fin": "08:10"}),
+])
+def test_storage_read_error_is_a_503(post, backend, path, body):
+    backend.failing.update({"get_all", "get_many"})
+    status, answer = post(path, body)
+    assert status == 503
+    assert answer["ok"] is False and "no disponible" in answer["error"]
+
+
+def test_storage_read_error_in_a_list_is_reported_per_record(post, backend):
+    backend.failing.update({"get_all", "get_many"})
+    status, answer = post("/inicios", [START, dict(START, bobina_id="b2", maquina=4)])
+    assert status == 200
+    assert answer["guardados"] == 0
+    assert all("no disponible" in r["error"] for r in answer["resultados"])
@@ -0,0 +1,114 @@
+import pytest
+
+from bicopack.archive import UNDATED, Archive, archive_table, read_range
+from bicopack.core import EVENTOS_COLS, PRODUCCION_COLS, SHEET_EVENTOS, SHEET_PRODUCCION, TableChangedError
+from bicopack.schema import apply_schema
+
+from tests.conftest import produccion_row
+
+BEFORE = "2024-03-01"
+
+
+def evento_row(fecha: str, descripcion: str = "atasco") -> list:
+    values = {"fecha": fecha, "turno": "1", "maquina": 1, "tipo": "Incidencia",
+              "hora_inicio": "08:00", "descripcion": descripcion}
+    return [values.get(c, "") for c in EVENTOS_COLS]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return Archive(str(tmp_path / "archivo"))
+
+
+@pytest.fixture
+def eventos(sqlite_backend):
+    sqlite_backend.append_rows(SHEET_EVENTOS, [
+        evento_row("2024-01-10"),
+        evento_row("2024-01-10"),
+        evento_row(""),
+        evento_row("2024-02-03"),
+        evento_row("2024-03-05"),
+        # Old, but after a recent row: it waits for the next run
+        evento_row("2024-02-20"),
+    ])
+    return sqlite_backend
+
+
+def _fechas(frame) -> list[str]:
+    return frame["fecha"].dt.strftime("%Y-%m-%d").fillna("").tolist()
+
+
+def test_archive_moves_the_old_block_at_the_top_into_monthly_files(eventos, archive):
+    assert archive_table(eventos, archive, SHEET_EVENTOS, BEFORE) == 4
+
+    assert archive.partitions(SHEET_EVENTOS) == ["2024-01", "2024-02", UNDATED]
+    # Identical rows are both archived
+    assert _fechas(archive.read(SHEET_EVENTOS)) == ["2024-01-10", "2024-01-10", "2024-02-03", ""]
+    assert eventos.get_all(SHEET_EVENTOS)["fecha"].tolist() == ["2024-03-05", "2024-02-20"]
+
+
+def test_dry_run_only_counts(eventos, archive):
+    assert archive_table(eventos, archive, SHEET_EVENTOS, BEFORE, dry_run=True) == 4
+
+    assert archive.partitions(SHEET_EVENTOS) == []
+    assert eventos.count(SHEET_EVENTOS) == 6
+
+
+def test_a_job_interrupted_before_the_delete_can_run_again(eventos, archive):
+    # First run wrote the files and stopped before deleting from the sheet
+    archive.write(SHEET_EVENTOS, eventos.get_all(SHEET_EVENTOS).head(4))
+
+    assert archive_table(eventos, archive, SHEET_EVENTOS, BEFORE) == 4
+    assert len(archive.read(SHEET_EVENTOS)) == 4
+    assert eventos.count(SHEET_EVENTOS) == 2
+
+
+class StaleReadBackend:
+    """Serve ``get_all`` from before another writer changed the first row."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def get_all(self, table):
+        frame = self.inner.get_all(table)
+        frame.loc[0, "descripcion"] = "leída antes del cambio"
+        return frame
+
+    def delete_first_rows(self, table, rows):
+        return self.inner.delete_first_rows(table, rows)
+
+
+def test_rows_changed_since_the_read_are_not_deleted(eventos, archive):
+    with pytest.raises(TableChangedError):
+        archive_table(StaleReadBackend(eventos), archive, SHEET_EVENTOS, BEFORE)
+
+    assert eventos.count(SHEET_EVENTOS) == 6
+
+
+def test_read_range_merges_the_archive_and_the_hot_rows(eventos, archive):
+    archive_table(eventos, archive, SHEET_EVENTOS, BEFORE)
+    hot = apply_schema(SHEET_EVENTOS, eventos.get_all(SHEET_EVENTOS))
+
+    merged = read_range(SHEET_EVENTOS, hot, archive, since="2024-02-01", until="2024-03-31")
+    assert _fechas(merged) == ["2024-02-03", "2024-03-05", "2024-02-20"]
+
+    # Rows without a date only come back when no bound is given
+    assert len(read_range(SHEET_EVENTOS, hot, archive)) == 6
+    assert _fechas(read_range(SHEET_EVENTOS, hot, None, since="2024-01-01")) == ["2024-03-05", "2024-02-20"]
+
+
+def test_produccion_rows_are_placed_by_their_end_date(sqlite_backend, archive):
+    row = produccion_row()
+    # Started in January, ended in February
+    row[PRODUCCION_COLS.index("fecha_fin")] = "2024-02-01"
+    sqlite_backend.append_rows(SHEET_PRODUCCION, [row])
+
+    assert archive_table(sqlite_backend, archive, SHEET_PRODUCCION, BEFORE) == 1
+    assert archive.partitions(SHEET_PRODUCCION) == ["2024-02"]
+
+
+def test_sheets_archive_deletes_the_block_in_the_sheet(sheets_backend, archive):
+    sheets_backend.append_rows(SHEET_EVENTOS, [evento_row("2024-01-10"), evento_row("2024-03-05")])
+
+    assert archive_table(sheets_backend, archive, SHEET_EVENTOS, BEFORE) == 1
+    assert sheets_backend.get_all(SHEET_EVENTOS)["fecha"].tolist() == ["2024-03-05"]
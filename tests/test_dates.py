@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from bicopack.core import compute_minutes, event_datetime_from_row
+from bicopack.dates import combine_fecha_hora, filter_last_hours_events, span_minutes
+
+FECHAS = ["2024-01-05", "2024-03-31", "2024-10-27", "", "2024-13-01", "05/01/2024", " 2024-01-05 "]
+HORAS = ["08:00", "7:5", "02:30", "23:59", "", "24:00", "8:60", "ab", " 06:15 ", "00:00"]
+
+
+def _grid():
+    return pd.DataFrame([(f, h) for f in FECHAS for h in HORAS], columns=["fecha", "hora_inicio"])
+
+
+def test_combine_fecha_hora_matches_the_row_by_row_parser():
+    grid = _grid()
+    vectorized = combine_fecha_hora(grid["fecha"], grid["hora_inicio"])
+    for (_, row), value in zip(grid.iterrows(), vectorized):
+        expected = event_datetime_from_row(row)
+        if expected is None:
+            assert pd.isna(value), dict(row)
+        else:
+            assert value == pd.Timestamp(expected), dict(row)
+
+
+@pytest.mark.parametrize("fecha", ["2024-01-05", "2024-03-30", "2024-03-31", "2024-10-26", "2024-10-27"])
+def test_span_minutes_matches_compute_minutes(fecha):
+    pairs = [(a, b) for a in HORAS for b in HORAS]
+    ini = pd.Series([a for a, _ in pairs])
+    fin = pd.Series([b for _, b in pairs])
+    vectorized = span_minutes(pd.Series([fecha] * len(pairs)), ini, fin)
+    day = datetime.strptime(fecha, "%Y-%m-%d").date()
+    for (a, b), value in zip(pairs, vectorized):
+        expected = compute_minutes(day, a, b)
+        assert (None if pd.isna(value) else int(value)) == (expected if expected != "" else None), (a, b)
+
+
+def test_filter_last_hours_events_keeps_recent_rows_only():
+    now = pd.Timestamp.now(tz="Europe/Madrid")
+    recent = now - pd.Timedelta(hours=2)
+    old = now - pd.Timedelta(hours=30)
+    df = pd.DataFrame({
+        "fecha": [recent.strftime("%Y-%m-%d"), old.strftime("%Y-%m-%d"), "", recent.strftime("%Y-%m-%d")],
+        "hora_inicio": [recent.strftime("%H:%M"), old.strftime("%H:%M"), "08:00", "xx"],
+    })
+    assert filter_last_hours_events(df).index.tolist() == [0]
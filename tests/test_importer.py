@@ -0,0 +1,96 @@
+import pytest
+
+from bicopack.core import SHEET_PRODUCCION
+from bicopack.importer import ImportJob
+from bicopack.storage import WriteBehindBackend
+
+HEADER = "Fecha de inicio;Turno;Nº máquina;Tipo producción;Hora inicio;Operario inicio;Hora fin;Operario fin;Peso"
+
+
+@pytest.fixture
+def source(tmp_path):
+    lines = [HEADER]
+    for i in range(12):
+        # Una fila de cada tres tiene una máquina que no existe
+        maquina = 0 if i % 3 == 0 else 1 + i % 21
+        lines.append(f"2024-02-{1 + i:02d};1;{maquina};Saco;08:00;ana;09:00;ana;{i}")
+    path = tmp_path / "produccion.csv"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+class InterruptedBackend:
+    """Fail the ``fail_at``-th ``append_rows``, after writing it if ``written``."""
+
+    def __init__(self, inner, fail_at: int, written: bool):
+        self.inner = inner
+        self.fail_at = fail_at
+        self.written = written
+        self.appends = 0
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def append_rows(self, table, rows, keys=None):
+        self.appends += 1
+        if self.appends == self.fail_at:
+            if self.written:
+                self.inner.append_rows(table, rows, keys)
+            raise ConnectionError("corte durante la escritura")
+        return self.inner.append_rows(table, rows, keys)
+
+
+def rejected_lines(job: ImportJob) -> list:
+    with open(job.rejected_path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_import_writes_valid_rows_and_reports_the_rest(sqlite_backend, source):
+    job = ImportJob(sqlite_backend, SHEET_PRODUCCION, source, chunk_rows=5)
+    state = job.run()
+
+    assert state.finished
+    assert (state.written, state.rejected) == (8, 4)
+    assert len(sqlite_backend.get_all(SHEET_PRODUCCION)) == 8
+    assert len(rejected_lines(job)) == 1 + 4
+
+
+@pytest.mark.parametrize("written", [False, True])
+def test_resumed_import_writes_and_reports_each_row_once(sqlite_backend, source, written):
+    backend = InterruptedBackend(sqlite_backend, fail_at=2, written=written)
+    with pytest.raises(ConnectionError):
+        ImportJob(backend, SHEET_PRODUCCION, source, chunk_rows=5).run()
+
+    job = ImportJob(sqlite_backend, SHEET_PRODUCCION, source, chunk_rows=5)
+    state = job.run()
+    assert state.finished
+    assert (state.written, state.rejected) == (8, 4)
+    assert len(sqlite_backend.get_all(SHEET_PRODUCCION)) == 8
+    assert len(rejected_lines(job)) == 1 + 4
+
+
+class RecordingKpis:
+    def __init__(self):
+        self.rows = []
+
+    def add_rows(self, table, rows):
+        self.rows.extend(rows)
+
+
+def test_identical_history_rows_are_not_taken_for_a_double_click(sqlite_backend, outbox, tmp_path):
+    path = tmp_path / "repetidas.csv"
+    row = "2024-02-01;1;3;Saco;08:00;ana;09:00;ana;7"
+    path.write_text("\n".join([HEADER, row, row]) + "\n", encoding="utf-8")
+    backend = WriteBehindBackend(sqlite_backend, outbox, start=False)
+    kpis = RecordingKpis()
+
+    state = ImportJob(backend, SHEET_PRODUCCION, str(path), kpis=kpis).run()
+    assert state.written == 2
+    assert outbox.stats()["pending"] == 2
+    assert len(kpis.rows) == 2
+
+    # The same file imported again from scratch: every key is already queued
+    state = ImportJob(backend, SHEET_PRODUCCION, str(path), kpis=kpis, restart=True).run()
+    assert state.written == 0
+    assert outbox.stats()["pending"] == 2
+    assert len(kpis.rows) == 2
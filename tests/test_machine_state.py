@@ -0,0 +1,111 @@
+import pytest
+
+from bicopack.cache import TableCache
+from bicopack.core import EVENTOS_COLS, SHEET_EN_CURSO, SHEET_EVENTOS, SHEET_MAQUINAS
+from bicopack.machine_state import MachineStateIndex
+
+from tests.conftest import en_curso_row
+
+
+def evento_row(maquina, hora_inicio: str, tipo: str = "Incidencia") -> list:
+    values = {"fecha": "2024-01-05", "turno": "1", "maquina": maquina, "tipo": tipo,
+              "hora_inicio": hora_inicio, "hora_fin": "", "operario": "ana"}
+    return [values.get(c, "") for c in EVENTOS_COLS]
+
+
+@pytest.fixture
+def cache(sqlite_backend):
+    sqlite_backend.upsert_maquinas([[1, "Saco", "OF-1", "MP-1", "L1", "Norte"],
+                                    [2, "Bobina cruzada", "OF-2", "MP-2", "L2", "Sur"]])
+    # Two runs open on one machine, as rows started before the occupancy check
+    sqlite_backend.append_rows(SHEET_EN_CURSO, [en_curso_row("b-1", maquina=1), en_curso_row("b-2", maquina=1)])
+    sqlite_backend.append_rows(SHEET_EVENTOS, [evento_row(1, "08:00"), evento_row(1, "09:00", "Limpieza"),
+                                               evento_row(2, "10:00")])
+    return TableCache(sqlite_backend, ttl=3600)
+
+
+def test_sync_builds_config_open_runs_and_last_event_per_machine(cache):
+    index = MachineStateIndex().sync(cache)
+
+    uno = index.get(1)
+    assert uno.config_value("lote_of") == "OF-1"
+    assert [r["bobina_id"] for r in uno.open_runs] == ["b-1", "b-2"]
+    assert uno.open_run["bobina_id"] == "b-1" and uno.busy
+    assert uno.last_event["tipo"] == "Limpieza"
+
+    dos = index.get(2)
+    assert dos.config_value("tipo_produccion") == "Bobina cruzada"
+    assert not dos.busy and dos.open_run is None
+
+    assert index.registry.plant_of(2) == "Sur"
+    assert index.get(9).config is None and index.get(9).config_value("lote_of") == ""
+
+
+def test_first_maquinas_row_of_a_machine_wins(sqlite_backend):
+    sqlite_backend.append_rows(SHEET_MAQUINAS, [[3, "Saco", "OF-A", "", "", ""], [3, "Saco", "OF-B", "", "", ""]])
+    index = MachineStateIndex().sync(TableCache(sqlite_backend, ttl=3600))
+
+    assert index.get(3).config_value("lote_of") == "OF-A"
+
+
+def test_machines_that_are_not_numbers_are_dropped(cache, sqlite_backend):
+    sqlite_backend.append_row(SHEET_EN_CURSO, en_curso_row("b-x", maquina="sin número"))
+    index = MachineStateIndex().sync(cache)
+
+    assert sorted(index._open_runs) == [1]
+    assert "b-x" in index._bobinas
+
+
+def test_patches_with_the_cache_version_update_the_index_in_place(cache):
+    index = MachineStateIndex().sync(cache)
+
+    row = en_curso_row("b-3", maquina=2)
+    index.apply_append(SHEET_EN_CURSO, row, cache.apply_append(SHEET_EN_CURSO, row))
+    assert index.get(2).open_run["bobina_id"] == "b-3"
+
+    index.apply_delete_bobina("b-1", cache.apply_delete_bobina("b-1"))
+    assert [r["bobina_id"] for r in index.get(1).open_runs] == ["b-2"]
+
+    row = evento_row(2, "11:00", "Limpieza")
+    index.apply_append(SHEET_EVENTOS, row, cache.apply_append(SHEET_EVENTOS, row))
+    assert index.get(2).last_event["hora_inicio"] == "11:00"
+
+    rows = [[4, "Saco", "OF-4", "", "L1", "Norte"]]
+    index.apply_maquinas(rows, cache.apply_maquinas(rows))
+    assert index.get(4).config_value("lote_of") == "OF-4"
+    assert 4 in index.registry
+
+    # Everything was kept in step, so a sync has nothing to rebuild
+    snapshot = index._open_runs
+    index.sync(cache)
+    assert index._open_runs is snapshot
+
+
+def test_a_patch_out_of_step_leaves_the_part_for_the_next_sync(cache):
+    index = MachineStateIndex().sync(cache)
+
+    # A write the index never saw moves the cache two versions ahead
+    cache.apply_append(SHEET_EN_CURSO, en_curso_row("b-3", maquina=2))
+    row = en_curso_row("b-4", maquina=2)
+    index.apply_append(SHEET_EN_CURSO, row, cache.apply_append(SHEET_EN_CURSO, row))
+    assert not index.get(2).busy
+
+    index.sync(cache)
+    assert [r["bobina_id"] for r in index.get(2).open_runs] == ["b-3", "b-4"]
+
+
+def test_patches_to_a_table_that_is_not_cached_are_ignored(sqlite_backend):
+    cache = TableCache(sqlite_backend, ttl=3600)
+    index = MachineStateIndex()
+
+    row = en_curso_row("b-1")
+    index.apply_append(SHEET_EN_CURSO, row, cache.apply_append(SHEET_EN_CURSO, row))
+    assert not index.get(1).busy
+
+
+def test_sync_loads_only_the_tables_asked_for(cache):
+    index = MachineStateIndex().sync(cache, tables=(SHEET_MAQUINAS,))
+
+    assert index.get(1).config_value("lote_of") == "OF-1"
+    assert index.get(1).last_event is None
+    assert cache.version(SHEET_EVENTOS) == 0
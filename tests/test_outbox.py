@@ -0,0 +1,127 @@
+from bicopack.core import SHEET_EN_CURSO, SHEET_EVENTOS, SHEET_PRODUCCION
+from bicopack.outbox import MAX_CLOSE_ATTEMPTS, OutboxFlusher
+
+from tests.conftest import FlakyBackend, en_curso_row, expire_leases, produccion_row
+
+
+def test_appends_of_a_sheet_are_sent_in_one_call(outbox, sqlite_backend):
+    backend = FlakyBackend(sqlite_backend)
+    for maquina in (1, 2, 3):
+        outbox.enqueue_append(SHEET_EVENTOS, ["2024-01-05", "1", maquina])
+
+    assert outbox.flush(backend) == 3
+    assert backend.calls.count("append_rows") == 1
+    assert sqlite_backend.get_all(SHEET_EVENTOS)["maquina"].tolist() == [1, 2, 3]
+    assert outbox.stats()["pending"] == 0
+
+
+def test_double_click_and_repeated_key_are_queued_once(outbox):
+    row = ["2024-01-05", "1", 4]
+    assert outbox.enqueue_append(SHEET_EVENTOS, row)
+    assert not outbox.enqueue_append(SHEET_EVENTOS, list(row))
+    assert outbox.enqueue_append(SHEET_EVENTOS, ["2024-01-05", "2", 4], key="k1")
+    assert not outbox.enqueue_append(SHEET_EVENTOS, ["2024-01-05", "3", 4], key="k1")
+    assert outbox.stats()["pending"] == 2
+
+
+def test_retry_does_not_duplicate_a_row_that_reached_the_backend(outbox, sqlite_backend):
+    backend = FlakyBackend(sqlite_backend)
+    outbox.enqueue_append(SHEET_EVENTOS, ["2024-01-05", "1", 5])
+    # The first attempt timed out after the row was written
+    sqlite_backend.append_rows(SHEET_EVENTOS, [["2024-01-05", "1", 5]])
+    backend.failing.add("append_rows")
+    assert outbox.flush(backend) == 0
+
+    backend.failing.clear()
+    expire_leases(outbox)
+    assert outbox.flush(backend) == 1
+    assert len(sqlite_backend.get_all(SHEET_EVENTOS)) == 1
+
+
+def test_close_waits_for_the_append_of_its_production(outbox, sqlite_backend):
+    backend = FlakyBackend(sqlite_backend)
+    outbox.enqueue_append(SHEET_EN_CURSO, en_curso_row("b1"))
+    backend.failing.add("append_rows")
+    assert outbox.flush(backend) == 0
+
+    # The start is in backoff when the close is queued: the close must not
+    # be sent (and dropped) before the production reaches EN_CURSO
+    outbox.enqueue_close("b1", produccion_row())
+    outbox.enqueue_delete_bobina("b1")
+    assert outbox.flush(backend) == 0
+    assert "close_production" not in backend.calls
+    assert "delete_row_by_bobina" not in backend.calls
+    assert outbox.stats()["pending"] == 3
+
+    backend.failing.clear()
+    expire_leases(outbox)
+    assert outbox.flush(backend) == 3
+    assert len(sqlite_backend.get_all(SHEET_PRODUCCION)) == 1
+    assert sqlite_backend.get_all(SHEET_EN_CURSO).empty
+    assert outbox.stats()["pending"] == 0
+
+
+def test_close_of_a_production_that_never_opened_stays_queued(outbox, sqlite_backend):
+    outbox.enqueue_close("b2", produccion_row())
+    assert outbox.flush(sqlite_backend) == 0
+    expire_leases(outbox)
+    assert outbox.flush(sqlite_backend) == 0
+
+    stats = outbox.stats()
+    assert stats["pending"] == 1
+    assert "b2" in stats["last_error"]
+
+
+def test_close_of_a_production_closed_elsewhere_becomes_a_conflict(outbox, sqlite_backend):
+    sqlite_backend.start_production(en_curso_row("b5"))
+    outbox.enqueue_close("b5", produccion_row(peso=4))
+    # Another session closed it first, with its own weight
+    sqlite_backend.close_production("b5", produccion_row(peso=9))
+
+    for _ in range(MAX_CLOSE_ATTEMPTS):
+        assert outbox.flush(sqlite_backend) == 0
+        expire_leases(outbox)
+
+    stats = outbox.stats()
+    assert (stats["pending"], stats["conflicts"]) == (0, 1)
+    assert [e.payload["bobina_id"] for e in outbox.conflicts()] == ["b5"]
+    assert outbox.flush(sqlite_backend) == 0
+    assert outbox.overlay(SHEET_PRODUCCION, sqlite_backend.get_all(SHEET_PRODUCCION))["peso"].tolist() == [9]
+
+
+def test_retried_close_that_went_through_is_marked_flushed(outbox, sqlite_backend):
+    backend = FlakyBackend(sqlite_backend)
+    sqlite_backend.start_production(en_curso_row("b3"))
+    outbox.enqueue_close("b3", produccion_row(peso=7))
+    backend.failing.add("close_production")
+    assert outbox.flush(backend) == 0
+
+    # The previous attempt reached the backend before the error
+    sqlite_backend.close_production("b3", produccion_row(peso=7))
+    backend.failing.clear()
+    expire_leases(outbox)
+    assert outbox.flush(backend) == 1
+    assert len(sqlite_backend.get_all(SHEET_PRODUCCION)) == 1
+    assert outbox.stats()["pending"] == 0
+
+
+def test_overlay_shows_queued_writes(outbox, sqlite_backend):
+    sqlite_backend.start_production(en_curso_row("b4"))
+    outbox.enqueue_append(SHEET_EN_CURSO, en_curso_row("b5", maquina=2))
+    outbox.enqueue_close("b4", produccion_row())
+
+    en_curso = outbox.overlay(SHEET_EN_CURSO, sqlite_backend.get_all(SHEET_EN_CURSO))
+    produccion = outbox.overlay(SHEET_PRODUCCION, sqlite_backend.get_all(SHEET_PRODUCCION))
+    assert en_curso["bobina_id"].tolist() == ["b5"]
+    assert len(produccion) == 1
+
+
+def test_flusher_stops_and_joins(outbox, sqlite_backend):
+    flusher = OutboxFlusher(outbox, sqlite_backend, interval=0.05, linger=0)
+    flusher.start()
+    outbox.enqueue_append(SHEET_EVENTOS, ["2024-01-05", "1", 6])
+    flusher.wake()
+
+    flusher.stop()
+    flusher.join(2)
+    assert not flusher.is_alive()
@@ -0,0 +1,60 @@
+import pandas as pd
+
+from bicopack.core import PRODUCCION_COLS, SHEET_MAQUINAS, SHEET_PRODUCCION, safe_float
+from bicopack.schema import MAQUINA_DESCONOCIDA, apply_schema, concat_typed, empty_table, to_float, to_int
+
+RAW = ["3", " 12 ", "4.9", "", "x", "-2", "1e3", "7,5"]
+
+
+def _raw_produccion(rows):
+    """PRODUCCION as the sheet hands it over: every cell a string."""
+    width = len(PRODUCCION_COLS)
+    return pd.DataFrame([([str(v) for v in row] + [""] * width)[:width] for row in rows], columns=PRODUCCION_COLS)
+
+
+def test_numbers_are_converted_like_the_scalar_helpers():
+    values = pd.Series(RAW, dtype=object)
+    ints = to_int(values)
+    floats = to_float(values)
+
+    assert [None if pd.isna(v) else v for v in floats] == [safe_float(v) for v in RAW]
+    # Decimals truncated, as safe_int does with the numbers get_all_records returned
+    assert str(ints.dtype) == "Int64"
+    assert [None if pd.isna(v) else int(v) for v in ints] == [3, 12, 4, None, None, -2, 1000, 7]
+
+
+def test_raw_sheet_rows_get_their_declared_types():
+    row = dict.fromkeys(PRODUCCION_COLS, "")
+    row.update(fecha_inicio="2024-01-05", turno="1", maquina="7", tipo_produccion="Saco", peso="12,5", taras="2")
+    typed = apply_schema(SHEET_PRODUCCION, _raw_produccion([row.values(), dict(row, maquina="?").values()]))
+
+    assert typed["fecha_inicio"].tolist()[0] == pd.Timestamp("2024-01-05")
+    assert pd.isna(typed["fecha_fin"]).all()
+    assert isinstance(typed["turno"].dtype, pd.CategoricalDtype)
+    assert typed["peso"].tolist() == [12.5, 12.5]
+    assert typed["maquina_norm"].tolist() == [7, MAQUINA_DESCONOCIDA]
+    assert typed["maquina_norm"].dtype == "int64"
+
+
+def test_applying_the_schema_twice_keeps_the_types():
+    once = apply_schema(SHEET_PRODUCCION, _raw_produccion([["2024-01-05", "", "1", "7"]]))
+    twice = apply_schema(SHEET_PRODUCCION, once)
+
+    assert once.dtypes.to_dict() == twice.dtypes.to_dict()
+    pd.testing.assert_frame_equal(once, twice)
+
+
+def test_missing_columns_and_frames_are_filled_with_typed_empties():
+    maquinas = apply_schema(SHEET_MAQUINAS, pd.DataFrame({"maquina": ["4"]}))
+
+    assert maquinas["planta"].tolist() == [""]
+    assert list(empty_table(SHEET_MAQUINAS).columns) == list(maquinas.columns)
+
+
+def test_concat_keeps_categorical_columns():
+    a = apply_schema(SHEET_PRODUCCION, _raw_produccion([["2024-01-05", "", "1"]]))
+    b = apply_schema(SHEET_PRODUCCION, _raw_produccion([["2024-01-05", "", "3"]]))
+    both = concat_typed(SHEET_PRODUCCION, [a, b])
+
+    assert isinstance(both["turno"].dtype, pd.CategoricalDtype)
+    assert both["turno"].tolist() == ["1", "3"]
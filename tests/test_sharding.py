@@ -0,0 +1,77 @@
+import pytest
+
+from bicopack.core import SHEET_EN_CURSO, SHEET_EVENTOS, SHEET_MAQUINAS, SHEET_PLANAS_TURNO, SHEET_PRODUCCION
+from bicopack.storage import MirroredBackend, ShardedBackend, SQLiteBackend
+
+from tests.conftest import en_curso_row, produccion_row
+
+SUR = 40
+SUR_ROW = [SUR, "Saco", "", "", "L2", "Sur"]
+
+
+@pytest.fixture
+def home(tmp_path):
+    return SQLiteBackend(str(tmp_path / "home.db"))
+
+
+@pytest.fixture
+def sur(tmp_path):
+    return SQLiteBackend(str(tmp_path / "sur.db"))
+
+
+@pytest.fixture
+def sharded(home, sur):
+    backend = ShardedBackend(home, {"Sur": sur})
+    backend.upsert_maquinas([SUR_ROW])
+    return backend
+
+
+def test_rows_go_to_the_engine_of_their_plant(sharded, home, sur):
+    sharded.append_rows(SHEET_PRODUCCION, [produccion_row(1), produccion_row(SUR), produccion_row(2)])
+    sharded.start_production(en_curso_row("b-sur", maquina=SUR))
+
+    assert home.get_all(SHEET_PRODUCCION)["maquina"].tolist() == [1, 2]
+    assert sur.get_all(SHEET_PRODUCCION)["maquina"].tolist() == [SUR]
+    assert sur.count(SHEET_EN_CURSO) == 1 and home.count(SHEET_EN_CURSO) == 0
+    assert sur.count(SHEET_MAQUINAS) == 0
+
+
+def test_reads_return_home_rows_then_each_plant(sharded):
+    sharded.append_rows(SHEET_PRODUCCION, [produccion_row(SUR), produccion_row(1)])
+
+    assert sharded.get_all(SHEET_PRODUCCION)["maquina"].tolist() == [1, SUR]
+    assert sharded.count(SHEET_PRODUCCION) == 2
+    assert sharded.count(SHEET_MAQUINAS) == 1
+
+
+def test_delete_first_rows_splits_the_block_by_engine(sharded, home, sur):
+    sharded.append_rows(SHEET_PRODUCCION, [produccion_row(1), produccion_row(SUR), produccion_row(2, peso=3)])
+    block = sharded.get_all(SHEET_PRODUCCION).head(2).values.tolist()
+
+    # The block is home's two rows: the plant keeps its own
+    assert sharded.delete_first_rows(SHEET_PRODUCCION, block) == 2
+    assert home.count(SHEET_PRODUCCION) == 0
+    assert sur.count(SHEET_PRODUCCION) == 1
+
+
+def test_a_machine_moved_to_a_plant_routes_there_after_the_upsert(sharded, sur):
+    sharded.append_row(SHEET_EVENTOS, ["2024-01-05", "1", 3])
+    sharded.upsert_maquinas([[3, "Saco", "", "", "L2", "Sur"]])
+    sharded.append_row(SHEET_EVENTOS, ["2024-01-05", "2", 3])
+
+    assert sur.get_all(SHEET_EVENTOS)["turno"].astype(str).tolist() == ["2"]
+
+
+def test_mirrored_sharded_primary_is_seeded_by_plant(tmp_path, home, sur):
+    mirror = SQLiteBackend(str(tmp_path / "mirror.db"))
+    mirror.upsert_maquinas([SUR_ROW])
+    mirror.append_rows(SHEET_PRODUCCION, [produccion_row(1), produccion_row(SUR)])
+    mirror.append_rows(SHEET_PLANAS_TURNO, [["2024-01-05", "1", "L-7"]])
+
+    backend = MirroredBackend(ShardedBackend(home, {"Sur": sur}), mirror)
+
+    assert home.get_all(SHEET_MAQUINAS)["planta"].tolist() == ["Sur"]
+    assert home.get_all(SHEET_PRODUCCION)["maquina"].tolist() == [1]
+    assert sur.get_all(SHEET_PRODUCCION)["maquina"].tolist() == [SUR]
+    assert home.count(SHEET_PLANAS_TURNO) == 1 and sur.count(SHEET_PLANAS_TURNO) == 0
+    assert backend.get_all(SHEET_PRODUCCION)["maquina"].tolist() == [1, SUR]
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from bicopack.core import PRODUCCION_COLS, SHEET_PRODUCCION
+from bicopack.shared_cache import SharedCacheRefresher, SharedStore
+
+from tests.conftest import produccion_row
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SharedStore(str(tmp_path / "shared.db"))
+
+
+def _frame(*maquinas):
+    return pd.DataFrame([produccion_row(m) for m in maquinas], columns=PRODUCCION_COLS)
+
+
+def _mark_first_row(store):
+    """Change the stored copy of the first row behind the store's back."""
+    store._conn.execute(
+        "UPDATE rows SET data = json_set(data, ?, 'marca') WHERE tbl = ? AND pos = 0",
+        (f"$[{PRODUCCION_COLS.index('maquina')}]", SHEET_PRODUCCION),
+    )
+
+
+def _maquinas(store):
+    return store.read(SHEET_PRODUCCION)[1]["maquina"].astype(str).tolist()
+
+
+def test_store_inserts_only_the_rows_added_at_the_end(store):
+    store.store(SHEET_PRODUCCION, _frame(1, 2))
+    _mark_first_row(store)
+
+    assert store.store(SHEET_PRODUCCION, _frame(1, 2, 3))
+    assert _maquinas(store) == ["marca", "2", "3"]
+    assert store.snapshot(SHEET_PRODUCCION).version == 2
+
+
+def test_store_rewrites_a_table_whose_rows_changed(store):
+    store.store(SHEET_PRODUCCION, _frame(1, 2))
+    _mark_first_row(store)
+
+    store.store(SHEET_PRODUCCION, _frame(2, 3))
+    assert _maquinas(store) == ["2", "3"]
+
+
+def test_store_rewrites_a_table_that_shrank(store):
+    store.store(SHEET_PRODUCCION, _frame(1, 2, 3))
+    _mark_first_row(store)
+
+    store.store(SHEET_PRODUCCION, _frame(1, 2))
+    assert _maquinas(store) == ["1", "2"]
+    assert store.snapshot(SHEET_PRODUCCION).row_count == 2
+
+
+def test_store_keeps_the_version_of_unchanged_content(store):
+    store.store(SHEET_PRODUCCION, _frame(1, 2))
+    store.store(SHEET_PRODUCCION, _frame(1, 2))
+
+    assert store.snapshot(SHEET_PRODUCCION).version == 1
+
+
+def test_store_skips_a_refresh_older_than_a_worker_write(store):
+    store.store(SHEET_PRODUCCION, _frame(1))
+    version = store.snapshot(SHEET_PRODUCCION).version
+    store.append(SHEET_PRODUCCION, [produccion_row(2)])
+
+    assert not store.store(SHEET_PRODUCCION, _frame(1), expected_version=version)
+    assert _maquinas(store) == ["1", "2"]
+
+
+def test_refresher_stops_and_joins(store, sqlite_backend):
+    refresher = SharedCacheRefresher(store, sqlite_backend, tables=[SHEET_PRODUCCION], interval=0.05)
+    refresher.start()
+
+    refresher.stop()
+    refresher.join(2)
+    assert not refresher.is_alive()
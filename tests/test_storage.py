@@ -0,0 +1,173 @@
+import pytest
+
+from bicopack.core import (
+    SHEET_EN_CURSO,
+    SHEET_EVENTOS,
+    SHEET_MAQUINAS,
+    SHEET_PRODUCCION,
+    TABLE_COLUMNS,
+    BobinaNotFoundError,
+    MachineOccupiedError,
+)
+from bicopack.storage import SheetsBackend, WriteBehindBackend
+
+from tests.conftest import FlakyBackend, en_curso_row, produccion_row
+
+
+@pytest.fixture(params=["sqlite", "sheets"])
+def backend(request):
+    return request.getfixturevalue(f"{request.param}_backend")
+
+
+def test_close_moves_the_production_in_one_step(backend):
+    backend.start_production(en_curso_row("b1"))
+    backend.start_production(en_curso_row("b2", maquina=2))
+
+    backend.close_production("b1", produccion_row())
+    assert backend.get_all(SHEET_EN_CURSO)["bobina_id"].tolist() == ["b2"]
+    assert len(backend.get_all(SHEET_PRODUCCION)) == 1
+
+
+def test_second_close_fails_and_writes_nothing(backend):
+    backend.start_production(en_curso_row("b1"))
+    backend.close_production("b1", produccion_row())
+
+    with pytest.raises(BobinaNotFoundError):
+        backend.close_production("b1", produccion_row(peso=99))
+    assert len(backend.get_all(SHEET_PRODUCCION)) == 1
+
+
+def test_start_on_a_busy_machine_is_rejected(backend):
+    backend.start_production(en_curso_row("b1", maquina=3))
+    with pytest.raises(MachineOccupiedError):
+        backend.start_production(en_curso_row("b2", maquina=3))
+    assert backend.get_all(SHEET_EN_CURSO)["bobina_id"].tolist() == ["b1"]
+
+
+def test_sheets_close_is_a_single_request(sheets_backend, sheets_client):
+    sheets_backend.start_production(en_curso_row("b1"))
+    sheets_backend.get_all(SHEET_EN_CURSO)
+    sheets_client.counter.reset()
+
+    sheets_backend.close_production("b1", produccion_row())
+    assert sheets_client.counter.calls.get("batch_update") == 1
+
+
+@pytest.fixture
+def write_behind(sqlite_backend, outbox):
+    return WriteBehindBackend(FlakyBackend(sqlite_backend), outbox, start=False)
+
+
+def test_write_behind_close_of_an_unknown_bobina_fails_before_queueing(write_behind, outbox):
+    with pytest.raises(BobinaNotFoundError):
+        write_behind.close_production("nope", produccion_row())
+    assert not write_behind.delete_row_by_bobina("nope")
+    assert outbox.stats()["pending"] == 0
+
+
+def test_write_behind_second_close_fails(write_behind, sqlite_backend, outbox):
+    write_behind.start_production(en_curso_row("b1"))
+    write_behind.close_production("b1", produccion_row())
+    with pytest.raises(BobinaNotFoundError):
+        write_behind.close_production("b1", produccion_row(peso=3))
+    assert not write_behind.delete_row_by_bobina("b1")
+
+    outbox.flush(write_behind.inner)
+    assert sqlite_backend.get_all(SHEET_EN_CURSO).empty
+    assert len(sqlite_backend.get_all(SHEET_PRODUCCION)) == 1
+    assert outbox.stats()["pending"] == 0
+
+
+def test_write_behind_reports_rows_dropped_as_duplicates(write_behind, sqlite_backend):
+    row = ["2024-01-05", "1", 4, "", "Incidencia"]
+    assert write_behind.append_row(SHEET_EVENTOS, row)
+    assert not write_behind.append_row(SHEET_EVENTOS, list(row))
+
+    other = ["2024-01-05", "2", 4, "", "Incidencia"]
+    assert write_behind.append_rows(SHEET_EVENTOS, [list(row), other]) == [other]
+    assert sqlite_backend.append_rows(SHEET_EVENTOS, [row]) == [row]
+
+
+def test_sheets_upsert_adds_the_missing_maquinas_headers():
+    from benchmarks.run import SHEET_ID, SHEET_ID_MAQUINAS, fake_client
+
+    sheets = {t: [list(columns)] for t, columns in TABLE_COLUMNS.items()}
+    # Hoja antigua: sin linea ni planta, con una columna propia en la E y
+    # sin sitio para más columnas
+    sheets[SHEET_MAQUINAS] = [["maquina", "tipo_produccion", "lote_of", "lote_mp", "notas"], ["2", "Saco", "", "", "ok"]]
+    client = fake_client(sheets)
+    ws = client.open_by_key(SHEET_ID_MAQUINAS).worksheet(SHEET_MAQUINAS)
+    ws.col_count = 5
+    backend = SheetsBackend(client=client, sheet_id=SHEET_ID, sheet_id_maquinas=SHEET_ID_MAQUINAS)
+
+    backend.upsert_maquinas([[2, "Saco", "", "", "L1", "Norte"], [40, "", "", "", "L2", "Sur"]])
+    header, first = ws.get_all_values()[:2]
+    assert header == ["maquina", "tipo_produccion", "lote_of", "lote_mp", "notas", "linea", "planta"]
+    assert first[4] == "ok"
+    maquinas = backend.get_all(SHEET_MAQUINAS)
+    assert maquinas[["maquina", "linea", "planta"]].values.tolist() == [["2", "L1", "Norte"], ["40", "L2", "Sur"]]
+
+
+@pytest.fixture
+def incremental(sheets_client):
+    from benchmarks.run import SHEET_ID, SHEET_ID_MAQUINAS
+
+    return SheetsBackend(
+        client=sheets_client, sheet_id=SHEET_ID, sheet_id_maquinas=SHEET_ID_MAQUINAS,
+        incremental=True, full_sync_seconds=0,
+    )
+
+
+def _produccion_sheet(client):
+    from benchmarks.run import SHEET_ID
+
+    return client.open_by_key(SHEET_ID).worksheet(SHEET_PRODUCCION)
+
+
+def test_tail_sync_reads_only_the_rows_added_by_someone_else(incremental, sheets_client):
+    ws = _produccion_sheet(sheets_client)
+    ws.append_rows([produccion_row(1), produccion_row(2)])
+    incremental.get_all(SHEET_PRODUCCION)
+    state = incremental._tails[SHEET_PRODUCCION]
+
+    ws.append_rows([produccion_row(3)])
+    frame = incremental.get_all(SHEET_PRODUCCION)
+
+    assert incremental._tails[SHEET_PRODUCCION] is state
+    assert frame["maquina"].astype(str).tolist() == ["1", "2", "3"]
+
+
+@pytest.mark.parametrize("deleted", [2, 3], ids=["first-row", "last-row"])
+def test_tail_sync_reloads_a_sheet_that_shrank(incremental, sheets_client, deleted):
+    ws = _produccion_sheet(sheets_client)
+    ws.append_rows([produccion_row(1), produccion_row(2)])
+    incremental.get_all(SHEET_PRODUCCION)
+    state = incremental._tails[SHEET_PRODUCCION]
+
+    # Another process archived or removed a row
+    ws.delete_rows(deleted)
+    frame = incremental.get_all(SHEET_PRODUCCION)
+
+    assert incremental._tails[SHEET_PRODUCCION] is not state
+    assert frame["maquina"].astype(str).tolist() == ["2" if deleted == 2 else "1"]
+
+
+def test_sheets_close_repairs_a_row_deleted_by_another_writer_meanwhile(sheets_backend, sheets_client):
+    from benchmarks.run import SHEET_ID
+
+    for bobina_id in ("b1", "b2", "b3"):
+        sheets_backend.start_production(en_curso_row(bobina_id, maquina=int(bobina_id[1])))
+    spreadsheet = sheets_client.open_by_key(SHEET_ID)
+    batch_update = spreadsheet.batch_update
+
+    def other_writer_first(body):
+        # Another process closes b1 between the read-back and the batch
+        spreadsheet.batch_update = batch_update
+        spreadsheet.worksheet(SHEET_EN_CURSO)._delete(2, 2)
+        return batch_update(body)
+
+    spreadsheet.batch_update = other_writer_first
+    sheets_backend.close_production("b2", produccion_row(maquina=2))
+
+    assert sheets_backend.get_all(SHEET_EN_CURSO)["bobina_id"].tolist() == ["b3"]
+    assert len(sheets_backend.get_all(SHEET_PRODUCCION)) == 1
@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+HEAVY = ("bicopack.storage", "bicopack.archive", "bicopack.kpis", "bicopack.export", "bicopack.importer")
+
+
+def test_importing_ui_leaves_the_data_modules_for_later():
+    code = f"import sys, bicopack.ui; print([m for m in {HEAVY!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_live_panels_fall_back_to_the_timer_without_the_streamlit_internals(monkeypatch):
+    from bicopack import ui
+
+    class Runtime:
+        """A Streamlit runtime without ``_session_mgr``."""
+
+    monkeypatch.setattr(ui, "_rerun_unavailable", False)
+    monkeypatch.setattr(ui.runtime, "exists", lambda: True)
+    monkeypatch.setattr(ui.runtime, "get_instance", lambda: Runtime())
+
+    assert ui._rerun_session("sesion") is False
+    assert ui.live_every() == ui.KIOSK_SECONDS